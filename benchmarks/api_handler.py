@@ -0,0 +1,70 @@
+"""
+Microbenchmark of api_handler serializing lists of prompts.
+
+Usage:
+
+    python -m benchmarks.api_handler [--sizes 10 1000 100000]
+"""
+
+import argparse
+import time
+
+import attr
+
+from quicksilver.prompt import Prompt
+from quicksilver.utils.lambdafn import api_handler
+
+
+@attr.s
+class Context:
+    aws_request_id = attr.ib(default="benchmark")
+
+
+def make_prompts(count):
+    return [
+        Prompt(
+            prompt="A portrait of jairtrejo number %d" % i,
+            created_at=1672531200 + i,
+            used_at=1672617600 + i,
+        )
+        for i in range(count)
+    ]
+
+
+def measure(count, repeat):
+    prompts = make_prompts(count)
+
+    @api_handler
+    def handler():
+        return {"prompts": prompts, "next_cursor": None}
+
+    event = {"httpMethod": "GET", "resource": "/prompt"}
+    context = Context()
+
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        handler(event, context)
+        timings.append(time.perf_counter() - started_at)
+
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 1000, 100000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for count in args.sizes:
+        best = measure(count, args.repeat)
+        print(
+            "%8d items %10.3f ms %8.2f us/item"
+            % (count, best * 1000, best * 1e6 / count)
+        )
+
+
+if __name__ == "__main__":
+    main()
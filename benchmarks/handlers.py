@@ -0,0 +1,192 @@
+"""
+Latency and memory of the prompt handlers against a seeded local store.
+
+Seeds the store with synthetic prompts, half of them used this year, then
+calls each handler with a Lambda event. The handlers that render and publish
+pictures need Banana, S3 and Mastodon, so they're left out.
+
+Usage:
+
+    python -m benchmarks.handlers [--store sqlite] [--sizes 10000 100000]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+
+import attr
+import structlog
+
+import quicksilver
+from quicksilver import repository, stores
+from quicksilver.prompt import Prompt
+from quicksilver.utils import metrics
+
+SEED_BATCH = 10000
+
+
+@attr.s
+class Context:
+    aws_request_id = attr.ib(default="benchmark")
+
+
+def make_prompts(start, count, now):
+    # Used prompts are spread over the last day, so all of them are this
+    # year's as long as the benchmark doesn't run on January 1st
+    return [
+        Prompt(
+            prompt="A portrait of jairtrejo number %d" % i,
+            id="prompt-%d" % i,
+            created_at=now - 2 * 86400 + i % 86400,
+            used_at=now - 86400 + i % 86400 if i % 2 else None,
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def seed(count):
+    """
+    Returns:
+        The seconds it took to store ``count`` prompts, and the bytes they
+        take up. Only Python allocations are traced, not SQLite's own.
+    """
+    store = stores.get_store()
+    now = int(datetime.now().timestamp())
+
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    for start in range(0, count, SEED_BATCH):
+        store.save_many(
+            make_prompts(start, min(SEED_BATCH, count - start), now)
+        )
+    elapsed = time.perf_counter() - started_at
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return elapsed, size
+
+
+def cases():
+    """
+    The handlers to measure, as ``(name, setup, call)`` where ``setup``
+    returns the event and isn't timed.
+    """
+    context = Context()
+    counter = iter(range(10**9))
+
+    def new_prompt():
+        return {"prompt": "A new portrait of jairtrejo %d" % next(counter)}
+
+    def latest_event():
+        return {
+            "httpMethod": "GET",
+            "resource": "/prompt",
+            "queryStringParameters": {"limit": "50"},
+        }
+
+    def uncached_latest_event():
+        repository._cache.invalidate()
+        return latest_event()
+
+    return [
+        (
+            "save_prompt",
+            lambda: {
+                "httpMethod": "POST",
+                "resource": "/prompt",
+                "body": json.dumps(new_prompt()),
+            },
+            quicksilver.save_prompt,
+        ),
+        (
+            "save_prompts (100)",
+            lambda: {
+                "httpMethod": "POST",
+                "resource": "/prompts",
+                "body": json.dumps([new_prompt() for _ in range(100)]),
+            },
+            quicksilver.save_prompts,
+        ),
+        ("get_latest_prompts", latest_event, quicksilver.get_latest_prompts),
+        (
+            "get_latest_prompts (uncached)",
+            uncached_latest_event,
+            quicksilver.get_latest_prompts,
+        ),
+        ("pick_prompt", lambda: {}, quicksilver.pick_prompt),
+    ], context
+
+
+def measure(setup, call, context, repeat):
+    """
+    Returns:
+        The median and 99th percentile latency in milliseconds, and the peak
+        memory of a call in bytes.
+    """
+    timings = []
+    for _ in range(repeat):
+        event = setup()
+        started_at = time.perf_counter()
+        call(event, context)
+        timings.append((time.perf_counter() - started_at) * 1000)
+
+    peak = 0
+    for _ in range(min(repeat, 5)):
+        event = setup()
+        tracemalloc.start()
+        call(event, context)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    timings.sort()
+    return (
+        statistics.median(timings),
+        timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        peak,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--store", choices=["memory", "sqlite"], default="memory"
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    os.environ["PROMPT_STORE"] = args.store
+    # Keeps the metrics out of the report, but still pays for them
+    metrics._emitter = structlog.wrap_logger(
+        structlog.PrintLogger(open(os.devnull, "w")),
+        wrapper_class=structlog.BoundLogger,
+        processors=[structlog.processors.JSONRenderer()],
+    )
+
+    for count in args.sizes:
+        stores.get_store.cache_clear()
+        repository._cache.invalidate()
+
+        elapsed, size = seed(count)
+        print(
+            "%s, %d prompts: seeded in %.1f s, %.1f MB"
+            % (args.store, count, elapsed, size / 2**20)
+        )
+
+        handlers, context = cases()
+        for name, setup, call in handlers:
+            p50, p99, peak = measure(setup, call, context, args.repeat)
+            print(
+                "  %-30s p50 %8.3f ms  p99 %8.3f ms  peak %8.1f KB"
+                % (name, p50, p99, peak / 2**10)
+            )
+
+
+if __name__ == "__main__":
+    main()
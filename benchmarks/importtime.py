@@ -0,0 +1,107 @@
+"""
+Cold import budget for the Lambda handlers.
+
+Imports each handler in a fresh interpreter with ``python -X importtime``
+and adds up the cost of every module it loads on top of the interpreter's
+own startup. Exits with an error when a handler goes over its budget.
+
+Usage:
+
+    python benchmarks/importtime.py [--runs N]
+"""
+
+import argparse
+import subprocess
+import sys
+
+# Budget in milliseconds, and the modules each handler imports lazily on its
+# first invocation, which are part of its cold start all the same.
+HANDLERS = {
+    "save_prompt": (400, []),
+    "save_prompts": (400, []),
+    "get_prompt": (400, []),
+    "get_latest_prompts": (400, []),
+    "archive_prompts": (400, []),
+    "update_stats": (400, []),
+    "get_stats": (400, []),
+    "pick_prompt": (400, []),
+    "prerender_prompts": (600, ["requests"]),
+    "update_picture": (900, ["requests", "mastodon", "PIL.Image"]),
+}
+
+
+def imported_modules(code):
+    """
+    Runs ``code`` with ``-X importtime``.
+
+    Returns:
+        A dict of top level imports to their cumulative time in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.strip() == "imported package" or name.startswith("  "):
+            continue
+
+        modules[name.strip()] = int(cumulative)
+
+    return modules
+
+
+def import_cost(handler, lazy_modules):
+    """
+    The cost of importing a handler, in milliseconds.
+    """
+    startup = imported_modules("pass")
+    code = "; ".join(
+        ["import quicksilver", "quicksilver.%s" % handler]
+        + ["import %s" % module for module in lazy_modules]
+    )
+    modules = imported_modules(code)
+
+    return (
+        sum(
+            cumulative
+            for module, cumulative in modules.items()
+            if module not in startup
+        )
+        / 1000
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=3,
+        help="Imports per handler, the best one counts",
+    )
+    args = parser.parse_args()
+
+    over_budget = []
+    for handler, (budget, lazy_modules) in HANDLERS.items():
+        cost = min(
+            import_cost(handler, lazy_modules) for _ in range(args.runs)
+        )
+        print("%-20s %8.1f ms (budget %d ms)" % (handler, cost, budget))
+
+        if cost > budget:
+            over_budget.append(handler)
+
+    if over_budget:
+        sys.exit("Over the import budget: %s" % ", ".join(over_budget))
+
+
+if __name__ == "__main__":
+    main()
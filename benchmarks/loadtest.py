@@ -0,0 +1,177 @@
+"""
+Load test of the API over HTTP, against a local store.
+
+Serves the handlers with the WSGI adapter on a free port, seeds the store,
+then sends requests from concurrent clients for a while. Reports the
+latency percentiles and throughput of each kind of request.
+
+Usage:
+
+    python -m benchmarks.loadtest [--store sqlite] [--prompts 10000]
+        [--clients 8] [--workers 8] [--duration 10]
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from datetime import datetime
+
+import structlog
+
+from quicksilver import repository, stores
+from quicksilver.prompt import Prompt
+from quicksilver.utils import metrics
+from quicksilver.utils.wsgi import make_app_server
+
+# Share of each request in the mix
+MIX = [
+    ("GET /prompt", 0.6),
+    ("GET /prompt/{prompt_id}", 0.25),
+    ("POST /prompt", 0.15),
+]
+
+
+def seed(count):
+    now = int(datetime.now().timestamp())
+    stores.get_store().save_many(
+        [
+            Prompt(
+                prompt="A portrait of jairtrejo number %d" % i,
+                id="prompt-%d" % i,
+                created_at=now - 2 * 86400 + i % 86400,
+                used_at=now - 86400 + i % 86400 if i % 2 else None,
+            )
+            for i in range(count)
+        ]
+    )
+
+
+def request(port, kind, prompts, counter):
+    method, path = kind.split(" ")
+    body = None
+    if kind == "GET /prompt/{prompt_id}":
+        path = "/prompt/prompt-%d" % random.randrange(prompts)
+    elif kind == "GET /prompt":
+        path = "/prompt?limit=20"
+    elif kind == "POST /prompt":
+        body = json.dumps(
+            {"prompt": "A new portrait of jairtrejo %d" % next(counter)}
+        )
+
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    try:
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def client(port, prompts, deadline, counter, results, lock):
+    kinds, weights = zip(*MIX)
+    while time.monotonic() < deadline:
+        kind = random.choices(kinds, weights)[0]
+
+        started_at = time.perf_counter()
+        status = request(port, kind, prompts, counter)
+        elapsed = (time.perf_counter() - started_at) * 1000
+
+        with lock:
+            results.setdefault(kind, []).append((elapsed, status))
+
+
+def percentile(timings, p):
+    return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--store", choices=["memory", "sqlite"], default="memory"
+    )
+    parser.add_argument("--prompts", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    os.environ["PROMPT_STORE"] = args.store
+    # Rate limits would turn most of the load away
+    os.environ.pop("RATE_LIMIT_TABLE_NAME", None)
+    # Keeps the metrics out of the report, but still pays for them
+    metrics._emitter = structlog.wrap_logger(
+        structlog.PrintLogger(open(os.devnull, "w")),
+        wrapper_class=structlog.BoundLogger,
+        processors=[structlog.processors.JSONRenderer()],
+    )
+
+    stores.get_store.cache_clear()
+    repository._cache.invalidate()
+    seed(args.prompts)
+
+    server = make_app_server(port=0, workers=args.workers, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    counter = iter(range(10**9))
+    results = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    clients = [
+        threading.Thread(
+            target=client,
+            args=(
+                server.server_port,
+                args.prompts,
+                deadline,
+                counter,
+                results,
+                lock,
+            ),
+        )
+        for _ in range(args.clients)
+    ]
+
+    started_at = time.monotonic()
+    for c in clients:
+        c.start()
+    for c in clients:
+        c.join()
+    elapsed = time.monotonic() - started_at
+
+    server.shutdown()
+    server.server_close()
+
+    print(
+        "%s, %d prompts, %d clients, %d workers, %.1f s"
+        % (args.store, args.prompts, args.clients, args.workers, elapsed)
+    )
+    total = 0
+    for kind, _ in MIX:
+        timings = sorted(t for t, _ in results.get(kind, []))
+        if not timings:
+            continue
+
+        errors = sum(1 for _, s in results[kind] if s >= 400)
+        total += len(timings)
+        print(
+            "  %-26s p50 %8.3f ms  p99 %8.3f ms  %8.1f req/s  %d errors"
+            % (
+                kind,
+                statistics.median(timings),
+                percentile(timings, 0.99),
+                len(timings) / elapsed,
+                errors,
+            )
+        )
+    print("  %-26s %48.1f req/s" % ("total", total / elapsed))
+
+
+if __name__ == "__main__":
+    main()
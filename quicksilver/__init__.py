@@ -1 +1,27 @@
-from .api import *  # noqa
+import importlib
+
+__all__ = [
+    "save_prompt",
+    "save_prompts",
+    "update_picture",
+    "pick_prompt",
+    "prerender_prompts",
+    "get_prompt",
+    "get_latest_prompts",
+    "archive_prompts",
+    "update_stats",
+    "get_stats",
+]
+
+
+def __getattr__(name):
+    # Handlers are imported on first access, so each Lambda function only
+    # loads the modules its own handler needs.
+    if name in __all__:
+        return getattr(importlib.import_module("quicksilver.api"), name)
+
+    raise AttributeError(
+        "module {module!r} has no attribute {name!r}".format(
+            module=__name__, name=name
+        )
+    )
@@ -1,13 +1,24 @@
 from .prompt import (
+    archive_prompts,
     get_latest_prompts,
+    get_prompt,
     pick_prompt,
+    prerender_prompts,
     save_prompt,
+    save_prompts,
     update_picture,
 )
+from .stats import get_stats, update_stats
 
 __all__ = [
     "save_prompt",
+    "save_prompts",
     "update_picture",
     "pick_prompt",
+    "prerender_prompts",
+    "get_prompt",
     "get_latest_prompts",
+    "archive_prompts",
+    "update_stats",
+    "get_stats",
 ]
@@ -1,93 +1,579 @@
-import base64
 import json
 import os
 import random
-from io import BytesIO
+import time
+from collections import Counter
+from datetime import datetime
+from functools import partial
 
-import banana_dev as banana
-import boto3
-import requests
+import attr
 import structlog
-from mastodon import Mastodon
+from botocore.exceptions import ClientError
 
+import quicksilver.archive as archive
+import quicksilver.feed as feed
+import quicksilver.generation as generation
+import quicksilver.images as images
 import quicksilver.logconfig as logconfig
+import quicksilver.publishers as publishers
 from quicksilver.prompt import Prompt
-from quicksilver.repository import Prompts
-from quicksilver.utils.lambdafn import api_handler
+from quicksilver.repository import DuplicatePrompt, PromptExists, Prompts
+from quicksilver.utils import clients, metrics
+from quicksilver.utils.lambdafn import Response, api_handler
+from quicksilver.utils.ratelimit import RateLimiter, TokenBucket
+from quicksilver.utils.serialization import underscore_key
 
 logger = structlog.get_logger(__name__)
 
+MAX_PAGE_SIZE = 100
+MAX_BULK_PROMPTS = 1000
+# Time left for one more picture before update_picture leaves the rest of
+# a batch for a retry
+UPDATE_MARGIN_MS = 60000
+# Matches the queue's visibility timeout, so a redelivered message finds
+# the lease of a worker that died expired
+LEASE_SECONDS = 360
+# What saving a prompt with the text of an existing one does: "merge"
+# returns the existing prompt, and "reject" fails with a 409
+DUPLICATE_POLICY = os.getenv("DUPLICATE_POLICY", "merge")
+PRERENDER_COUNT = int(os.getenv("PRERENDER_COUNT", "10"))
+# Time left for one more generation before a pre-render run stops
+PRERENDER_MARGIN_MS = 90000
+# Time a pre-rendered picture needs after it's generated, to be stored
+STORE_MARGIN_MS = 10000
+# Time a picture needs after it's generated, to be resized and published
+PUBLISH_MARGIN_MS = 45000
+# Seconds before a prompt handed back to the queue is tried again
+RETRY_DELAY = int(os.getenv("RETRY_DELAY", "60"))
+# Times a prompt is handed back to the queue before its message fails, so
+# a generation that never finishes doesn't go around forever
+MAX_HAND_OFFS = int(os.getenv("MAX_HAND_OFFS", "5"))
+# Message attribute with the times a message was handed back
+HAND_OFFS_ATTRIBUTE = "HandOffs"
+# No prompts were used before then
+ARCHIVE_FIRST_YEAR = int(os.getenv("ARCHIVE_FIRST_YEAR", "2022"))
+# Time left for one more year before an archive run stops
+ARCHIVE_MARGIN_MS = 60000
+# Step with the Banana call of a prompt, to resume polling it
+CALL_STEP = "call:"
+# Step of each publisher that's done with a prompt
+PUBLISHED_STEP = "published:"
 
-@api_handler(model=Prompt)
+
+SAVE_RATE_LIMIT = RateLimiter(
+    "save_prompt",
+    per_ip=TokenBucket(
+        capacity=os.getenv("SAVE_BURST_PER_IP", "5"),
+        rate=os.getenv("SAVE_RATE_PER_IP", "0.1"),
+    ),
+    overall=TokenBucket(
+        capacity=os.getenv("SAVE_BURST", "50"),
+        rate=os.getenv("SAVE_RATE", "1"),
+    ),
+)
+# Takes a token for each prompt, so bulk saves can't get around the limit
+SAVE_MANY_RATE_LIMIT = RateLimiter(
+    "save_prompts",
+    per_ip=TokenBucket(
+        capacity=os.getenv("SAVE_MANY_BURST_PER_IP", "100"),
+        rate=os.getenv("SAVE_MANY_RATE_PER_IP", "1"),
+    ),
+    overall=TokenBucket(
+        capacity=os.getenv("SAVE_MANY_BURST", "1000"),
+        rate=os.getenv("SAVE_MANY_RATE", "10"),
+    ),
+)
+
+
+@api_handler(model=Prompt, rate_limit=SAVE_RATE_LIMIT)
 def save_prompt(prompt):
-    prompt = Prompts.save(prompt)
+    try:
+        prompt = Prompts.add(prompt)
+    except PromptExists as e:
+        return Response(
+            status_code=409,
+            body=json.dumps(
+                {"message": "Prompt already exists", "id": e.prompt_id}
+            ),
+        )
+    except DuplicatePrompt as e:
+        existing = None
+        if DUPLICATE_POLICY == "merge":
+            existing = Prompts.from_id(e.prompt_id)
+
+        if existing is None:
+            return Response(
+                status_code=409,
+                body=json.dumps(
+                    {"message": "Duplicate prompt", "id": e.prompt_id}
+                ),
+            )
+
+        return existing
+
     return prompt
 
 
-def update_picture(event, _):
-    logconfig.configure()
-    s3 = boto3.client("s3")
+@api_handler(model=Prompt, many=True, rate_limit=SAVE_MANY_RATE_LIMIT)
+def save_prompts(prompts):
+    if len(prompts) > MAX_BULK_PROMPTS:
+        return Response(
+            status_code=400,
+            body=json.dumps(
+                {"message": "At most %d prompts at a time" % MAX_BULK_PROMPTS}
+            ),
+        )
+
+    ids = Counter(prompt.id for prompt in prompts)
+    repeated = sorted(prompt_id for prompt_id, n in ids.items() if n > 1)
+    if repeated:
+        return Response(
+            status_code=400,
+            body=json.dumps(
+                {"message": "Repeated ids: %s" % ", ".join(repeated)}
+            ),
+        )
 
-    event_body = json.loads(event["Records"][0]["body"])
-    prompt_id = event_body["responsePayload"]
+    failed, duplicates = Prompts.add_many(prompts)
+    failed = set(failed)
 
-    logger.info("Updating picture", aws_event=event, prompt_id=prompt_id)
+    def result(prompt):
+        if prompt.id in duplicates:
+            return {
+                "id": prompt.id,
+                "status": "duplicate",
+                "duplicate_of": duplicates[prompt.id],
+            }
+
+        return {
+            "id": prompt.id,
+            "status": "failed" if prompt.id in failed else "saved",
+        }
+
+    return [result(prompt) for prompt in prompts]
+
+
+def _deadline(context, margin_ms):
+    """
+    A ``time.monotonic()`` value ``margin_ms`` before the Lambda times out
+    """
+    remaining_ms = context.get_remaining_time_in_millis() - margin_ms
+    return time.monotonic() + remaining_ms / 1000
+
+
+def _update_picture(prompt_id, owner, deadline=None):
+    logger.info("Updating picture", prompt_id=prompt_id)
     prompt = Prompts.from_id(prompt_id)
 
-    banana_api_key = os.environ["BANANA_API_KEY"]
-    banana_model_key = os.environ["BANANA_MODEL_KEY"]
-    s3_bucket_name = os.environ["AVATAR_BUCKET"]
-    mastodon_client_secret = os.environ["MASTODON_CLIENT_SECRET"]
-    mastodon_client_key = os.environ["MASTODON_CLIENT_KEY"]
-    mastodon_access_token = os.environ["MASTODON_ACCESS_TOKEN"]
+    if prompt is None:
+        logger.error("Unknown prompt", prompt_id=prompt_id)
+        return
+    if prompt.used_at is not None:
+        logger.info("Prompt already used", prompt_id=prompt_id)
+        return
 
-    try:
-        response = banana.run(
-            banana_api_key, banana_model_key, {"prompt": prompt.prompt}
+    claim = Prompts.claim(prompt_id, owner, LEASE_SECONDS)
+    if claim is None:
+        raise RuntimeError("Prompt %s is being updated elsewhere" % prompt_id)
+
+    prompt, steps = claim
+    if steps:
+        logger.info(
+            "Resuming picture update", prompt_id=prompt_id, steps=steps
         )
-    except Exception:
-        logger.error("Banana dev failure", response=response)
-        raise RuntimeError("Banana dev failure")
 
-    img_base64 = response["modelOutputs"][0]["image_base64"]
-    img_bytes = base64.b64decode(img_base64)
+    try:
+        _publish_picture(prompt, owner, steps, deadline)
+    finally:
+        Prompts.release(prompt.id, owner)
 
-    img_file = BytesIO(img_bytes)
-    s3.upload_fileobj(img_file, s3_bucket_name, f"images/{prompt.id}.jpg")
 
-    api = Mastodon(
-        mastodon_client_key,
-        mastodon_client_secret,
-        mastodon_access_token,
-        api_base_url="https://hachyderm.io",
+def _call_id(steps):
+    """
+    The Banana call recorded in a prompt's steps, if there's one
+    """
+    return next(
+        (
+            step[len(CALL_STEP) :]
+            for step in steps
+            if step.startswith(CALL_STEP)
+        ),
+        None,
     )
-    api.account_update_credentials(
-        avatar=img_bytes, avatar_mime_type="image/jpeg"
+
+
+def _publish_picture(prompt, owner, steps, deadline=None):
+    s3_bucket_name = os.environ["AVATAR_BUCKET"]
+
+    img_bytes = generation.render(
+        prompt.prompt,
+        deadline=deadline,
+        call_id=_call_id(steps),
+        on_start=lambda call_id: Prompts.record_step(
+            prompt.id, owner, CALL_STEP + call_id
+        ),
     )
+    if "generated" not in steps:
+        Prompts.record_step(prompt.id, owner, "generated")
+
+    with metrics.span("images.variants", payload_bytes=len(img_bytes)):
+        variants = images.variants(prompt.id, img_bytes)
 
+    # Every destination reads the same immutable buffers, without copies
+    uploads = {}
+    if "uploaded" not in steps:
+        uploads = {
+            variant["key"]: metrics.span(
+                "s3.put_object", payload_bytes=len(body)
+            )(
+                partial(
+                    clients.s3().put_object,
+                    Bucket=s3_bucket_name,
+                    Key=variant["key"],
+                    Body=body,
+                    ContentType=variant["type"],
+                    CacheControl=images.CACHE_CONTROL,
+                )
+            )
+            for variant, body in variants
+        }
+
+    pending = [
+        publisher
+        for publisher in publishers.registry()
+        if PUBLISHED_STEP + publisher.name not in steps
+    ]
+    # Publishers send the prompt as it will be saved
+    prompt.images = [variant for variant, _ in variants]
     prompt.use()
+
+    publications, errors = publishers.publish_all(
+        pending, prompt, img_bytes, tasks=uploads
+    )
+
+    if uploads and not set(uploads) & set(errors):
+        Prompts.record_step(prompt.id, owner, "uploaded")
+    for publication in publications:
+        if publication["status"] == "published":
+            Prompts.record_step(
+                prompt.id, owner, PUBLISHED_STEP + publication["name"]
+            )
+
+    if errors:
+        for destination, error in errors.items():
+            logger.error(
+                "Publishing failure", destination=destination, exc_info=error
+            )
+        raise RuntimeError("Publishing failure: %s" % ", ".join(errors))
+
+    # Publishers done in an earlier attempt only left their step
+    prompt.publications = [
+        {"name": step[len(PUBLISHED_STEP) :], "status": "published"}
+        for step in sorted(steps)
+        if step.startswith(PUBLISHED_STEP)
+    ] + publications
+    # Publishing is idempotent, so a retry just replaces the feed entry
+    feed.publish(prompt)
     Prompts.save(prompt)
 
 
-def pick_prompt(_, __):
+def _hand_offs(record):
+    """
+    The times a message was already handed back to the queue
+    """
+    attribute = record.get("messageAttributes", {}).get(HAND_OFFS_ATTRIBUTE)
+    if attribute is None:
+        return 0
+
+    return int(attribute["stringValue"])
+
+
+def _hand_off(record):
+    """
+    Sends a message back to the queue, to be tried again after
+    ``RETRY_DELAY``, unless it was already handed back ``MAX_HAND_OFFS``
+    times.
+
+    Returns:
+        Whether it was sent.
+    """
+    hand_offs = _hand_offs(record) + 1
+    if hand_offs > MAX_HAND_OFFS:
+        logger.error(
+            "Too many hand offs",
+            message_id=record["messageId"],
+            hand_offs=hand_offs - 1,
+        )
+        return False
+
+    try:
+        clients.sqs().send_message(
+            QueueUrl=os.environ["PROMPT_QUEUE_URL"],
+            MessageBody=record["body"],
+            DelaySeconds=RETRY_DELAY,
+            MessageAttributes={
+                HAND_OFFS_ATTRIBUTE: {
+                    "DataType": "Number",
+                    "StringValue": str(hand_offs),
+                }
+            },
+        )
+    except Exception as e:
+        logger.error(
+            "Hand off failure", message_id=record["messageId"], exc_info=e
+        )
+        return False
+
+    return True
+
+
+def update_picture(event, context):
+    """
+    Publishes the picture of each prompt in a batch of SQS messages
+
+    Returns:
+        The messages that failed, so only those are retried.
+    """
     logconfig.configure()
-    prompt_ids = Prompts.unused_ids()
+    metrics.bind(handler="update_picture", request_id=context.aws_request_id)
+    records = event["Records"]
+    failed = []
+
+    logger.info(
+        "Updating pictures",
+        message_ids=[record["messageId"] for record in records],
+    )
+
+    for index, record in enumerate(records):
+        if context.get_remaining_time_in_millis() < UPDATE_MARGIN_MS:
+            # Not enough time for another picture, leave them for a retry
+            failed.extend(record["messageId"] for record in records[index:])
+            break
+
+        try:
+            _update_picture(
+                json.loads(record["body"])["responsePayload"],
+                owner=context.aws_request_id,
+                deadline=_deadline(context, PUBLISH_MARGIN_MS),
+            )
+        except generation.GenerationTimeout as e:
+            # The generation goes on, and the retry polls the same call
+            logger.info(
+                "Handing off picture update",
+                message_id=record["messageId"],
+                call_id=e.call_id,
+            )
+            if not _hand_off(record):
+                failed.append(record["messageId"])
+        except Exception as e:
+            logger.error(
+                "Picture update failure",
+                message_id=record["messageId"],
+                exc_info=e,
+            )
+            failed.append(record["messageId"])
+
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": message_id} for message_id in failed
+        ]
+    }
+
+
+def _prerender(prompt_id, owner, deadline):
+    """
+    Generates and stores the image of a prompt. The Banana call is recorded
+    like update_picture does, so a generation that outlasts the run is
+    polled again instead of paid for twice.
 
-    if len(prompt_ids):
-        # Double the chances of recent prompts
-        prompt_ids = (
-            prompt_ids[: len(prompt_ids) // 2] * 2
-            + prompt_ids[len(prompt_ids) // 2 :]
+    Returns:
+        Whether the image was stored.
+    """
+    claim = Prompts.claim(prompt_id, owner, LEASE_SECONDS)
+    if claim is None:
+        logger.info("Prompt being updated elsewhere", prompt_id=prompt_id)
+        return False
+
+    prompt, steps = claim
+    try:
+        img_bytes = generation.generate(
+            prompt.prompt,
+            deadline=deadline,
+            call_id=_call_id(steps),
+            on_start=lambda call_id: Prompts.record_step(
+                prompt_id, owner, CALL_STEP + call_id
+            ),
         )
+    finally:
+        Prompts.release(prompt_id, owner)
 
-        return random.choice(prompt_ids)
-    else:
-        raise RuntimeError("No available prompts")
+    generation.store(prompt.prompt, img_bytes)
+    return True
 
 
-@api_handler
-def get_latest_prompts():
+def prerender_prompts(_, context):
+    """
+    Generates ahead of time the images of the most recent unused prompts,
+    which are the likeliest to be picked.
+    """
+    logconfig.configure()
+    metrics.bind(
+        handler="prerender_prompts", request_id=context.aws_request_id
+    )
+    rendered = 0
+
+    for prompt_id in Prompts.newest_unused_ids(PRERENDER_COUNT):
+        if context.get_remaining_time_in_millis() < PRERENDER_MARGIN_MS:
+            break
+
+        prompt = Prompts.from_id(prompt_id)
+        if prompt is None:
+            logger.error("Unknown prompt", prompt_id=prompt_id)
+            continue
+        if generation.is_cached(prompt.prompt):
+            continue
+
+        try:
+            rendered += _prerender(
+                prompt_id,
+                owner=context.aws_request_id,
+                deadline=_deadline(context, STORE_MARGIN_MS),
+            )
+        except generation.GenerationTimeout as e:
+            # The call is recorded, so the next run picks it up
+            logger.info("Pre-render timeout", call_id=e.call_id)
+            break
+        except (RuntimeError, ClientError) as e:
+            # One prompt failing, even on AWS, doesn't stop the others
+            logger.error("Pre-render failure", prompt_id=prompt_id, exc_info=e)
+
+    logger.info("Pre-rendered prompts", count=rendered)
+    return rendered
+
+
+def archive_prompts(_, context):
+    """
+    Moves the prompts used in past years out of the table, into the
+    archive. Years already archived are skipped.
+    """
+    logconfig.configure()
+    metrics.bind(handler="archive_prompts", request_id=context.aws_request_id)
+    archived = {}
+
+    for year in range(ARCHIVE_FIRST_YEAR, datetime.now().year):
+        if context.get_remaining_time_in_millis() < ARCHIVE_MARGIN_MS:
+            break
+        if archive.is_archived(year):
+            continue
+
+        archived[year] = Prompts.archive(year)
+
+    logger.info("Archived prompts", years=archived)
+    return archived
+
+
+def pick_prompt(_, context):
     logconfig.configure()
-    prompts = Prompts.latest()
+    metrics.bind(handler="pick_prompt", request_id=context.aws_request_id)
+    count = Prompts.unused_count()
+
+    if count:
+        # Double the chances of recent prompts: each rank in the most recent
+        # half gets two slots.
+        recent = count // 2
+        slot = random.randrange(count + recent)
+        rank = slot // 2 if slot < 2 * recent else slot - recent
+
+        prompt_id = Prompts.unused_id(rank)
+        if prompt_id is not None:
+            return prompt_id
+
+    raise RuntimeError("No available prompts")
+
+
+def _fields(fields):
+    """
+    The ``Prompt`` attributes named in a ``fields`` query parameter, which
+    lists them in camel case separated by commas.
+
+    Returns:
+        A tuple of the attribute names in declaration order, or ``None`` if
+        there's no parameter.
+    """
+    if fields is None:
+        return None
+
+    requested = {underscore_key(field.strip()) for field in fields.split(",")}
+    names = [field.name for field in attr.fields(Prompt)]
+
+    unknown = requested.difference(names)
+    if unknown:
+        raise ValueError("Unknown fields: %s" % ", ".join(sorted(unknown)))
+
+    return tuple(name for name in names if name in requested)
+
+
+@api_handler
+def get_prompt(prompt_id, fields=None):
+    try:
+        fields = _fields(fields)
+    except ValueError as e:
+        return Response(status_code=400, body=json.dumps({"message": str(e)}))
+
+    # The table's own items, like #meta, aren't prompts
+    if prompt_id.startswith("#"):
+        return None
+
+    if fields is None:
+        prompt = Prompts.from_id(prompt_id)
+        used = prompt is not None and prompt.used_at is not None
+    else:
+        projection = fields if "used_at" in fields else fields + ("used_at",)
+        prompt = Prompts.from_id(prompt_id, fields=projection)
+        used = prompt is not None and prompt["used_at"] is not None
+        if used and "used_at" not in fields:
+            del prompt["used_at"]
+
+    # Unused prompts are still in the queue, and shouldn't be seen yet
+    return prompt if used else None
+
+
+@api_handler(
+    cache_control=os.getenv(
+        "LATEST_PROMPTS_CACHE_CONTROL", "public, max-age=300"
+    )
+)
+def get_latest_prompts(
+    limit="50", cursor=None, fields=None, q=None, year=None
+):
+    try:
+        limit = int(limit)
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            raise ValueError("limit must be between 1 and %d" % MAX_PAGE_SIZE)
+        if year is not None:
+            year = int(year)
+
+        if (cursor, fields, q, year) == (
+            None,
+            None,
+            None,
+            None,
+        ) and limit == feed.PAGE_SIZE:
+            # The default page is precomputed
+            body = feed.latest()
+            if body is not None:
+                return Response(status_code=200, body=body)
+
+        if q is not None:
+            # Search results, which leave out unused prompts
+            prompts, next_cursor = Prompts.search(
+                q, limit=limit, cursor=cursor, fields=_fields(fields)
+            )
+        else:
+            prompts, next_cursor = Prompts.latest(
+                limit=limit, cursor=cursor, fields=_fields(fields), year=year
+            )
+    except ValueError as e:
+        return Response(status_code=400, body=json.dumps({"message": str(e)}))
 
-    return prompts
+    return {"prompts": prompts, "next_cursor": next_cursor}
@@ -0,0 +1,46 @@
+import os
+
+import structlog
+
+import quicksilver.logconfig as logconfig
+import quicksilver.stats as stats
+from quicksilver.utils import metrics
+from quicksilver.utils.lambdafn import api_handler
+
+logger = structlog.get_logger(__name__)
+
+
+def update_stats(event, context):
+    """
+    Counts the prompts in a batch of records from the prompt table's stream
+
+    Returns:
+        The first record that failed, so it's retried with every one after
+        it, in order.
+    """
+    logconfig.configure()
+    metrics.bind(handler="update_stats", request_id=context.aws_request_id)
+
+    for record in event["Records"]:
+        try:
+            stats.apply(record)
+        except Exception as e:
+            logger.error(
+                "Stats update failure",
+                event_id=record["eventID"],
+                exc_info=e,
+            )
+            return {
+                "batchItemFailures": [
+                    {"itemIdentifier": record["dynamodb"]["SequenceNumber"]}
+                ]
+            }
+
+    return {"batchItemFailures": []}
+
+
+@api_handler(
+    cache_control=os.getenv("STATS_CACHE_CONTROL", "public, max-age=60")
+)
+def get_stats():
+    return stats.read()
@@ -0,0 +1,182 @@
+"""
+Prompts used in past years, moved out of the table into S3.
+
+- ``archive/year={year}/month={month}/prompts.jsonl.gz`` has the prompts
+  used that month, one JSON object a line, newest first.
+- ``archive/year={year}/_SUCCESS`` is written once every month of the
+  year is in, and says how many prompts there are.
+
+Months are read a line at a time, so a page only decompresses the lines up
+to its end.
+"""
+
+import gzip
+import io
+import json
+import os
+from datetime import datetime
+
+import structlog
+from botocore.exceptions import ClientError
+
+from quicksilver.stores.base import (
+    decode_cursor,
+    encode_cursor,
+    project,
+    prompt_from_item,
+)
+from quicksilver.utils import clients, metrics
+
+PREFIX = "archive/"
+logger = structlog.get_logger(__name__)
+
+# Years known to be archived. Archives don't change once they are.
+_archived = set()
+
+
+def _month_key(year, month):
+    return "%syear=%d/month=%02d/prompts.jsonl.gz" % (PREFIX, year, month)
+
+
+def _success_key(year):
+    return "%syear=%d/_SUCCESS" % (PREFIX, year)
+
+
+def _get(key):
+    """
+    The body of an object, as a stream, or ``None`` if it doesn't exist.
+    """
+    try:
+        with metrics.span("s3.get_object"):
+            response = clients.s3().get_object(
+                Bucket=os.environ["AVATAR_BUCKET"], Key=key
+            )
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise
+
+    return response["Body"]
+
+
+def _lines(body):
+    try:
+        with gzip.GzipFile(fileobj=body) as f:
+            for line in io.TextIOWrapper(f, encoding="utf-8"):
+                yield json.loads(line)
+    finally:
+        body.close()
+
+
+def _month(timestamp):
+    return datetime.fromtimestamp(timestamp).month
+
+
+def write(year, prompts):
+    """
+    Adds prompts used in ``year`` to its archive. Prompts already in it are
+    replaced, so running it again is harmless.
+    """
+    months = {}
+    for prompt in prompts:
+        months.setdefault(_month(prompt.used_at), {})[
+            prompt.id
+        ] = prompt.asdict()
+
+    for month, items in sorted(months.items()):
+        key = _month_key(year, month)
+
+        body = _get(key)
+        if body is not None:
+            for item in _lines(body):
+                items.setdefault(item["id"], item)
+
+        lines = sorted(
+            items.values(), key=lambda i: (i["used_at"], i["id"]), reverse=True
+        )
+        data = gzip.compress(
+            "".join(
+                json.dumps(item, separators=(",", ":")) + "\n"
+                for item in lines
+            ).encode(),
+            mtime=0,
+        )
+
+        with metrics.span("s3.put_object", payload_bytes=len(data)):
+            clients.s3().put_object(
+                Bucket=os.environ["AVATAR_BUCKET"],
+                Key=key,
+                Body=data,
+                ContentType="application/gzip",
+            )
+        logger.info("Archived month", year=year, month=month, count=len(lines))
+
+
+def finish(year, count):
+    """
+    Marks a year as archived.
+    """
+    clients.s3().put_object(
+        Bucket=os.environ["AVATAR_BUCKET"],
+        Key=_success_key(year),
+        Body=json.dumps({"count": count}).encode(),
+        ContentType="application/json",
+    )
+    _archived.add(year)
+
+
+def is_archived(year):
+    if year in _archived:
+        return True
+    if not os.getenv("AVATAR_BUCKET"):
+        return False
+
+    try:
+        clients.s3().head_object(
+            Bucket=os.environ["AVATAR_BUCKET"], Key=_success_key(year)
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return False
+        raise
+
+    _archived.add(year)
+    return True
+
+
+def latest(year, limit, cursor=None, fields=None):
+    """
+    A page of the prompts used in an archived year, most recent first. Like
+    :meth:`PromptStore.latest`, but from the archive.
+    """
+    month, offset = 12, 0
+    if cursor:
+        position = decode_cursor(cursor)
+        month, offset = position.get("month"), position.get("offset")
+        if not (
+            isinstance(month, int)
+            and isinstance(offset, int)
+            and 1 <= month <= 12
+            and offset >= 0
+        ):
+            raise ValueError("Invalid cursor")
+
+    prompts = []
+    while month >= 1:
+        body = _get(_month_key(year, month))
+        if body is not None:
+            for index, item in enumerate(_lines(body)):
+                if index < offset:
+                    continue
+
+                if len(prompts) == limit:
+                    # There's at least one more
+                    return prompts, encode_cursor(
+                        {"month": month, "offset": index}
+                    )
+
+                prompts.append(project(prompt_from_item(item), fields))
+
+        month, offset = month - 1, 0
+
+    return prompts, None
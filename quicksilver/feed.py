@@ -0,0 +1,270 @@
+"""
+A static copy of the latest prompts in S3, so the site can read them from
+the bucket or a CDN without a Lambda or DynamoDB on the way.
+
+- ``feed/latest.json`` is the body of ``GET /prompt`` with its default
+  parameters.
+- ``feed/{year}/{page}.json`` shards have every prompt used that year,
+  oldest first, ``SHARD_SIZE`` to a page. Only the last one changes.
+- ``feed/{year}/index.json`` says how many pages and prompts there are.
+
+Each use patches them in place, instead of reading the prompts again.
+"""
+
+import json
+import os
+from datetime import datetime
+
+import structlog
+from botocore.exceptions import ClientError
+
+from quicksilver.repository import Prompts
+from quicksilver.stores import get_store
+from quicksilver.utils import clients, metrics
+from quicksilver.utils.cache import VersionedCache
+from quicksilver.utils.serialization import dumps
+
+LATEST_KEY = "feed/latest.json"
+# Matches the default page of get_latest_prompts
+PAGE_SIZE = 50
+SHARD_SIZE = 100
+CACHE_CONTROL = os.getenv(
+    "LATEST_PROMPTS_CACHE_CONTROL", "public, max-age=300"
+)
+IMMUTABLE = "public, max-age=31536000, immutable"
+MAX_ATTEMPTS = 3
+logger = structlog.get_logger(__name__)
+
+_cache = VersionedCache(
+    lambda: get_store().version(), ttl=float(os.getenv("CACHE_TTL", "60"))
+)
+
+
+def _shard_key(year, page):
+    return "feed/%d/%d.json" % (year, page)
+
+
+def _index_key(year):
+    return "feed/%d/index.json" % year
+
+
+def _read(key):
+    """
+    Returns:
+        The body of an object in the bucket and its ETag, or ``None`` for
+        both if it doesn't exist.
+    """
+    try:
+        with metrics.span("s3.get_object") as span:
+            response = clients.s3().get_object(
+                Bucket=os.environ["AVATAR_BUCKET"], Key=key
+            )
+            body = response["Body"].read().decode()
+            span.record(payload_bytes=len(body))
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None, None
+        raise
+
+    return body, response["ETag"]
+
+
+def _write(key, body, cache_control, **condition):
+    with metrics.span("s3.put_object", payload_bytes=len(body)):
+        clients.s3().put_object(
+            Bucket=os.environ["AVATAR_BUCKET"],
+            Key=key,
+            Body=body.encode(),
+            ContentType="application/json",
+            CacheControl=cache_control,
+            **condition,
+        )
+
+
+def _patch(key, update, cache_control):
+    """
+    Rewrites a JSON document with ``update``, which gets the current one or
+    ``None``. Writes are conditional, and start over if someone else wrote
+    the document in between.
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        body, etag = _read(key)
+        document = update(json.loads(body) if body is not None else None)
+
+        # Only if it's still at the version that was read
+        condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+
+        try:
+            _write(key, dumps(document), cache_control(document), **condition)
+            return document
+        except ClientError as e:
+            code = e.response["Error"]["Code"]
+            if code not in (
+                "PreconditionFailed",
+                "ConditionalRequestConflict",
+            ):
+                raise
+            logger.info("Feed write conflict", key=key, attempt=attempt)
+
+    raise RuntimeError("Couldn't update %s" % key)
+
+
+def _entry(prompt):
+    # The prompt as the API would serialize it
+    return json.loads(dumps(prompt))
+
+
+def _used_year(entry):
+    return datetime.fromtimestamp(entry["usedAt"]).year
+
+
+def _next_cursor(entries):
+    last = entries[-1]
+    return get_store().latest_cursor(last["id"], last["usedAt"])
+
+
+def _patch_latest(entry):
+    def update(document):
+        if document is None:
+            # Starts from the prompts already used
+            prompts, next_cursor = Prompts.latest(limit=PAGE_SIZE)
+            document = {
+                "prompts": [_entry(prompt) for prompt in prompts],
+                "nextCursor": next_cursor,
+            }
+
+        if any(
+            _used_year(e) != _used_year(entry) for e in document["prompts"]
+        ):
+            # A new year starts with an empty page
+            document = {"prompts": [], "nextCursor": None}
+
+        entries = [entry] + [
+            e for e in document["prompts"] if e["id"] != entry["id"]
+        ]
+        more = len(entries) > PAGE_SIZE or document["nextCursor"] is not None
+        entries = entries[:PAGE_SIZE]
+
+        return {
+            "prompts": entries,
+            "nextCursor": _next_cursor(entries) if more else None,
+        }
+
+    return _patch(LATEST_KEY, update, lambda _: CACHE_CONTROL)
+
+
+def _shard_cache_control(shard):
+    # Full pages never change again
+    if len(shard["prompts"]) >= SHARD_SIZE:
+        return IMMUTABLE
+
+    return CACHE_CONTROL
+
+
+def _append_shard(entry):
+    year = _used_year(entry)
+
+    body, _ = _read(_index_key(year))
+    pages = json.loads(body)["pages"] if body is not None else 1
+    page = pages - 1
+
+    def update(shard):
+        entries = shard["prompts"] if shard is not None else []
+        if any(e["id"] == entry["id"] for e in entries):
+            # A retry of the same prompt
+            entries = [entry if e["id"] == entry["id"] else e for e in entries]
+        else:
+            entries.append(entry)
+
+        return {"prompts": entries}
+
+    shard = _patch(_shard_key(year, page), update, _shard_cache_control)
+
+    def count(index):
+        full = len(shard["prompts"]) >= SHARD_SIZE
+        return {
+            "pages": page + 2 if full else page + 1,
+            "count": page * SHARD_SIZE + len(shard["prompts"]),
+            "pageSize": SHARD_SIZE,
+        }
+
+    _patch(_index_key(year), count, lambda _: CACHE_CONTROL)
+
+
+def publish(prompt):
+    """
+    Adds a prompt that was just used to the feed.
+    """
+    entry = _entry(prompt)
+    _patch_latest(entry)
+    _append_shard(entry)
+
+
+def rebuild():
+    """
+    Writes the whole feed again, from the prompts used this year.
+    """
+    entries = []
+    cursor = None
+    while True:
+        prompts, cursor = Prompts.latest(limit=SHARD_SIZE, cursor=cursor)
+        entries.extend(_entry(prompt) for prompt in prompts)
+        if cursor is None:
+            break
+
+    page = entries[:PAGE_SIZE]
+    _write(
+        LATEST_KEY,
+        dumps(
+            {
+                "prompts": page,
+                "nextCursor": (
+                    _next_cursor(page) if len(entries) > PAGE_SIZE else None
+                ),
+            }
+        ),
+        CACHE_CONTROL,
+    )
+
+    entries.reverse()
+    shards = [
+        {"prompts": entries[start : start + SHARD_SIZE]}
+        for start in range(0, len(entries), SHARD_SIZE)
+    ] or [{"prompts": []}]
+    year = datetime.now().year
+    for number, shard in enumerate(shards):
+        _write(
+            _shard_key(year, number),
+            dumps(shard),
+            _shard_cache_control(shard),
+        )
+
+    full = len(shards[-1]["prompts"]) >= SHARD_SIZE
+    _write(
+        _index_key(year),
+        dumps(
+            {
+                "pages": len(shards) + 1 if full else len(shards),
+                "count": len(entries),
+                "pageSize": SHARD_SIZE,
+            }
+        ),
+        CACHE_CONTROL,
+    )
+
+
+@_cache
+def latest():
+    """
+    The body of ``feed/latest.json``, or ``None`` if there's no feed yet.
+    """
+    if not os.getenv("AVATAR_BUCKET"):
+        return None
+
+    try:
+        body, _ = _read(LATEST_KEY)
+    except ClientError as e:
+        logger.error("Feed read failure", exc_info=e)
+        return None
+
+    return body
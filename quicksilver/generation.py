@@ -0,0 +1,219 @@
+import base64
+import hashlib
+import os
+import time
+import unicodedata
+import uuid
+
+import structlog
+from botocore.exceptions import ClientError
+
+from quicksilver.utils import clients, metrics
+
+CACHE_PREFIX = "generated/"
+BANANA_URL = os.getenv("BANANA_URL", "https://api.banana.dev")
+REQUEST_TIMEOUT = 10
+# Seconds between checks on a generation, doubling up to the maximum
+POLL_INTERVAL = 1.0
+MAX_POLL_INTERVAL = 8.0
+
+logger = structlog.get_logger(__name__)
+
+
+def normalize(text):
+    """
+    Normalizes prompt text, so equivalent prompts share a cache entry
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(text, model_key):
+    """
+    The content address of the image generated for a prompt by a model
+    """
+    digest = hashlib.sha256(
+        "{model_key}\0{text}".format(
+            model_key=model_key, text=normalize(text)
+        ).encode()
+    ).hexdigest()
+
+    return "{prefix}{digest}.jpg".format(prefix=CACHE_PREFIX, digest=digest)
+
+
+class GenerationTimeout(Exception):
+    """
+    The image wasn't ready by the deadline. Polling ``call_id`` later picks
+    up the same generation.
+    """
+
+    def __init__(self, call_id):
+        super().__init__("Generation %s isn't ready" % call_id)
+        self.call_id = call_id
+
+
+def _post(path, payload):
+    with metrics.span("banana." + path.strip("/").split("/")[0]):
+        response = clients.http().post(
+            BANANA_URL + path, json=payload, timeout=REQUEST_TIMEOUT
+        )
+    response.raise_for_status()
+    result = response.json()
+
+    if "error" in result.get("message", "").lower():
+        raise RuntimeError("Banana dev failure: %s" % result["message"])
+
+    return result
+
+
+def _request(**payload):
+    return dict(
+        id=str(uuid.uuid4()),
+        created=int(time.time()),
+        apiKey=os.environ["BANANA_API_KEY"],
+        **payload,
+    )
+
+
+def _image(result):
+    img_base64 = result["modelOutputs"][0]["image_base64"]
+
+    with metrics.span("base64.decode", payload_bytes=len(img_base64)):
+        return base64.b64decode(img_base64)
+
+
+def start(text):
+    """
+    Starts generating an image for a prompt with Banana.
+
+    Returns:
+        The id of the call, to :func:`check` on it.
+    """
+    result = _post(
+        "/start/v4/",
+        _request(
+            modelKey=os.environ["BANANA_MODEL_KEY"],
+            modelInputs={"prompt": text},
+            startOnly=True,
+        ),
+    )
+    return result["callID"]
+
+
+def check(call_id):
+    """
+    Returns:
+        The JPEG image bytes of a call, or ``None`` if it's still running.
+    """
+    result = _post("/check/v4/", _request(longPoll=False, callID=call_id))
+
+    if result.get("message", "").lower() != "success":
+        return None
+
+    return _image(result)
+
+
+def generate(text, deadline=None, call_id=None, on_start=None):
+    """
+    Generates an image for a prompt with Banana, polling with exponential
+    backoff until it's ready.
+
+    Args:
+        deadline (float): A ``time.monotonic()`` value to give up at.
+        call_id (str): A call that was already started for the prompt.
+        on_start (function): Gets the id of a new call, so it can be
+        resumed.
+
+    Returns:
+        The JPEG image bytes.
+
+    Raises:
+        GenerationTimeout: The image wasn't ready by the deadline.
+    """
+    try:
+        if call_id is None:
+            call_id = start(text)
+            if on_start is not None:
+                on_start(call_id)
+
+        interval = POLL_INTERVAL
+        while True:
+            img_bytes = check(call_id)
+            if img_bytes is not None:
+                return img_bytes
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise GenerationTimeout(call_id)
+                interval = min(interval, remaining)
+
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+    except GenerationTimeout:
+        raise
+    except Exception as e:
+        logger.error("Banana dev failure", call_id=call_id, exc_info=e)
+        raise RuntimeError("Banana dev failure") from e
+
+
+def cached(text):
+    """
+    The cached image for a prompt, or ``None`` if it hasn't been generated.
+    """
+    with metrics.span("s3.get_object") as span:
+        try:
+            response = clients.s3().get_object(
+                Bucket=os.environ["AVATAR_BUCKET"],
+                Key=cache_key(text, os.environ["BANANA_MODEL_KEY"]),
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "NoSuchKey":
+                return None
+            raise
+
+        img_bytes = response["Body"].read()
+        span.record(payload_bytes=len(img_bytes))
+
+    return img_bytes
+
+
+def is_cached(text):
+    try:
+        clients.s3().head_object(
+            Bucket=os.environ["AVATAR_BUCKET"],
+            Key=cache_key(text, os.environ["BANANA_MODEL_KEY"]),
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return False
+        raise
+
+    return True
+
+
+@metrics.span("s3.put_object")
+def store(text, img_bytes):
+    clients.s3().put_object(
+        Bucket=os.environ["AVATAR_BUCKET"],
+        Key=cache_key(text, os.environ["BANANA_MODEL_KEY"]),
+        Body=img_bytes,
+        ContentType="image/jpeg",
+    )
+
+
+def render(text, **kwargs):
+    """
+    The image for a prompt, from the cache or generated on a miss. Takes
+    the arguments of :func:`generate`.
+
+    Returns:
+        The JPEG image bytes.
+    """
+    img_bytes = cached(text)
+
+    if img_bytes is None:
+        logger.info("Generation cache miss", prompt=text)
+        img_bytes = generate(text, **kwargs)
+        store(text, img_bytes)
+
+    return img_bytes
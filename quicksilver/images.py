@@ -0,0 +1,71 @@
+from io import BytesIO
+
+DERIVATIVE_WIDTHS = (128, 256)
+DERIVATIVE_FORMATS = {
+    "JPEG": ("jpg", "image/jpeg"),
+    "WEBP": ("webp", "image/webp"),
+}
+DERIVATIVE_QUALITY = 80
+
+# Image keys never change content, so they can be cached for good
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def variants(name, img_bytes):
+    """
+    The original JPEG image and its resized JPEG and WebP derivatives
+
+    Args:
+        name (str): Base name for the keys, e.g. the prompt id.
+        img_bytes (bytes): The original JPEG image.
+
+    Returns:
+        A list of ``(variant, bytes)`` tuples, where variant is a dict with
+        the ``key``, ``width`` and content ``type`` of each image.
+    """
+    # Imported here so only the functions that resize pictures load Pillow
+    from PIL import Image
+
+    with Image.open(BytesIO(img_bytes)) as original:
+        result = [
+            (
+                {
+                    "key": "images/{name}.jpg".format(name=name),
+                    "width": original.width,
+                    "type": "image/jpeg",
+                },
+                img_bytes,
+            )
+        ]
+
+        image = original.convert("RGB")
+
+    for width in DERIVATIVE_WIDTHS:
+        if width >= image.width:
+            continue
+
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+
+        for image_format, (
+            extension,
+            content_type,
+        ) in DERIVATIVE_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(
+                buffer, format=image_format, quality=DERIVATIVE_QUALITY
+            )
+            result.append(
+                (
+                    {
+                        "key": "images/{name}-{width}.{extension}".format(
+                            name=name, width=width, extension=extension
+                        ),
+                        "width": width,
+                        "type": content_type,
+                    },
+                    buffer.getvalue(),
+                )
+            )
+
+    return result
@@ -1,9 +1,23 @@
 import logging
 import os
+import random
+import zlib
 
 import structlog
 
 DEBUG = bool(os.getenv("AWS_SAM_LOCAL"))
+# Share of requests whose info logs are kept. Warnings and errors always are.
+SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+# Longest string kept whole in a log field
+MAX_FIELD_LENGTH = int(os.getenv("LOG_MAX_FIELD_LENGTH", "1024"))
+# Most items of a list or dict kept in a log field
+MAX_FIELD_ITEMS = 20
+# Containers nested deeper than this are logged as they are
+MAX_FIELD_DEPTH = 3
+# Fields truncate leaves alone
+UNTRUNCATED = frozenset(["event", "exception", "exc_info"])
+
+_configured = False
 
 
 def logger_factory(*args):
@@ -12,7 +26,110 @@ def logger_factory(*args):
     return logger
 
 
+def sampled(request_id):
+    """
+    Whether a request's info logs are kept. All the logs of a request share
+    the decision, so sampled requests can be followed from start to end,
+    and work done only for a log can be skipped when it'd be dropped.
+    """
+    if DEBUG or SAMPLE_RATE >= 1:
+        return True
+
+    if request_id is None:
+        return random.random() < SAMPLE_RATE
+
+    return zlib.crc32(str(request_id).encode()) < SAMPLE_RATE * 2**32
+
+
+def sample(logger, method_name, event_dict):
+    """
+    Drops the info and debug logs of requests left out of the sample.
+    Logs outside of a request are kept.
+    """
+    if method_name not in ("info", "debug", "msg"):
+        return event_dict
+    if "request_id" not in event_dict:
+        return event_dict
+    if sampled(event_dict["request_id"]):
+        return event_dict
+
+    raise structlog.DropEvent
+
+
+def _truncate(value, depth=0):
+    if isinstance(value, str):
+        if len(value) <= MAX_FIELD_LENGTH:
+            return value
+        return "%s... (%d more characters)" % (
+            value[:MAX_FIELD_LENGTH],
+            len(value) - MAX_FIELD_LENGTH,
+        )
+
+    if isinstance(value, (bytes, bytearray)):
+        return "<%d bytes>" % len(value)
+
+    if depth >= MAX_FIELD_DEPTH:
+        return value
+
+    if isinstance(value, dict):
+        items = list(value.items())
+        truncated = {
+            key: _truncate(item, depth + 1)
+            for key, item in items[:MAX_FIELD_ITEMS]
+        }
+        if len(items) > MAX_FIELD_ITEMS:
+            truncated["..."] = "%d more items" % (len(items) - MAX_FIELD_ITEMS)
+        return truncated
+
+    if isinstance(value, (list, tuple)):
+        truncated = [
+            _truncate(item, depth + 1) for item in value[:MAX_FIELD_ITEMS]
+        ]
+        if len(value) > MAX_FIELD_ITEMS:
+            truncated.append(
+                "... %d more items" % (len(value) - MAX_FIELD_ITEMS)
+            )
+        return truncated
+
+    return value
+
+
+def truncate(logger, method_name, event_dict):
+    """
+    Shortens long strings and containers, and replaces binary data with its
+    size, so a single log can't carry a whole request or response.
+    """
+    return {
+        key: value if key in UNTRUNCATED else _truncate(value)
+        for key, value in event_dict.items()
+    }
+
+
+def _renderer():
+    """
+    Renders JSON with orjson if it's installed, and the json module if not.
+    """
+    try:
+        import orjson
+    except ImportError:
+        return structlog.processors.JSONRenderer()
+
+    def dumps(value, default=None, **kwargs):
+        return orjson.dumps(
+            value, default=default, option=orjson.OPT_NON_STR_KEYS
+        ).decode()
+
+    return structlog.processors.JSONRenderer(serializer=dumps)
+
+
 def configure():
+    """
+    Configures structlog, once per container
+    """
+    global _configured
+    if _configured:
+        return
+
     if DEBUG:
         processors = [
             structlog.stdlib.add_log_level,
@@ -21,12 +138,15 @@ def configure():
             structlog.processors.TimeStamper(fmt="%Y-%m-%d %H:%M:%S.%f"),
             structlog.processors.StackInfoRenderer(),
             structlog.processors.format_exc_info,
+            truncate,
             structlog.dev.ConsoleRenderer(),
         ]
 
     else:
+        # Logs that won't be written are dropped before any other work
         processors = [
             structlog.stdlib.filter_by_level,
+            sample,
             structlog.stdlib.add_logger_name,
             structlog.stdlib.add_log_level,
             structlog.stdlib.PositionalArgumentsFormatter(),
@@ -34,11 +154,14 @@ def configure():
             structlog.processors.StackInfoRenderer(),
             structlog.processors.format_exc_info,
             structlog.processors.UnicodeDecoder(),
-            structlog.processors.JSONRenderer(),
+            truncate,
+            _renderer(),
         ]
 
     structlog.configure(
         processors=processors,
         context_class=structlog.threadlocal.wrap_dict(dict),
         logger_factory=logger_factory,
+        cache_logger_on_first_use=True,
     )
+    _configured = True
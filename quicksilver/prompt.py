@@ -1,3 +1,5 @@
+import hashlib
+import unicodedata
 import uuid
 from datetime import datetime
 
@@ -9,6 +11,39 @@ def _check_text(_, __, value):
         raise ValueError("Prompt must contain my alias (jairtrejo).")
 
 
+def fingerprint(text):
+    """
+    A hash of a prompt's text that ignores case, whitespace and punctuation,
+    so prompts that only differ in those share it
+    """
+    folded = unicodedata.normalize("NFKC", text).casefold()
+    words = "".join(
+        " " if unicodedata.category(c).startswith("P") else c for c in folded
+    ).split()
+
+    return hashlib.sha256(" ".join(words).encode()).hexdigest()
+
+
+def _to_images(value):
+    if value is None:
+        return value
+
+    return [{**image, "width": int(image["width"])} for image in value]
+
+
+def _to_publications(value):
+    if value is None:
+        return value
+
+    return [
+        {
+            key: int(item) if key in ("at", "attempts") else item
+            for key, item in publication.items()
+        }
+        for publication in value
+    ]
+
+
 @attr.s
 class Prompt:
     prompt = attr.ib(validator=_check_text)
@@ -20,6 +55,16 @@ class Prompt:
     used_at = attr.ib(
         default=None, converter=lambda v: int(v) if v is not None else v
     )
+    # Only ever set by the functions that render pictures
+    images = attr.ib(
+        default=None, converter=_to_images, metadata={"server_only": True}
+    )
+    # What each publisher did with the picture
+    publications = attr.ib(
+        default=None,
+        converter=_to_publications,
+        metadata={"server_only": True},
+    )
 
     @property
     def url(self):
@@ -0,0 +1,290 @@
+"""
+The places each new picture is published to, besides the bucket.
+
+``PUBLISHERS`` is a JSON list of them, or ``ssm:`` and the name of a
+parameter with the list. Each entry has a ``type``, the settings of that
+publisher, and optionally:
+
+- ``name``, which defaults to the type and must be unique.
+- ``timeout``, the seconds each attempt can take.
+- ``attempts``, and the ``backoff`` seconds before the second one, which
+  double after each attempt.
+- ``required``, whether the picture update fails when it does. Others are
+  only logged and recorded on the prompt.
+
+Without ``PUBLISHERS``, the picture goes to the Mastodon account in the
+``MASTODON_*`` variables.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import time
+from datetime import datetime
+from functools import lru_cache, partial
+
+import attr
+import structlog
+
+from quicksilver.utils import clients, metrics
+from quicksilver.utils.concurrency import run_concurrently
+from quicksilver.utils.serialization import dumps
+
+PUBLISH_TIMEOUT = float(os.getenv("PUBLISH_TIMEOUT", "20"))
+# Seconds every publisher has, retries included, so they all finish within
+# the margin update_picture leaves after generating the picture
+PUBLISH_BUDGET = float(os.getenv("PUBLISH_BUDGET", "30"))
+SIGNATURE_HEADER = "X-Quicksilver-Signature"
+
+logger = structlog.get_logger(__name__)
+
+
+@attr.s
+class Publisher:
+    name = attr.ib()
+    timeout = attr.ib(default=PUBLISH_TIMEOUT, converter=float)
+    attempts = attr.ib(default=2, converter=int)
+    backoff = attr.ib(default=1.0, converter=float)
+    required = attr.ib(default=True)
+
+    def send(self, prompt, img_bytes):
+        raise NotImplementedError
+
+    @property
+    def budget(self):
+        """
+        The seconds every attempt and the waits between them can take,
+        up to ``PUBLISH_BUDGET``.
+        """
+        waits = sum(self.backoff * 2**i for i in range(self.attempts - 1))
+        return min(self.attempts * self.timeout + waits, PUBLISH_BUDGET)
+
+    def publish(self, prompt, img_bytes, deadline=None):
+        """
+        Sends the picture, trying again after a failure while there's time
+        for another attempt before ``deadline``.
+
+        Returns:
+            The number of attempts it took.
+        """
+        for attempt in range(1, self.attempts + 1):
+            try:
+                with metrics.span(
+                    "publish." + self.name, payload_bytes=len(img_bytes)
+                ):
+                    self.send(prompt, img_bytes)
+                return attempt
+            except Exception as e:
+                delay = self.backoff * 2 ** (attempt - 1)
+                if attempt == self.attempts or (
+                    deadline is not None
+                    and time.monotonic() + delay + self.timeout > deadline
+                ):
+                    raise
+
+                logger.warning(
+                    "Publishing retry",
+                    publisher=self.name,
+                    attempt=attempt,
+                    exc_info=e,
+                )
+                time.sleep(delay)
+
+
+@attr.s
+class MastodonPublisher(Publisher):
+    """
+    Sets the picture as the avatar of a Mastodon account.
+    """
+
+    api_base_url = attr.ib(kw_only=True)
+    client_key = attr.ib(kw_only=True, repr=False)
+    client_secret = attr.ib(kw_only=True, repr=False)
+    access_token = attr.ib(kw_only=True, repr=False)
+    _client = attr.ib(default=None, init=False, repr=False)
+
+    def client(self):
+        if self._client is None:
+            # Imported here so only the functions that publish pay for it
+            from mastodon import Mastodon
+
+            self._client = Mastodon(
+                self.client_key,
+                self.client_secret,
+                self.access_token,
+                api_base_url=self.api_base_url,
+                request_timeout=self.timeout,
+                session=clients.http(),
+            )
+
+        return self._client
+
+    def send(self, prompt, img_bytes):
+        self.client().account_update_credentials(
+            avatar=img_bytes, avatar_mime_type="image/jpeg"
+        )
+
+
+@attr.s
+class WebhookPublisher(Publisher):
+    """
+    Posts the prompt, as the API returns it, to a URL. With a ``secret``,
+    the body is signed with HMAC-SHA256 in ``SIGNATURE_HEADER``.
+    """
+
+    url = attr.ib(kw_only=True)
+    secret = attr.ib(default=None, kw_only=True, repr=False)
+
+    def send(self, prompt, img_bytes):
+        body = dumps(prompt).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            digest = hmac.new(
+                self.secret.encode(), body, hashlib.sha256
+            ).hexdigest()
+            headers[SIGNATURE_HEADER] = "sha256=" + digest
+
+        response = clients.http().post(
+            self.url, data=body, headers=headers, timeout=self.timeout
+        )
+        response.raise_for_status()
+
+
+@attr.s
+class S3AliasPublisher(Publisher):
+    """
+    Copies the picture to a fixed key, so the current avatar always has the
+    same URL.
+    """
+
+    key = attr.ib(default="avatar/current.jpg", kw_only=True)
+    bucket = attr.ib(default=None, kw_only=True)
+    cache_control = attr.ib(default="public, max-age=60", kw_only=True)
+
+    def send(self, prompt, img_bytes):
+        clients.s3().put_object(
+            Bucket=self.bucket or os.environ["AVATAR_BUCKET"],
+            Key=self.key,
+            Body=img_bytes,
+            ContentType="image/jpeg",
+            CacheControl=self.cache_control,
+        )
+
+
+TYPES = {
+    "mastodon": MastodonPublisher,
+    "webhook": WebhookPublisher,
+    "s3_alias": S3AliasPublisher,
+}
+
+
+def from_config(config):
+    """
+    The publishers in a list of settings, like the one in ``PUBLISHERS``.
+    """
+    publishers = []
+    for settings in config:
+        settings = dict(settings)
+        kind = settings.pop("type", None)
+        if kind not in TYPES:
+            raise ValueError("Unknown publisher type: %s" % kind)
+
+        settings.setdefault("name", kind)
+        publishers.append(TYPES[kind](**settings))
+
+    names = [publisher.name for publisher in publishers]
+    if len(set(names)) != len(names):
+        raise ValueError("Publisher names must be unique")
+
+    return publishers
+
+
+def _config():
+    value = os.getenv("PUBLISHERS")
+    if not value:
+        return [
+            {
+                "type": "mastodon",
+                "api_base_url": "https://hachyderm.io",
+                "client_key": os.environ["MASTODON_CLIENT_KEY"],
+                "client_secret": os.environ["MASTODON_CLIENT_SECRET"],
+                "access_token": os.environ["MASTODON_ACCESS_TOKEN"],
+            }
+        ]
+
+    if value.startswith("ssm:"):
+        with metrics.span("ssm.get_parameter"):
+            value = clients.ssm().get_parameter(
+                Name=value[len("ssm:") :], WithDecryption=True
+            )["Parameter"]["Value"]
+
+    return json.loads(value)
+
+
+@lru_cache(maxsize=None)
+def registry():
+    """
+    The configured publishers, read on first use and kept for the container.
+    """
+    return tuple(from_config(_config()))
+
+
+def publish_all(publishers, prompt, img_bytes, tasks=None):
+    """
+    Publishes a picture with every publisher at once, and alongside other
+    ``tasks`` that get ``PUBLISH_TIMEOUT``. A publisher that is slow or
+    fails doesn't hold up the others.
+
+    Returns:
+        A tuple with the result of each publisher, as recorded in
+        ``Prompt.publications``, and the errors of the tasks and required
+        publishers that failed, keyed by task or publisher name.
+    """
+    tasks = dict(tasks or {})
+    timeout = {name: PUBLISH_TIMEOUT for name in tasks}
+    started_at = time.monotonic()
+    for publisher in publishers:
+        tasks[publisher.name] = partial(
+            publisher.publish,
+            prompt,
+            img_bytes,
+            deadline=started_at + publisher.budget,
+        )
+        timeout[publisher.name] = publisher.budget
+
+    results, errors = run_concurrently(tasks, timeout=timeout)
+
+    now = int(datetime.now().timestamp())
+    publications = []
+    for publisher in publishers:
+        if publisher.name in results:
+            publications.append(
+                {
+                    "name": publisher.name,
+                    "status": "published",
+                    "at": now,
+                    "attempts": results[publisher.name],
+                }
+            )
+            continue
+
+        error = errors[publisher.name]
+        publications.append(
+            {
+                "name": publisher.name,
+                "status": "failed",
+                "at": now,
+                # Only the kind of error, which is safe to show in the API
+                "error": type(error).__name__,
+            }
+        )
+        if not publisher.required:
+            logger.warning(
+                "Optional publishing failure",
+                publisher=publisher.name,
+                exc_info=error,
+            )
+            del errors[publisher.name]
+
+    return publications, errors
@@ -1,107 +1,402 @@
 import os
+import time
 from datetime import datetime
 
 import attr
-import boto3
 import structlog
 
-from quicksilver.prompt import Prompt
+from quicksilver import archive, search
+from quicksilver.prompt import fingerprint
+from quicksilver.stores import get_store
+from quicksilver.stores.base import decode_cursor, encode_cursor
+from quicksilver.utils.cache import VersionedCache
 
-LOCAL_DYNAMO_ENDPOINT = "http://docker.for.mac.localhost:8000/"
+
+def _version():
+    return get_store().version()
+
+
+_cache = VersionedCache(_version, ttl=float(os.getenv("CACHE_TTL", "60")))
+# How long archived prompts stay in the store, in case the archive needs to
+# be written again
+ARCHIVE_GRACE = 7 * 24 * 60 * 60
 logger = structlog.get_logger(__name__)
 
-if os.getenv("AWS_SAM_LOCAL"):
-    dynamodb = boto3.resource("dynamodb", endpoint_url=LOCAL_DYNAMO_ENDPOINT)
-    os.environ.setdefault("DYNAMO_TABLE_NAME", "PromptTable")
-else:
-    dynamodb = boto3.resource("dynamodb")
 
+class DuplicatePrompt(Exception):
+    """
+    A prompt with the same text, give or take case, whitespace and
+    punctuation, already exists.
+    """
 
-def _to_dynamo(prompt):
-    table = dynamodb.Table(os.getenv("DYNAMO_TABLE_NAME"))
+    def __init__(self, prompt_id):
+        super().__init__("Duplicate of prompt %s" % prompt_id)
+        self.prompt_id = prompt_id
 
-    writable = {
-        field: value
-        for field, value in prompt.asdict().items()
-        if field != "id" and not (field == "used_at" and value is None)
-    }
 
-    clauses = ", ".join(
-        "{field} = :{field}".format(field=field) for field in writable
-    )
+class PromptExists(Exception):
+    """
+    A prompt with the same id already exists.
+    """
 
-    table.update_item(
-        Key={"id": prompt.id},
-        UpdateExpression="SET %s" % clauses,
-        ExpressionAttributeValues={
-            ":{field}".format(field=field): value
-            for field, value in writable.items()
-        },
-    )
+    def __init__(self, prompt_id):
+        super().__init__("Prompt %s already exists" % prompt_id)
+        self.prompt_id = prompt_id
 
 
-def _from_dynamo(prompt_id):
-    table = dynamodb.Table(os.getenv("DYNAMO_TABLE_NAME"))
+def _postings(prompt):
+    return [
+        (token, prompt.id, frequency)
+        for token, frequency in search.terms(prompt.prompt).items()
+    ]
 
-    row = table.get_item(Key={"id": prompt_id})
-    prompt_data = row.get("Item", None)
 
-    return prompt_data
+def _index(prompt, previous):
+    """
+    Keeps the search index in step with the text of a saved prompt
+    """
+    if previous is not None and previous.prompt == prompt.prompt:
+        return
+
+    added = _postings(prompt)
+    tokens = {token for token, _, _ in added}
+    removed = []
+    if previous is not None:
+        removed = [
+            (token, prompt.id)
+            for token, _, _ in _postings(previous)
+            if token not in tokens
+        ]
+
+    get_store().update_postings(
+        removed=removed, added=added, documents=0 if previous else 1
+    )
 
 
 @attr.s
 class Prompts:
+    """
+    The prompts, in the store configured with ``PROMPT_STORE``.
+    """
+
     def save(prompt):
-        _to_dynamo(prompt)
+        store = get_store()
+        previous = store.save(prompt)
+        _index(prompt, previous)
+
+        if previous is not None and previous.prompt != prompt.prompt:
+            old, new = fingerprint(previous.prompt), fingerprint(prompt.prompt)
+            if old != new:
+                store.release_fingerprint(old, prompt.id)
+                holder = store.claim_fingerprint(new, prompt.id)
+                if holder != prompt.id:
+                    # The text is saved anyway, and the other prompt keeps
+                    # the fingerprint
+                    logger.warning(
+                        "Duplicate prompt text",
+                        prompt_id=prompt.id,
+                        duplicate_of=holder,
+                    )
+
+        _cache.invalidate()
         return prompt
 
     @classmethod
-    def from_id(cls, prompt_id):
-        prompt_data = _from_dynamo(prompt_id)
+    def add(cls, prompt):
+        """
+        Saves a new prompt, unless there's one with the same id or text
+        already.
 
-        prompt = None
-        if prompt_data:
-            prompt = Prompt(**prompt_data)
+        Raises:
+            PromptExists: If saving it would overwrite a prompt.
+            DuplicatePrompt: With the id of the existing prompt.
+        """
+        store = get_store()
+        if store.get(prompt.id, fields=("id",)) is not None:
+            raise PromptExists(prompt.id)
 
-        return prompt
+        text = fingerprint(prompt.prompt)
+
+        holder = store.claim_fingerprint(text, prompt.id)
+        if holder != prompt.id:
+            raise DuplicatePrompt(holder)
+
+        try:
+            return cls.save(prompt)
+        except Exception:
+            store.release_fingerprint(text, prompt.id)
+            raise
 
     @classmethod
-    def unused_ids(cls):
-        table = dynamodb.Table(os.getenv("DYNAMO_TABLE_NAME"))
-        response = table.scan(
-            IndexName="created_at",
-            Select="ALL_PROJECTED_ATTRIBUTES",
-            ScanFilter={
-                "used_at": {
-                    "AttributeValueList": [],
-                    "ComparisonOperator": "NULL",
-                }
-            },
-        )
-
-        prompt_ids = [item["id"] for item in response["Items"]]
-        creation_dates = {
-            item["id"]: item["created_at"] for item in response["Items"]
+    def add_many(cls, prompts):
+        """
+        Saves new prompts in bulk, except the ones with the id of an
+        existing prompt, which would be overwritten, and the ones with the
+        same text as an existing prompt or an earlier one in the batch.
+
+        Returns:
+            A tuple of the ids of the prompts that couldn't be saved, and a
+            dict of the duplicates' ids to the ids of the existing prompts.
+        """
+        store = get_store()
+        existing = {
+            prompt["id"]
+            for prompt in store.get_many(
+                [prompt.id for prompt in prompts], fields=("id",)
+            )
         }
-        return sorted(
-            prompt_ids, key=lambda p: creation_dates[p], reverse=True
-        )
+        duplicates = {prompt_id: prompt_id for prompt_id in existing}
+        unique = []
+
+        for prompt in prompts:
+            if prompt.id in existing:
+                continue
+
+            holder = store.claim_fingerprint(
+                fingerprint(prompt.prompt), prompt.id
+            )
+            if holder != prompt.id:
+                duplicates[prompt.id] = holder
+            else:
+                unique.append(prompt)
+
+        failed = cls.save_many(unique) if unique else []
+
+        failed_ids = set(failed)
+        for prompt in unique:
+            if prompt.id in failed_ids:
+                store.release_fingerprint(
+                    fingerprint(prompt.prompt), prompt.id
+                )
+
+        return failed, duplicates
+
+    @classmethod
+    def save_many(cls, prompts):
+        """
+        Saves new prompts in bulk. Prompts with the id of an existing one
+        replace it, even if it was used, so :meth:`add_many` is the one to
+        use for prompts that may not be new.
+
+        Returns:
+            The ids of the prompts that couldn't be saved.
+        """
+        failed = get_store().save_many(prompts)
+
+        failed_ids = set(failed)
+        saved = [prompt for prompt in prompts if prompt.id not in failed_ids]
+        if saved:
+            get_store().update_postings(
+                added=[posting for p in saved for posting in _postings(p)],
+                documents=len(saved),
+            )
+
+        _cache.invalidate()
+        return failed
+
+    @classmethod
+    def from_id(cls, prompt_id, fields=None):
+        return get_store().get(prompt_id, fields)
 
     @classmethod
-    def latest(cls):
-        start_of_year = int(datetime.now().replace(month=1, day=1).timestamp())
-        table = dynamodb.Table(os.getenv("DYNAMO_TABLE_NAME"))
-
-        response = table.scan(
-            IndexName="used_at",
-            Select="ALL_PROJECTED_ATTRIBUTES",
-            ScanFilter={
-                "used_at": {
-                    "AttributeValueList": [start_of_year],
-                    "ComparisonOperator": "GE",
-                }
-            },
-        )
-
-        prompts = [Prompt(**item) for item in response["Items"]]
-        return sorted(prompts, key=lambda p: p.used_at, reverse=True)
+    def claim(cls, prompt_id, owner, lease_seconds):
+        return get_store().claim(prompt_id, owner, lease_seconds)
+
+    @classmethod
+    def record_step(cls, prompt_id, owner, step):
+        get_store().record_step(prompt_id, owner, step)
+
+    @classmethod
+    def release(cls, prompt_id, owner):
+        get_store().release(prompt_id, owner)
+
+    @classmethod
+    def unused_count(cls):
+        return get_store().unused_count()
+
+    @classmethod
+    def unused_id(cls, rank):
+        return get_store().unused_id(rank)
+
+    @classmethod
+    def newest_unused_ids(cls, limit):
+        return get_store().newest_unused_ids(limit)
+
+    @classmethod
+    @_cache
+    def latest(cls, limit=50, cursor=None, fields=None, year=None):
+        """
+        A page of the prompts used in a year, most recent first. Pages are
+        cached in the container, and revalidated against the version stamp.
+
+        Args:
+            limit (int): Maximum number of prompts in the page.
+            cursor (str): Opaque cursor returned by a previous call.
+            fields (tuple): Names of the ``Prompt`` attributes to read. The
+            page has dicts of those instead of prompts.
+            year (int): The year, this one by default. Archived years are
+            read from the archive.
+
+        Returns:
+            A tuple of the prompts and the cursor for the next page, which is
+            ``None`` when there are no more prompts.
+        """
+        if year is not None and year != datetime.now().year:
+            if archive.is_archived(year):
+                return archive.latest(year, limit, cursor, fields)
+
+        return get_store().latest(limit, cursor, fields, year)
+
+    @classmethod
+    @_cache
+    def search(cls, query, limit=50, cursor=None, fields=None):
+        """
+        A page of the used prompts that have every word in ``query``, best
+        match first. Only the posting lists of those words are read. Unused
+        prompts are left out, like everywhere else in the public API, until
+        they're picked.
+
+        Args:
+            query (str): The words to look for.
+            limit (int): Maximum number of prompts in the page.
+            cursor (str): Opaque cursor returned by a previous call.
+            fields (tuple): Names of the ``Prompt`` attributes to read. The
+            page has dicts of those instead of prompts.
+
+        Returns:
+            A tuple of the prompts and the cursor for the next page, which is
+            ``None`` when there are no more prompts.
+        """
+        offset = 0
+        if cursor:
+            offset = decode_cursor(cursor).get("offset")
+            if not isinstance(offset, int) or offset < 0:
+                raise ValueError("Invalid cursor")
+
+        store = get_store()
+        postings = []
+        for token in sorted(set(search.tokenize(query))):
+            posting = store.postings(token)
+            postings.append(posting)
+            if not posting:
+                # Nothing can match every word
+                break
+
+        ranked = search.rank(postings, store.document_count())
+
+        read = fields
+        if fields is not None and "used_at" not in fields:
+            read = fields + ("used_at",)
+
+        page = []
+        position = offset
+        while len(page) < limit and position < len(ranked):
+            batch = ranked[position : position + limit - len(page)]
+            position += len(batch)
+
+            for prompt in store.get_many(batch, read):
+                if fields is None:
+                    if prompt.used_at is not None:
+                        page.append(prompt)
+                elif prompt["used_at"] is not None:
+                    page.append({field: prompt[field] for field in fields})
+
+        next_cursor = None
+        if position < len(ranked):
+            next_cursor = encode_cursor({"offset": position})
+
+        return page, next_cursor
+
+    @classmethod
+    def reindex(cls):
+        """
+        Rewrites every prompt so it carries the derived index attributes,
+        and rebuilds their postings in the search index.
+        """
+        store = get_store()
+        unused = []
+        count = 0
+
+        for prompt in store.scan():
+            store.update_postings(added=_postings(prompt))
+            count += 1
+
+            if prompt.used_at is None:
+                unused.append(prompt)
+            else:
+                cls.save(prompt)
+
+        # Unused blocks follow creation order
+        for prompt in sorted(unused, key=lambda p: p.created_at):
+            cls.save(prompt)
+
+        store.update_postings(documents=count - store.document_count())
+
+    @classmethod
+    def archive(cls, year):
+        """
+        Moves the prompts used in a past year to the archive. They leave
+        the search index, and expire from the store after
+        ``ARCHIVE_GRACE``.
+
+        Returns:
+            The number of prompts archived.
+        """
+        if year >= datetime.now().year:
+            raise ValueError("Only past years can be archived")
+
+        store = get_store()
+        prompts = []
+        cursor = None
+        while True:
+            page, cursor = store.latest(100, cursor, year=year)
+            prompts.extend(page)
+            if cursor is None:
+                break
+
+        archive.write(year, prompts)
+
+        expires_at = int(time.time()) + ARCHIVE_GRACE
+        for prompt in prompts:
+            # The expiry marks the prompts a run already took out of the
+            # index, so running it again after a failure doesn't count them
+            # out twice
+            expired = store.expire(prompt.id, expires_at)
+            store.update_postings(
+                removed=[
+                    (token, prompt.id) for token, _, _ in _postings(prompt)
+                ],
+                documents=-1 if expired else 0,
+            )
+            store.release_fingerprint(fingerprint(prompt.prompt), prompt.id)
+
+        archive.finish(year, len(prompts))
+        _cache.invalidate()
+        return len(prompts)
+
+    @classmethod
+    def backfill_fingerprints(cls):
+        """
+        Claims the fingerprint of every prompt, oldest first, so prompts
+        saved before duplicates were detected have one.
+
+        Returns:
+            A dict of the ids of the duplicates found to the ids of the
+            prompts that hold their fingerprint.
+        """
+        store = get_store()
+        duplicates = {}
+
+        for prompt in sorted(store.scan(), key=lambda p: (p.created_at, p.id)):
+            holder = store.claim_fingerprint(
+                fingerprint(prompt.prompt), prompt.id
+            )
+            if holder != prompt.id:
+                logger.info(
+                    "Duplicate prompt",
+                    prompt_id=prompt.id,
+                    duplicate_of=holder,
+                )
+                duplicates[prompt.id] = holder
+
+        return duplicates
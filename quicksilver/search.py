@@ -0,0 +1,72 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+
+# Words that would match most prompts. Every prompt has the alias.
+STOP_WORDS = frozenset(
+    (
+        "a an and are as at be by for from in into is it its of on or that "
+        "the their this to with without jairtrejo"
+    ).split()
+)
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    The searchable words in a text, case and accent insensitive
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+
+    return [
+        word
+        for word in _WORD.findall(stripped)
+        if len(word) > 1 and word not in STOP_WORDS
+    ]
+
+
+def terms(text):
+    """
+    The term frequencies of a text.
+    """
+    return Counter(tokenize(text))
+
+
+def rank(postings, document_count):
+    """
+    Ranks the documents that have every term, by tf-idf.
+
+    Args:
+        postings (list): A dict of document ids to term frequency for each
+        term of the query.
+        document_count (int): Number of documents in the index.
+
+    Returns:
+        The ids of the matching documents, best first.
+    """
+    if not postings:
+        return []
+
+    # Walking the shortest posting list keeps the intersection proportional
+    # to the rarest term
+    postings = sorted(postings, key=len)
+    weights = [
+        math.log(1 + max(document_count, len(p)) / max(len(p), 1))
+        for p in postings
+    ]
+
+    scores = {}
+    for document_id, frequency in postings[0].items():
+        score = frequency * weights[0]
+        for posting, weight in zip(postings[1:], weights[1:]):
+            if document_id not in posting:
+                break
+            score += posting[document_id] * weight
+        else:
+            scores[document_id] = score
+
+    return sorted(
+        scores, key=lambda document_id: (-scores[document_id], document_id)
+    )
@@ -0,0 +1,230 @@
+"""
+Aggregate counters over the prompts, kept up to date by the prompt table's
+stream so reading them never scans anything.
+
+Each prompt counts once when it's submitted and once when it's used, on
+these items of the stats table:
+
+- ``submitted`` and ``used``, since the beginning. Their difference is how
+  many prompts are queued.
+- ``submitted#YYYY-MM-DD`` for each day, and ``used#YYYY-MM`` for each
+  month.
+
+A marker item for each prompt and transition is written in the same
+transaction as the counters, and only if it doesn't exist yet, so a stream
+record that is delivered again doesn't count twice.
+"""
+
+import os
+import time
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+
+import structlog
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+from quicksilver.utils import clients
+
+SUBMITTED = "submitted"
+USED = "used"
+# Longer than a stream keeps its records, which is as long as they can be
+# delivered again
+MARKER_TTL = 7 * 24 * 60 * 60
+MAX_READ_ATTEMPTS = 5
+logger = structlog.get_logger(__name__)
+
+if os.getenv("AWS_SAM_LOCAL"):
+    os.environ.setdefault("STATS_TABLE_NAME", "StatsTable")
+
+
+@lru_cache(maxsize=None)
+def _deserializer():
+    return TypeDeserializer()
+
+
+def _image(record, name):
+    image = record["dynamodb"].get(name)
+    if image is None:
+        return None
+
+    return {
+        key: _deserializer().deserialize(value) for key, value in image.items()
+    }
+
+
+def transitions(record):
+    """
+    What happened to a prompt in a stream record.
+
+    Returns:
+        A list of ``(prompt_id, transition, timestamp)``, where transition
+        is ``SUBMITTED`` or ``USED``. Items that aren't prompts, like the
+        table's metadata or the search index, have none.
+    """
+    if record["eventName"] not in ("INSERT", "MODIFY"):
+        return []
+
+    new = _image(record, "NewImage")
+    if new is None or new["id"].startswith("#"):
+        return []
+
+    old = _image(record, "OldImage") or {}
+    found = []
+
+    if not old and "created_at" in new:
+        found.append((new["id"], SUBMITTED, int(new["created_at"])))
+
+    if new.get("used_at") is not None and old.get("used_at") is None:
+        found.append((new["id"], USED, int(new["used_at"])))
+
+    return found
+
+
+def counters(transition, timestamp):
+    """
+    The counter items a transition adds one to.
+    """
+    date = datetime.fromtimestamp(timestamp)
+    if transition == SUBMITTED:
+        return [SUBMITTED, "%s#%s" % (SUBMITTED, date.strftime("%Y-%m-%d"))]
+
+    return [USED, "%s#%s" % (USED, date.strftime("%Y-%m"))]
+
+
+def _table_name():
+    return os.environ["STATS_TABLE_NAME"]
+
+
+def _transact(prompt_id, transition, names):
+    """
+    Adds one to each counter in ``names``, unless the transition was already
+    counted for the prompt.
+
+    Returns:
+        Whether the counters changed.
+    """
+    table_name = _table_name()
+    marker = {
+        "Put": {
+            "TableName": table_name,
+            "Item": {
+                "id": "#%s:%s" % (transition, prompt_id),
+                "expires_at": int(time.time()) + MARKER_TTL,
+            },
+            "ConditionExpression": "attribute_not_exists(id)",
+        }
+    }
+    updates = [
+        {
+            "Update": {
+                "TableName": table_name,
+                "Key": {"id": name},
+                "UpdateExpression": "ADD #count :one",
+                "ExpressionAttributeNames": {"#count": "count"},
+                "ExpressionAttributeValues": {":one": 1},
+            }
+        }
+        for name in names
+    ]
+
+    try:
+        clients.call_dynamodb(
+            clients.dynamodb().meta.client.transact_write_items,
+            TransactItems=[marker] + updates,
+        )
+    except ClientError as e:
+        reasons = e.response.get("CancellationReasons") or [{}]
+        if reasons[0].get("Code") == "ConditionalCheckFailed":
+            return False
+        raise
+
+    return True
+
+
+def _read(names):
+    """
+    The counts of the counter items in ``names``, in one batch.
+    """
+    counts = {}
+    keys = [{"id": name} for name in names]
+
+    for attempt in range(MAX_READ_ATTEMPTS):
+        response = clients.call_dynamodb(
+            clients.dynamodb().batch_get_item,
+            RequestItems={_table_name(): {"Keys": keys}},
+        )
+        for item in response["Responses"].get(_table_name(), []):
+            counts[item["id"]] = int(item.get("count", Decimal(0)))
+
+        keys = response["UnprocessedKeys"].get(_table_name(), {}).get("Keys")
+        if not keys:
+            return counts
+
+        time.sleep(0.05 * 2**attempt)
+
+    raise RuntimeError("Couldn't read the stats")
+
+
+def apply(record):
+    """
+    Counts the transitions in a stream record.
+    """
+    for prompt_id, transition, timestamp in transitions(record):
+        if not _transact(
+            prompt_id, transition, counters(transition, timestamp)
+        ):
+            logger.info(
+                "Transition already counted",
+                prompt_id=prompt_id,
+                transition=transition,
+            )
+
+
+def seed(prompts):
+    """
+    Counts prompts the stream never saw, like the ones saved before it was
+    counted. Prompts it already counted, while their markers last, aren't
+    counted again.
+
+    Returns:
+        How many transitions were counted.
+    """
+    counted = 0
+    for prompt in prompts:
+        found = [(SUBMITTED, prompt.created_at)]
+        if prompt.used_at is not None:
+            found.append((USED, prompt.used_at))
+
+        for transition, timestamp in found:
+            counted += _transact(
+                prompt.id, transition, counters(transition, timestamp)
+            )
+
+    return counted
+
+
+def read(now=None):
+    """
+    The current stats.
+
+    Returns:
+        A dict with how many prompts are queued, were submitted today and
+        were used this month, and the totals.
+    """
+    now = now if now is not None else time.time()
+    today = counters(SUBMITTED, now)[1]
+    this_month = counters(USED, now)[1]
+
+    counts = _read([SUBMITTED, USED, today, this_month])
+    submitted = counts.get(SUBMITTED, 0)
+    used = counts.get(USED, 0)
+
+    return {
+        "queued": submitted - used,
+        "submitted_today": counts.get(today, 0),
+        "used_this_month": counts.get(this_month, 0),
+        "submitted": submitted,
+        "used": used,
+    }
@@ -0,0 +1,29 @@
+import importlib
+import os
+from functools import lru_cache
+
+from quicksilver.stores.base import PromptStore
+
+# Backends by the name given in PROMPT_STORE
+STORES = {
+    "dynamodb": ("quicksilver.stores.dynamodb", "DynamoDBStore"),
+    "memory": ("quicksilver.stores.memory", "MemoryStore"),
+    "sqlite": ("quicksilver.stores.sqlite", "SQLiteStore"),
+}
+
+__all__ = ["PromptStore", "STORES", "get_store"]
+
+
+@lru_cache(maxsize=None)
+def get_store():
+    """
+    The store named by ``PROMPT_STORE``, DynamoDB by default. It's created
+    on first use and kept for the container.
+    """
+    name = os.getenv("PROMPT_STORE", "dynamodb")
+    if name not in STORES:
+        raise ValueError("Unknown prompt store: %s" % name)
+
+    # Imported here so only the configured backend is loaded
+    module, class_name = STORES[name]
+    return getattr(importlib.import_module(module), class_name)()
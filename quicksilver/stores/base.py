@@ -0,0 +1,279 @@
+import base64
+import json
+from datetime import datetime
+
+import attr
+
+from quicksilver.prompt import Prompt
+
+PROMPT_FIELDS = frozenset(field.name for field in attr.fields(Prompt))
+_CONVERTERS = {
+    field.name: field.converter
+    for field in attr.fields(Prompt)
+    if field.converter is not None
+}
+
+
+def used_year(timestamp):
+    return datetime.fromtimestamp(timestamp).year
+
+
+def keep_used(prompt, previous):
+    """
+    The prompt to save over ``previous``. A used prompt stays used, like
+    the DynamoDB item, which a save without ``used_at`` leaves as it was.
+    """
+    if prompt.used_at is None and previous is not None:
+        return attr.evolve(prompt, used_at=previous.used_at)
+
+    return prompt
+
+
+def year_bounds(year):
+    """
+    The first timestamp of ``year`` and of the one after it, in local time
+    like ``used_year``.
+    """
+    return (
+        int(datetime(year, 1, 1).timestamp()),
+        int(datetime(year + 1, 1, 1).timestamp()),
+    )
+
+
+def encode_cursor(last_key):
+    data = json.dumps(last_key, default=int, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        last_key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        last_key = None
+
+    if not isinstance(last_key, dict):
+        raise ValueError("Invalid cursor")
+
+    return last_key
+
+
+def prompt_from_item(item):
+    return Prompt(
+        **{
+            field: value
+            for field, value in item.items()
+            if field in PROMPT_FIELDS
+        }
+    )
+
+
+def fields_from_item(item, fields):
+    """
+    Some fields of a prompt, converted like the ``Prompt`` attributes.
+    Missing fields are ``None``.
+    """
+    return {
+        field: _CONVERTERS.get(field, lambda v: v)(item.get(field))
+        for field in fields
+    }
+
+
+def project(prompt, fields):
+    """
+    The prompt, or a dict of some of its fields if ``fields`` is given.
+    """
+    if fields is None:
+        return prompt
+
+    return {field: getattr(prompt, field) for field in fields}
+
+
+class PromptStore:
+    """
+    Where the prompts are kept.
+
+    Backends mimic the semantics of the DynamoDB table: unused prompts are
+    ranked by the order in which they were first saved, used prompts are
+    paged through by ``used_at``, and every write bumps a version stamp.
+    """
+
+    def save(self, prompt):
+        """
+        Saves a prompt. One that was already used stays used, and out of
+        the unused index, even if it's saved without ``used_at``.
+
+        Returns:
+            The prompt as it was before, or ``None`` if it's new.
+        """
+        raise NotImplementedError
+
+    def save_many(self, prompts):
+        """
+        Saves new prompts in bulk. Like ``PutRequest``, they replace any
+        prompts with the same ids.
+
+        Returns:
+            The ids of the prompts that couldn't be saved.
+        """
+        raise NotImplementedError
+
+    def get(self, prompt_id, fields=None):
+        """
+        Args:
+            prompt_id (str): The prompt to read.
+            fields (tuple): Names of the ``Prompt`` attributes to read, for a
+            partial read. All of them by default.
+
+        Returns:
+            The prompt, a dict of the requested fields if ``fields`` is
+            given, or ``None`` if there isn't one with that id.
+        """
+        raise NotImplementedError
+
+    def get_many(self, prompt_ids, fields=None):
+        """
+        Reads several prompts at once.
+
+        Returns:
+            The prompts that exist, in the order of ``prompt_ids``.
+        """
+        raise NotImplementedError
+
+    def claim(self, prompt_id, owner, lease_seconds):
+        """
+        Takes a lease on a prompt, so only one worker processes it at a time.
+
+        Args:
+            prompt_id (str): The prompt to claim.
+            owner (str): A unique id for the worker, e.g. its request id.
+            lease_seconds (int): How long until others can claim the prompt,
+            if the owner doesn't release it.
+
+        Returns:
+            A tuple of the prompt and the set of steps already recorded for
+            it, or ``None`` if someone else holds the lease.
+        """
+        raise NotImplementedError
+
+    def record_step(self, prompt_id, owner, step):
+        """
+        Records a completed step, as long as ``owner`` holds the lease.
+
+        Raises:
+            RuntimeError: If the lease was lost.
+        """
+        raise NotImplementedError
+
+    def release(self, prompt_id, owner):
+        """
+        Gives up the lease on a prompt, if ``owner`` still holds it.
+        """
+        raise NotImplementedError
+
+    def unused_count(self):
+        raise NotImplementedError
+
+    def unused_id(self, rank):
+        """
+        The id of an unused prompt, by rank in creation order.
+
+        Args:
+            rank (int): Zero for the most recent unused prompt, one for the
+            one before it, and so on.
+        """
+        raise NotImplementedError
+
+    def newest_unused_ids(self, limit):
+        """
+        The ids of the most recent unused prompts, newest first.
+        """
+        raise NotImplementedError
+
+    def latest(self, limit, cursor=None, fields=None, year=None):
+        """
+        A page of the prompts used in a year, most recent first.
+
+        Args:
+            limit (int): Maximum number of prompts in the page.
+            cursor (str): Opaque cursor returned by a previous call.
+            fields (tuple): Names of the ``Prompt`` attributes to read. The
+            page has dicts of those instead of prompts.
+            year (int): The year, this one by default.
+
+        Returns:
+            A tuple of the prompts and the cursor for the next page, which is
+            ``None`` when there are no more prompts.
+        """
+        raise NotImplementedError
+
+    def postings(self, token):
+        """
+        The posting list of a search token.
+
+        Returns:
+            A dict of prompt ids to the token's frequency in them.
+        """
+        raise NotImplementedError
+
+    def update_postings(self, removed=(), added=(), documents=0):
+        """
+        Updates the search index.
+
+        Args:
+            removed: ``(token, prompt_id)`` postings to remove.
+            added: ``(token, prompt_id, frequency)`` postings to add or
+            replace.
+            documents (int): How much the number of indexed prompts changed.
+        """
+        raise NotImplementedError
+
+    def document_count(self):
+        """
+        The number of prompts in the search index.
+        """
+        raise NotImplementedError
+
+    def expire(self, prompt_id, expires_at):
+        """
+        Lets the store delete a prompt after ``expires_at``. Backends
+        without expiry delete it right away.
+
+        Returns:
+            Whether the prompt was there and not already expiring.
+        """
+        raise NotImplementedError
+
+    def claim_fingerprint(self, fingerprint, prompt_id):
+        """
+        Reserves the fingerprint of a prompt's text for it, unless another
+        prompt already has it. Only one prompt can hold a fingerprint.
+
+        Returns:
+            The id of the prompt that holds the fingerprint.
+        """
+        raise NotImplementedError
+
+    def release_fingerprint(self, fingerprint, prompt_id):
+        """
+        Frees a fingerprint, if ``prompt_id`` holds it.
+        """
+        raise NotImplementedError
+
+    def latest_cursor(self, prompt_id, used_at):
+        """
+        The cursor for the page of :meth:`latest` after the one that ends
+        with the given prompt.
+        """
+        raise NotImplementedError
+
+    def version(self):
+        """
+        The version stamp, bumped on every write.
+        """
+        raise NotImplementedError
+
+    def scan(self):
+        """
+        Iterates over every prompt, in no particular order.
+        """
+        raise NotImplementedError
@@ -0,0 +1,655 @@
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+
+import attr
+import structlog
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+from quicksilver.stores.base import (
+    PromptStore,
+    decode_cursor,
+    encode_cursor,
+    fields_from_item,
+    prompt_from_item,
+    used_year,
+    year_bounds,
+)
+from quicksilver.utils import clients
+
+LATEST_INDEX = "latest"
+UNUSED_INDEX = "unused"
+SEARCH_INDEX = "search"
+POSTING_PREFIX = "#posting:"
+FINGERPRINT_PREFIX = "#fingerprint:"
+UNUSED_BLOCK_SIZE = 100
+META_ID = "#meta"
+# An unused prompt keeps its place in the unused index when saved again
+KEEP_UNUSED_BLOCK = "unused_block = if_not_exists(unused_block, :unused_block)"
+BATCH_SIZE = 25
+BATCH_GET_SIZE = 100
+MAX_BATCH_ATTEMPTS = 5
+BATCH_BACKOFF = 0.05
+logger = structlog.get_logger(__name__)
+
+if os.getenv("AWS_SAM_LOCAL"):
+    os.environ.setdefault("DYNAMO_TABLE_NAME", "PromptTable")
+
+
+@lru_cache(maxsize=None)
+def _table(name):
+    return clients.dynamodb().Table(name)
+
+
+def _projection(fields):
+    """
+    The arguments to read only ``fields`` of an item, if given.
+    """
+    if fields is None:
+        return {}
+
+    return {
+        "ProjectionExpression": ", ".join(
+            "#p%d" % i for i in range(len(fields))
+        ),
+        "ExpressionAttributeNames": {
+            "#p%d" % i: field for i, field in enumerate(fields)
+        },
+    }
+
+
+def _from_item(item, fields):
+    if fields is None:
+        return prompt_from_item(item)
+
+    return fields_from_item(item, fields)
+
+
+def _latest_key(cursor, year):
+    """
+    The ``ExclusiveStartKey`` in a cursor of the latest index, which has to
+    be a key of that index for ``year``.
+    """
+    last_key = decode_cursor(cursor)
+    if set(last_key) != {"id", "used_year", "used_at"}:
+        raise ValueError("Invalid cursor")
+
+    start, end = year_bounds(year)
+    prompt_id, used_at = last_key["id"], last_key["used_at"]
+    if (
+        not isinstance(prompt_id, str)
+        or prompt_id.startswith("#")
+        or not isinstance(used_at, int)
+        or not start <= used_at < end
+        or last_key["used_year"] != year
+    ):
+        raise ValueError("Invalid cursor")
+
+    return last_key
+
+
+def _is_conditional_failure(error):
+    return error.response["Error"]["Code"] == "ConditionalCheckFailedException"
+
+
+@attr.s
+class DynamoDBStore(PromptStore):
+    """
+    Keeps the prompts in a DynamoDB table, ``DYNAMO_TABLE_NAME`` by default.
+    """
+
+    table_name = attr.ib(
+        default=attr.Factory(lambda: os.getenv("DYNAMO_TABLE_NAME"))
+    )
+
+    @property
+    def table(self):
+        return _table(self.table_name)
+
+    def _update_meta(self, increments):
+        """
+        Atomically adds to the counters kept in the table's metadata item.
+
+        Returns:
+            The updated counters.
+        """
+        fields = list(increments)
+
+        response = clients.call_dynamodb(
+            self.table.update_item,
+            Key={"id": META_ID},
+            UpdateExpression="ADD %s"
+            % ", ".join("#f{i} :f{i}".format(i=i) for i in range(len(fields))),
+            ExpressionAttributeNames={
+                "#f%d" % i: field for i, field in enumerate(fields)
+            },
+            ExpressionAttributeValues={
+                ":f%d" % i: increments[field] for i, field in enumerate(fields)
+            },
+            ReturnValues="UPDATED_NEW",
+        )
+        return response["Attributes"]
+
+    def _unused_blocks(self):
+        """
+        The blocks of the unused index with their prompt counts, most recent
+        first.
+        """
+        meta = clients.call_dynamodb(
+            self.table.get_item, Key={"id": META_ID}
+        ).get("Item", {})
+
+        blocks = [
+            (int(field[len("unused_") :]), int(count))
+            for field, count in meta.items()
+            if field.startswith("unused_")
+        ]
+        return sorted(blocks, reverse=True)
+
+    def version(self):
+        meta = clients.call_dynamodb(
+            self.table.get_item,
+            Key={"id": META_ID},
+            ProjectionExpression="#version",
+            ExpressionAttributeNames={"#version": "version"},
+        ).get("Item", {})
+
+        return meta.get("version", 0)
+
+    def _update(self, prompt_id, clauses, values, removed="", condition=None):
+        """
+        Sets the fields of a prompt's item.
+
+        Returns:
+            The item as it was before, or an empty dict if it's new.
+        """
+        kwargs = {}
+        if condition is not None:
+            kwargs["ConditionExpression"] = condition
+
+        response = clients.call_dynamodb(
+            self.table.update_item,
+            Key={"id": prompt_id},
+            UpdateExpression="SET %s%s" % (", ".join(clauses), removed),
+            ExpressionAttributeValues={
+                ":{field}".format(field=field): value
+                for field, value in values.items()
+            },
+            ReturnValues="ALL_OLD",
+            **kwargs,
+        )
+        return response.get("Attributes", {})
+
+    def _drop_meta(self, field):
+        """
+        Removes a counter of the metadata item, if it's still zero, so the
+        item doesn't keep one for every block there ever was.
+        """
+        try:
+            clients.call_dynamodb(
+                self.table.update_item,
+                Key={"id": META_ID},
+                UpdateExpression="REMOVE #field",
+                ConditionExpression="#field = :zero",
+                ExpressionAttributeNames={"#field": field},
+                ExpressionAttributeValues={":zero": 0},
+            )
+        except ClientError as e:
+            if not _is_conditional_failure(e):
+                raise
+
+    def save(self, prompt):
+        writable = {
+            field: value
+            for field, value in prompt.asdict().items()
+            if field != "id" and not (field == "used_at" and value is None)
+        }
+
+        clauses = [
+            "{field} = :{field}".format(field=field) for field in writable
+        ]
+
+        if prompt.used_at is not None:
+            # Partition key for the time-ordered index of used prompts
+            writable["used_year"] = used_year(prompt.used_at)
+            clauses.append("used_year = :used_year")
+            previous = self._update(
+                prompt.id, clauses, writable, " REMOVE unused_block"
+            )
+        else:
+            # Unused prompts are kept in a sparse index, in blocks of
+            # consecutive prompts so any of them can be found by rank.
+            sequence = self._update_meta({"sequence": 1})["sequence"]
+            block = int(sequence) // UNUSED_BLOCK_SIZE
+            try:
+                previous = self._update(
+                    prompt.id,
+                    clauses + [KEEP_UNUSED_BLOCK],
+                    dict(writable, unused_block=block),
+                    condition="attribute_not_exists(used_at)",
+                )
+            except ClientError as e:
+                if not _is_conditional_failure(e):
+                    raise
+
+                # A used prompt stays used, and out of the unused index
+                previous = self._update(prompt.id, clauses, writable)
+
+        # Keep the count of each block in sync, and bump the version stamp
+        meta = {"version": 1}
+        if prompt.used_at is None:
+            if "unused_block" not in previous and "used_at" not in previous:
+                meta["unused_%d" % block] = 1
+        elif "unused_block" in previous:
+            meta["unused_%d" % previous["unused_block"]] = -1
+
+        counts = self._update_meta(meta)
+        for field, count in counts.items():
+            if field.startswith("unused_") and count == 0:
+                self._drop_meta(field)
+
+        return prompt_from_item(previous) if previous else None
+
+    def _batch_write(self, requests):
+        """
+        Runs write requests with BatchWriteItem, retrying unprocessed ones.
+
+        Returns:
+            The requests that couldn't be processed.
+        """
+        failed = []
+        for start in range(0, len(requests), BATCH_SIZE):
+            batch = requests[start : start + BATCH_SIZE]
+
+            for attempt in range(MAX_BATCH_ATTEMPTS):
+                if attempt:
+                    # Exponential backoff with jitter
+                    time.sleep(random.uniform(0, BATCH_BACKOFF * 2**attempt))
+
+                response = clients.call_dynamodb(
+                    clients.dynamodb().batch_write_item,
+                    RequestItems={self.table_name: batch},
+                )
+                batch = response.get("UnprocessedItems", {}).get(
+                    self.table_name, []
+                )
+                if not batch:
+                    break
+            else:
+                logger.error("Unprocessed writes", count=len(batch))
+                failed.extend(batch)
+
+        return failed
+
+    def save_many(self, prompts):
+        """
+        Writes new prompts with BatchWriteItem, retrying unprocessed items.
+
+        Returns:
+            The ids of the prompts that couldn't be written.
+        """
+        items = [
+            {
+                field: value
+                for field, value in prompt.asdict().items()
+                if value is not None
+            }
+            for prompt in prompts
+        ]
+
+        unused = [item for item in items if "used_at" not in item]
+        if unused:
+            last = int(
+                self._update_meta({"sequence": len(unused)})["sequence"]
+            )
+            for sequence, item in enumerate(unused, last - len(unused) + 1):
+                item["unused_block"] = sequence // UNUSED_BLOCK_SIZE
+
+        for item in items:
+            if "used_at" in item:
+                item["used_year"] = used_year(item["used_at"])
+
+        failed = [
+            request["PutRequest"]["Item"]["id"]
+            for request in self._batch_write(
+                [{"PutRequest": {"Item": item}} for item in items]
+            )
+        ]
+
+        failed_ids = set(failed)
+        blocks = Counter(
+            item["unused_block"]
+            for item in unused
+            if item["id"] not in failed_ids
+        )
+        if len(failed) < len(items):
+            meta = {
+                "unused_%d" % block: count for block, count in blocks.items()
+            }
+            meta["version"] = 1
+            self._update_meta(meta)
+
+        return failed
+
+    def get(self, prompt_id, fields=None):
+        row = clients.call_dynamodb(
+            self.table.get_item, Key={"id": prompt_id}, **_projection(fields)
+        )
+        prompt_data = row.get("Item", None)
+
+        prompt = None
+        if prompt_data:
+            prompt = _from_item(prompt_data, fields)
+
+        return prompt
+
+    def get_many(self, prompt_ids, fields=None):
+        if fields is not None and "id" not in fields:
+            # Needed to put the items back in order
+            projection = _projection(fields + ("id",))
+        else:
+            projection = _projection(fields)
+
+        items = {}
+        for start in range(0, len(prompt_ids), BATCH_GET_SIZE):
+            keys = [
+                {"id": prompt_id}
+                for prompt_id in prompt_ids[start : start + BATCH_GET_SIZE]
+            ]
+
+            for attempt in range(MAX_BATCH_ATTEMPTS):
+                if attempt:
+                    time.sleep(random.uniform(0, BATCH_BACKOFF * 2**attempt))
+
+                response = clients.call_dynamodb(
+                    clients.dynamodb().batch_get_item,
+                    RequestItems={
+                        self.table_name: {"Keys": keys, **projection}
+                    },
+                )
+                for item in response["Responses"].get(self.table_name, []):
+                    items[item["id"]] = item
+
+                keys = (
+                    response.get("UnprocessedKeys", {})
+                    .get(self.table_name, {})
+                    .get("Keys", [])
+                )
+                if not keys:
+                    break
+            else:
+                raise RuntimeError("Couldn't read %d prompts" % len(keys))
+
+        return [
+            _from_item(items[prompt_id], fields)
+            for prompt_id in prompt_ids
+            if prompt_id in items
+        ]
+
+    def claim(self, prompt_id, owner, lease_seconds):
+        now = int(time.time())
+
+        try:
+            response = clients.call_dynamodb(
+                self.table.update_item,
+                Key={"id": prompt_id},
+                UpdateExpression=(
+                    "SET lease_owner = :owner, lease_expires_at = :expires_at"
+                ),
+                ConditionExpression=(
+                    "attribute_exists(id) AND ("
+                    "attribute_not_exists(lease_expires_at)"
+                    " OR lease_expires_at < :now"
+                    " OR lease_owner = :owner)"
+                ),
+                ExpressionAttributeValues={
+                    ":owner": owner,
+                    ":expires_at": now + lease_seconds,
+                    ":now": now,
+                },
+                ReturnValues="ALL_NEW",
+            )
+        except ClientError as e:
+            if _is_conditional_failure(e):
+                return None
+            raise
+
+        item = response["Attributes"]
+        return prompt_from_item(item), set(item.get("steps", ()))
+
+    def record_step(self, prompt_id, owner, step):
+        try:
+            clients.call_dynamodb(
+                self.table.update_item,
+                Key={"id": prompt_id},
+                UpdateExpression="ADD steps :step",
+                ConditionExpression="lease_owner = :owner",
+                ExpressionAttributeValues={
+                    ":step": {step},
+                    ":owner": owner,
+                },
+            )
+        except ClientError as e:
+            if _is_conditional_failure(e):
+                raise RuntimeError("Lost the lease on %s" % prompt_id)
+            raise
+
+    def release(self, prompt_id, owner):
+        try:
+            clients.call_dynamodb(
+                self.table.update_item,
+                Key={"id": prompt_id},
+                UpdateExpression="REMOVE lease_owner, lease_expires_at",
+                ConditionExpression="lease_owner = :owner",
+                ExpressionAttributeValues={":owner": owner},
+            )
+        except ClientError as e:
+            if not _is_conditional_failure(e):
+                raise
+
+    def unused_count(self):
+        return sum(count for _, count in self._unused_blocks())
+
+    def unused_id(self, rank):
+        for block, count in self._unused_blocks():
+            if rank >= count:
+                rank -= count
+                continue
+
+            response = clients.call_dynamodb(
+                self.table.query,
+                IndexName=UNUSED_INDEX,
+                KeyConditionExpression=Key("unused_block").eq(block),
+                ScanIndexForward=False,
+                Limit=rank + 1,
+            )
+            if response["Items"]:
+                return response["Items"][-1]["id"]
+
+            # The count was off, settle for the next block
+            rank = 0
+
+        return None
+
+    def newest_unused_ids(self, limit):
+        prompt_ids = []
+
+        for block, count in self._unused_blocks():
+            if len(prompt_ids) >= limit:
+                break
+            if not count:
+                continue
+
+            response = clients.call_dynamodb(
+                self.table.query,
+                IndexName=UNUSED_INDEX,
+                KeyConditionExpression=Key("unused_block").eq(block),
+                ScanIndexForward=False,
+                Limit=limit - len(prompt_ids),
+            )
+            prompt_ids.extend(item["id"] for item in response["Items"])
+
+        return prompt_ids
+
+    def latest(self, limit, cursor=None, fields=None, year=None):
+        year = year or datetime.now().year
+        query = {
+            "IndexName": LATEST_INDEX,
+            "KeyConditionExpression": Key("used_year").eq(year),
+            "ScanIndexForward": False,
+            "Limit": limit,
+            **_projection(fields),
+        }
+        if cursor:
+            query["ExclusiveStartKey"] = _latest_key(cursor, year)
+
+        response = clients.call_dynamodb(self.table.query, **query)
+
+        prompts = [_from_item(item, fields) for item in response["Items"]]
+        last_key = response.get("LastEvaluatedKey")
+
+        return prompts, encode_cursor(last_key) if last_key else None
+
+    def postings(self, token):
+        query = {
+            "IndexName": SEARCH_INDEX,
+            "KeyConditionExpression": Key("token").eq(token),
+        }
+        postings = {}
+
+        while True:
+            response = clients.call_dynamodb(self.table.query, **query)
+            for item in response["Items"]:
+                postings[item["prompt_id"]] = int(item["frequency"])
+
+            if "LastEvaluatedKey" not in response:
+                break
+            query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        return postings
+
+    def update_postings(self, removed=(), added=(), documents=0):
+        # Postings are items of their own, in a sparse index by token
+        requests = [
+            {
+                "DeleteRequest": {
+                    "Key": {"id": POSTING_PREFIX + token + ":" + prompt_id}
+                }
+            }
+            for token, prompt_id in removed
+        ] + [
+            {
+                "PutRequest": {
+                    "Item": {
+                        "id": POSTING_PREFIX + token + ":" + prompt_id,
+                        "token": token,
+                        "prompt_id": prompt_id,
+                        "frequency": frequency,
+                    }
+                }
+            }
+            for token, prompt_id, frequency in added
+        ]
+
+        if self._batch_write(requests):
+            raise RuntimeError("Couldn't update the search index")
+
+        meta = {"version": 1}
+        if documents:
+            meta["documents"] = documents
+        self._update_meta(meta)
+
+    def document_count(self):
+        meta = clients.call_dynamodb(
+            self.table.get_item,
+            Key={"id": META_ID},
+            ProjectionExpression="#documents",
+            ExpressionAttributeNames={"#documents": "documents"},
+        ).get("Item", {})
+
+        return int(meta.get("documents", 0))
+
+    def expire(self, prompt_id, expires_at):
+        # DynamoDB deletes it some time after, with the table's TTL
+        try:
+            clients.call_dynamodb(
+                self.table.update_item,
+                Key={"id": prompt_id},
+                UpdateExpression="SET expires_at = :expires_at",
+                ConditionExpression=(
+                    "attribute_exists(id) AND attribute_not_exists(expires_at)"
+                ),
+                ExpressionAttributeValues={":expires_at": expires_at},
+            )
+        except ClientError as e:
+            if not _is_conditional_failure(e):
+                raise
+            return False
+
+        return True
+
+    def claim_fingerprint(self, fingerprint, prompt_id):
+        # Fingerprints are items of their own, so the key is unique
+        key = {"id": FINGERPRINT_PREFIX + fingerprint}
+        try:
+            clients.call_dynamodb(
+                self.table.put_item,
+                Item={**key, "prompt_id": prompt_id},
+                ConditionExpression=(
+                    "attribute_not_exists(id) OR prompt_id = :prompt_id"
+                ),
+                ExpressionAttributeValues={":prompt_id": prompt_id},
+            )
+        except ClientError as e:
+            if not _is_conditional_failure(e):
+                raise
+
+            item = clients.call_dynamodb(
+                self.table.get_item, Key=key, ConsistentRead=True
+            ).get("Item")
+            if item is None:
+                # Released in between
+                return self.claim_fingerprint(fingerprint, prompt_id)
+
+            return item["prompt_id"]
+
+        return prompt_id
+
+    def release_fingerprint(self, fingerprint, prompt_id):
+        try:
+            clients.call_dynamodb(
+                self.table.delete_item,
+                Key={"id": FINGERPRINT_PREFIX + fingerprint},
+                ConditionExpression="prompt_id = :prompt_id",
+                ExpressionAttributeValues={":prompt_id": prompt_id},
+            )
+        except ClientError as e:
+            if not _is_conditional_failure(e):
+                raise
+
+    def latest_cursor(self, prompt_id, used_at):
+        # The LastEvaluatedKey of the latest index
+        return encode_cursor(
+            {
+                "id": prompt_id,
+                "used_year": used_year(used_at),
+                "used_at": used_at,
+            }
+        )
+
+    def scan(self):
+        scan = {}
+
+        while True:
+            response = clients.call_dynamodb(self.table.scan, **scan)
+            for item in response["Items"]:
+                if not item["id"].startswith("#"):
+                    yield prompt_from_item(item)
+
+            if "LastEvaluatedKey" not in response:
+                break
+            scan["ExclusiveStartKey"] = response["LastEvaluatedKey"]
@@ -0,0 +1,223 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime
+
+import attr
+
+from quicksilver.stores.base import (
+    PromptStore,
+    decode_cursor,
+    encode_cursor,
+    keep_used,
+    project,
+    year_bounds,
+)
+
+
+@attr.s
+class MemoryStore(PromptStore):
+    """
+    Keeps the prompts in the process, for tests and local load testing.
+
+    Unused prompts are kept sorted by sequence number, and used ones by
+    ``(used_at, id)``, so ranks and pages are found by bisection.
+    """
+
+    prompts = attr.ib(factory=dict)
+    sequences = attr.ib(factory=dict)
+    unused = attr.ib(factory=list)
+    used = attr.ib(factory=list)
+    leases = attr.ib(factory=dict)
+    steps = attr.ib(factory=dict)
+    index = attr.ib(factory=dict)
+    fingerprints = attr.ib(factory=dict)
+    documents = attr.ib(default=0)
+    sequence = attr.ib(default=0)
+    _version = attr.ib(default=0)
+    _lock = attr.ib(factory=threading.RLock, repr=False)
+
+    def _unindex(self, prompt_id):
+        previous = self.prompts.get(prompt_id)
+        if previous is None:
+            return None
+
+        sequence = self.sequences.pop(prompt_id, None)
+        if sequence is not None:
+            del self.unused[bisect_left(self.unused, (sequence, prompt_id))]
+        if previous.used_at is not None:
+            key = (previous.used_at, prompt_id)
+            del self.used[bisect_left(self.used, key)]
+
+        return sequence
+
+    def _put(self, prompt):
+        previous = self.prompts.get(prompt.id)
+        sequence = self._unindex(prompt.id)
+
+        if prompt.used_at is None:
+            # Like the DynamoDB block, an unused prompt keeps its place
+            if sequence is None:
+                self.sequence += 1
+                sequence = self.sequence
+            self.sequences[prompt.id] = sequence
+            insort(self.unused, (sequence, prompt.id))
+        else:
+            insort(self.used, (prompt.used_at, prompt.id))
+
+        # Copied, so changes to the caller's prompt need another save
+        self.prompts[prompt.id] = attr.evolve(prompt)
+        return previous
+
+    def save(self, prompt):
+        with self._lock:
+            previous = self._put(
+                keep_used(prompt, self.prompts.get(prompt.id))
+            )
+            self._version += 1
+
+        return previous
+
+    def save_many(self, prompts):
+        with self._lock:
+            for prompt in prompts:
+                self._put(prompt)
+            self._version += 1
+
+        return []
+
+    def get(self, prompt_id, fields=None):
+        prompt = self.prompts.get(prompt_id)
+        if prompt is None:
+            return None
+
+        return project(attr.evolve(prompt), fields)
+
+    def get_many(self, prompt_ids, fields=None):
+        prompts = [self.get(prompt_id, fields) for prompt_id in prompt_ids]
+        return [prompt for prompt in prompts if prompt is not None]
+
+    def claim(self, prompt_id, owner, lease_seconds):
+        now = int(time.time())
+
+        with self._lock:
+            if prompt_id not in self.prompts:
+                return None
+
+            lease_owner, expires_at = self.leases.get(prompt_id, (None, 0))
+            if lease_owner not in (None, owner) and expires_at >= now:
+                return None
+
+            self.leases[prompt_id] = (owner, now + lease_seconds)
+            return (
+                self.get(prompt_id),
+                set(self.steps.get(prompt_id, ())),
+            )
+
+    def record_step(self, prompt_id, owner, step):
+        with self._lock:
+            if self.leases.get(prompt_id, (None,))[0] != owner:
+                raise RuntimeError("Lost the lease on %s" % prompt_id)
+
+            self.steps.setdefault(prompt_id, set()).add(step)
+
+    def release(self, prompt_id, owner):
+        with self._lock:
+            if self.leases.get(prompt_id, (None,))[0] == owner:
+                del self.leases[prompt_id]
+
+    def unused_count(self):
+        return len(self.unused)
+
+    def unused_id(self, rank):
+        with self._lock:
+            if not 0 <= rank < len(self.unused):
+                return None
+
+            return self.unused[-1 - rank][1]
+
+    def newest_unused_ids(self, limit):
+        with self._lock:
+            newest = self.unused[max(len(self.unused) - limit, 0) :]
+
+        return [prompt_id for _, prompt_id in reversed(newest)]
+
+    def latest(self, limit, cursor=None, fields=None, year=None):
+        start, end = year_bounds(year or datetime.now().year)
+
+        with self._lock:
+            low = bisect_left(self.used, (start,))
+            if cursor:
+                last_key = decode_cursor(cursor)
+                try:
+                    high = bisect_left(
+                        self.used, (int(last_key["used_at"]), last_key["id"])
+                    )
+                except (KeyError, TypeError, ValueError):
+                    raise ValueError("Invalid cursor")
+            else:
+                high = bisect_left(self.used, (end,))
+
+            first = max(low, high - limit)
+            page = self.used[first:high][::-1]
+            prompts = [self.get(prompt_id, fields) for _, prompt_id in page]
+
+        next_cursor = None
+        if page and first > low:
+            used_at, prompt_id = page[-1]
+            next_cursor = self.latest_cursor(prompt_id, used_at)
+
+        return prompts, next_cursor
+
+    def latest_cursor(self, prompt_id, used_at):
+        return encode_cursor({"used_at": used_at, "id": prompt_id})
+
+    def postings(self, token):
+        with self._lock:
+            return dict(self.index.get(token, {}))
+
+    def update_postings(self, removed=(), added=(), documents=0):
+        with self._lock:
+            for token, prompt_id in removed:
+                posting = self.index.get(token, {})
+                posting.pop(prompt_id, None)
+                if not posting:
+                    self.index.pop(token, None)
+
+            for token, prompt_id, frequency in added:
+                self.index.setdefault(token, {})[prompt_id] = frequency
+
+            self.documents += documents
+            self._version += 1
+
+    def document_count(self):
+        return self.documents
+
+    def expire(self, prompt_id, expires_at):
+        with self._lock:
+            self._unindex(prompt_id)
+            expired = self.prompts.pop(prompt_id, None) is not None
+            self.leases.pop(prompt_id, None)
+            self.steps.pop(prompt_id, None)
+            self._version += 1
+
+        return expired
+
+    def claim_fingerprint(self, fingerprint, prompt_id):
+        with self._lock:
+            return self.fingerprints.setdefault(fingerprint, prompt_id)
+
+    def release_fingerprint(self, fingerprint, prompt_id):
+        with self._lock:
+            if self.fingerprints.get(fingerprint) == prompt_id:
+                del self.fingerprints[fingerprint]
+
+    def version(self):
+        return self._version
+
+    def scan(self):
+        with self._lock:
+            prompt_ids = list(self.prompts)
+
+        for prompt_id in prompt_ids:
+            yield self.get(prompt_id)
@@ -0,0 +1,381 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import attr
+
+from quicksilver.prompt import Prompt
+from quicksilver.stores.base import (
+    PromptStore,
+    decode_cursor,
+    encode_cursor,
+    keep_used,
+    project,
+    year_bounds,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (
+    id TEXT PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    used_at INTEGER,
+    images TEXT,
+    publications TEXT,
+    sequence INTEGER,
+    lease_owner TEXT,
+    lease_expires_at INTEGER,
+    steps TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS latest
+    ON prompts (used_at, id) WHERE used_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS unused
+    ON prompts (sequence) WHERE sequence IS NOT NULL;
+CREATE TABLE IF NOT EXISTS postings (
+    token TEXT NOT NULL,
+    prompt_id TEXT NOT NULL,
+    frequency INTEGER NOT NULL,
+    PRIMARY KEY (token, prompt_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fingerprints (
+    fingerprint TEXT PRIMARY KEY,
+    prompt_id TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+PROMPT_COLUMNS = "id, prompt, created_at, used_at, images, publications"
+
+
+def _prompt_from_row(row):
+    prompt_id, text, created_at, used_at, images, publications = row
+    return Prompt(
+        prompt=text,
+        id=prompt_id,
+        created_at=created_at,
+        used_at=used_at,
+        images=json.loads(images) if images is not None else None,
+        publications=(
+            json.loads(publications) if publications is not None else None
+        ),
+    )
+
+
+def _connect():
+    connection = sqlite3.connect(
+        os.getenv("SQLITE_DATABASE", ":memory:"), check_same_thread=False
+    )
+    connection.executescript(SCHEMA)
+    return connection
+
+
+@attr.s
+class SQLiteStore(PromptStore):
+    """
+    Keeps the prompts in a SQLite database, ``SQLITE_DATABASE`` or an
+    in-memory one by default, for local load testing.
+
+    Partial indexes stand in for the sparse DynamoDB indexes.
+    """
+
+    connection = attr.ib(factory=_connect)
+    _lock = attr.ib(factory=threading.RLock, repr=False)
+
+    def _execute(self, sql, parameters=()):
+        return self.connection.execute(sql, parameters)
+
+    def _add_meta(self, name, increment):
+        self._execute(
+            "INSERT INTO meta (name, value) VALUES (?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            (name, increment),
+        )
+        return self._meta(name)
+
+    def _meta(self, name):
+        row = self._execute(
+            "SELECT value FROM meta WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _write(self, prompts):
+        prompt_ids = [prompt.id for prompt in prompts]
+        sequences = {}
+        for start in range(0, len(prompt_ids), 500):
+            chunk = prompt_ids[start : start + 500]
+            sequences.update(
+                self._execute(
+                    "SELECT id, sequence FROM prompts"
+                    " WHERE sequence IS NOT NULL AND id IN (%s)"
+                    % ", ".join("?" * len(chunk)),
+                    chunk,
+                )
+            )
+
+        # Like the DynamoDB block, an unused prompt keeps its place
+        new = [
+            prompt
+            for prompt in prompts
+            if prompt.used_at is None and prompt.id not in sequences
+        ]
+        if new:
+            last = self._add_meta("sequence", len(new))
+            for sequence, prompt in enumerate(new, last - len(new) + 1):
+                sequences[prompt.id] = sequence
+
+        self.connection.executemany(
+            "INSERT INTO prompts (%s, sequence) VALUES (?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (id) DO UPDATE SET"
+            " prompt = excluded.prompt,"
+            " created_at = excluded.created_at,"
+            " used_at = excluded.used_at,"
+            " images = excluded.images,"
+            " publications = excluded.publications,"
+            " sequence = excluded.sequence" % PROMPT_COLUMNS,
+            [
+                (
+                    prompt.id,
+                    prompt.prompt,
+                    prompt.created_at,
+                    prompt.used_at,
+                    (
+                        json.dumps(prompt.images)
+                        if prompt.images is not None
+                        else None
+                    ),
+                    (
+                        json.dumps(prompt.publications)
+                        if prompt.publications is not None
+                        else None
+                    ),
+                    (
+                        sequences.get(prompt.id)
+                        if prompt.used_at is None
+                        else None
+                    ),
+                )
+                for prompt in prompts
+            ],
+        )
+        self._add_meta("version", 1)
+
+    def save(self, prompt):
+        with self._lock, self.connection:
+            previous = self.get(prompt.id)
+            self._write([keep_used(prompt, previous)])
+
+        return previous
+
+    def save_many(self, prompts):
+        with self._lock, self.connection:
+            self._write(prompts)
+
+        return []
+
+    def get(self, prompt_id, fields=None):
+        with self._lock:
+            row = self._execute(
+                "SELECT %s FROM prompts WHERE id = ?" % PROMPT_COLUMNS,
+                (prompt_id,),
+            ).fetchone()
+
+        return project(_prompt_from_row(row), fields) if row else None
+
+    def get_many(self, prompt_ids, fields=None):
+        prompts = {}
+        with self._lock:
+            for start in range(0, len(prompt_ids), 500):
+                chunk = prompt_ids[start : start + 500]
+                rows = self._execute(
+                    "SELECT %s FROM prompts WHERE id IN (%s)"
+                    % (PROMPT_COLUMNS, ", ".join("?" * len(chunk))),
+                    chunk,
+                )
+                prompts.update((row[0], _prompt_from_row(row)) for row in rows)
+
+        return [
+            project(prompts[prompt_id], fields)
+            for prompt_id in prompt_ids
+            if prompt_id in prompts
+        ]
+
+    def claim(self, prompt_id, owner, lease_seconds):
+        now = int(time.time())
+
+        with self._lock, self.connection:
+            claimed = self._execute(
+                "UPDATE prompts"
+                " SET lease_owner = ?, lease_expires_at = ?"
+                " WHERE id = ? AND ("
+                "lease_expires_at IS NULL"
+                " OR lease_expires_at < ?"
+                " OR lease_owner = ?)",
+                (owner, now + lease_seconds, prompt_id, now, owner),
+            ).rowcount
+            if not claimed:
+                return None
+
+            row = self._execute(
+                "SELECT %s, steps FROM prompts WHERE id = ?" % PROMPT_COLUMNS,
+                (prompt_id,),
+            ).fetchone()
+
+        return _prompt_from_row(row[:-1]), set(json.loads(row[-1]))
+
+    def record_step(self, prompt_id, owner, step):
+        with self._lock, self.connection:
+            row = self._execute(
+                "SELECT steps FROM prompts WHERE id = ? AND lease_owner = ?",
+                (prompt_id, owner),
+            ).fetchone()
+            if row is None:
+                raise RuntimeError("Lost the lease on %s" % prompt_id)
+
+            steps = sorted(set(json.loads(row[0])) | {step})
+            self._execute(
+                "UPDATE prompts SET steps = ? WHERE id = ?",
+                (json.dumps(steps), prompt_id),
+            )
+
+    def release(self, prompt_id, owner):
+        with self._lock, self.connection:
+            self._execute(
+                "UPDATE prompts SET lease_owner = NULL, lease_expires_at = NULL"
+                " WHERE id = ? AND lease_owner = ?",
+                (prompt_id, owner),
+            )
+
+    def unused_count(self):
+        with self._lock:
+            return self._execute(
+                "SELECT COUNT(*) FROM prompts WHERE sequence IS NOT NULL"
+            ).fetchone()[0]
+
+    def unused_id(self, rank):
+        with self._lock:
+            row = self._execute(
+                "SELECT id FROM prompts WHERE sequence IS NOT NULL"
+                " ORDER BY sequence DESC LIMIT 1 OFFSET ?",
+                (rank,),
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def newest_unused_ids(self, limit):
+        with self._lock:
+            rows = self._execute(
+                "SELECT id FROM prompts WHERE sequence IS NOT NULL"
+                " ORDER BY sequence DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+        return [prompt_id for prompt_id, in rows]
+
+    def latest(self, limit, cursor=None, fields=None, year=None):
+        start, end = year_bounds(year or datetime.now().year)
+        query = (
+            "SELECT %s FROM prompts WHERE used_at >= ? AND used_at < ?"
+            % PROMPT_COLUMNS
+        )
+        parameters = [start, end]
+
+        if cursor:
+            last_key = decode_cursor(cursor)
+            if not {"used_at", "id"} <= last_key.keys():
+                raise ValueError("Invalid cursor")
+
+            query += " AND (used_at, id) < (?, ?)"
+            parameters += [last_key["used_at"], last_key["id"]]
+
+        # One more than the page, to know if there's another one
+        query += " ORDER BY used_at DESC, id DESC LIMIT ?"
+        parameters.append(limit + 1)
+
+        with self._lock:
+            rows = self._execute(query, parameters).fetchall()
+
+        prompts = [_prompt_from_row(row) for row in rows[:limit]]
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = prompts[-1]
+            next_cursor = self.latest_cursor(last.id, last.used_at)
+
+        return [project(prompt, fields) for prompt in prompts], next_cursor
+
+    def postings(self, token):
+        with self._lock:
+            return dict(
+                self._execute(
+                    "SELECT prompt_id, frequency FROM postings WHERE token = ?",
+                    (token,),
+                )
+            )
+
+    def update_postings(self, removed=(), added=(), documents=0):
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM postings WHERE token = ? AND prompt_id = ?",
+                list(removed),
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO postings (token, prompt_id, frequency)"
+                " VALUES (?, ?, ?)",
+                list(added),
+            )
+            self._add_meta("documents", documents)
+            self._add_meta("version", 1)
+
+    def document_count(self):
+        with self._lock:
+            return self._meta("documents")
+
+    def expire(self, prompt_id, expires_at):
+        with self._lock, self.connection:
+            expired = self._execute(
+                "DELETE FROM prompts WHERE id = ?", (prompt_id,)
+            ).rowcount
+            self._add_meta("version", 1)
+
+        return bool(expired)
+
+    def claim_fingerprint(self, fingerprint, prompt_id):
+        with self._lock, self.connection:
+            self._execute(
+                "INSERT OR IGNORE INTO fingerprints (fingerprint, prompt_id)"
+                " VALUES (?, ?)",
+                (fingerprint, prompt_id),
+            )
+            return self._execute(
+                "SELECT prompt_id FROM fingerprints WHERE fingerprint = ?",
+                (fingerprint,),
+            ).fetchone()[0]
+
+    def release_fingerprint(self, fingerprint, prompt_id):
+        with self._lock, self.connection:
+            self._execute(
+                "DELETE FROM fingerprints"
+                " WHERE fingerprint = ? AND prompt_id = ?",
+                (fingerprint, prompt_id),
+            )
+
+    def latest_cursor(self, prompt_id, used_at):
+        return encode_cursor({"used_at": used_at, "id": prompt_id})
+
+    def version(self):
+        with self._lock:
+            return self._meta("version")
+
+    def scan(self):
+        with self._lock:
+            rows = self._execute(
+                "SELECT %s FROM prompts" % PROMPT_COLUMNS
+            ).fetchall()
+
+        for row in rows:
+            yield _prompt_from_row(row)
@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+from functools import wraps
+
+
+class VersionedCache:
+    """
+    A warm container cache for function results
+
+    Results are reused for ``ttl`` seconds. After that, they are revalidated
+    against a version stamp, and only computed again if it changed.
+
+    Args:
+        version (function): Returns the current version stamp.
+        ttl (float): Seconds to trust a result without checking the version.
+        maxsize (int): Number of results to keep.
+    """
+
+    def __init__(self, version, ttl=60, maxsize=128):
+        self.version = version
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def invalidate(self):
+        self.entries.clear()
+
+    def __call__(self, f):
+        @wraps(f)
+        def cached(*args, **kwargs):
+            key = (f.__qualname__, args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+
+            entry = self.entries.get(key)
+            if entry is not None:
+                version, checked_at, value = entry
+
+                if now - checked_at < self.ttl:
+                    self.entries.move_to_end(key)
+                    return value
+
+                if self.version() == version:
+                    self.entries[key] = (version, now, value)
+                    self.entries.move_to_end(key)
+                    return value
+
+            # Read the version first, so a write that happens while the
+            # result is computed makes it stale
+            version = self.version()
+            value = f(*args, **kwargs)
+
+            self.entries[key] = (version, now, value)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+            return value
+
+        return cached
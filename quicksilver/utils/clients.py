@@ -0,0 +1,83 @@
+import os
+from functools import lru_cache
+
+import boto3
+from botocore.config import Config
+
+from quicksilver.utils import metrics
+
+REQUEST_TIMEOUT = float(os.getenv("PUBLISH_TIMEOUT", "20"))
+LOCAL_DYNAMO_ENDPOINT = "http://docker.for.mac.localhost:8000/"
+
+if os.getenv("AWS_SAM_LOCAL"):
+    os.environ.setdefault("DYNAMO_ENDPOINT", LOCAL_DYNAMO_ENDPOINT)
+
+
+@lru_cache(maxsize=None)
+def s3():
+    """
+    The S3 client, created on first use and kept for the container.
+    """
+    return boto3.client(
+        "s3",
+        config=Config(connect_timeout=5, read_timeout=REQUEST_TIMEOUT),
+    )
+
+
+@lru_cache(maxsize=None)
+def dynamodb():
+    """
+    The DynamoDB resource, created on first use and kept for the container.
+    Set ``DYNAMO_ENDPOINT`` to use DynamoDB Local.
+    """
+    return boto3.resource(
+        "dynamodb", endpoint_url=os.getenv("DYNAMO_ENDPOINT") or None
+    )
+
+
+def call_dynamodb(method, **kwargs):
+    """
+    Calls a DynamoDB method inside a metrics span, with its consumed capacity
+    """
+    with metrics.span("dynamodb." + method.__name__) as span:
+        response = method(ReturnConsumedCapacity="TOTAL", **kwargs)
+
+        consumed = response.get("ConsumedCapacity", [])
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+        span.record(
+            capacity=sum(float(c.get("CapacityUnits", 0)) for c in consumed)
+        )
+
+    return response
+
+
+@lru_cache(maxsize=None)
+def http():
+    """
+    A requests session, created on first use and kept for the container, so
+    warm invocations reuse its connections.
+    """
+    # Imported here so only the functions that make HTTP calls pay for it
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+
+@lru_cache(maxsize=None)
+def sqs():
+    """
+    The SQS client, created on first use and kept for the container.
+    """
+    return boto3.client("sqs", config=Config(connect_timeout=5))
+
+
+@lru_cache(maxsize=None)
+def ssm():
+    """
+    The SSM client, created on first use and kept for the container.
+    """
+    return boto3.client("ssm", config=Config(connect_timeout=5))
@@ -0,0 +1,82 @@
+import gzip
+import os
+from functools import lru_cache
+
+# Bodies smaller than this aren't worth the CPU, and may even grow
+MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+
+@lru_cache(maxsize=None)
+def _brotli():
+    """
+    The brotli module, or ``None`` if it isn't installed.
+    """
+    # Imported here so only the functions that compress pay for it
+    try:
+        import brotli
+    except ImportError:
+        return None
+
+    return brotli
+
+
+def _codings(accept_encoding):
+    """
+    The content codings in an Accept-Encoding header, with their q-values
+    """
+    codings = {}
+    for part in accept_encoding.split(","):
+        coding, *parameters = [p.strip() for p in part.split(";")]
+        if not coding:
+            continue
+
+        q = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+
+        codings[coding.lower()] = q
+
+    return codings
+
+
+def negotiate(accept_encoding):
+    """
+    Picks the encoding for a response.
+
+    Args:
+        accept_encoding (str): The request's Accept-Encoding header.
+
+    Returns:
+        ``"br"`` or ``"gzip"``, or ``None`` to leave the body as is. Brotli
+        wins ties, when it's installed.
+    """
+    if not accept_encoding:
+        return None
+
+    codings = _codings(accept_encoding)
+    available = ["br", "gzip"] if _brotli() else ["gzip"]
+
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = codings.get(encoding, codings.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+
+    return best
+
+
+def compress(data, encoding):
+    """
+    Compresses ``data`` with an encoding picked by :func:`negotiate`.
+    """
+    if encoding == "br":
+        return _brotli().compress(data, quality=BROTLI_QUALITY)
+
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
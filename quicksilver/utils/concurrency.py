@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    TimeoutError as FutureTimeoutError,
+)
+
+
+def run_concurrently(tasks, timeout):
+    """
+    Runs tasks on a thread pool, waiting for each one up to its own timeout
+
+    A task that fails or times out doesn't stop the others. Tasks that time
+    out keep running in the background, but their results are dropped.
+
+    Args:
+        tasks (dict): Task names to functions that take no arguments.
+        timeout (float or dict): Seconds to wait for every task, or a dict
+        with the seconds to wait for each one of them.
+
+    Returns:
+        A tuple of two dicts, with the results of the tasks that succeeded
+        and the exceptions of the ones that failed, keyed by task name.
+    """
+    if not isinstance(timeout, dict):
+        timeout = {name: timeout for name in tasks}
+
+    results = {}
+    errors = {}
+
+    executor = ThreadPoolExecutor(max_workers=max(len(tasks), 1))
+    started_at = time.monotonic()
+    try:
+        futures = {name: executor.submit(task) for name, task in tasks.items()}
+
+        for name, future in futures.items():
+            remaining = started_at + timeout[name] - time.monotonic()
+            try:
+                results[name] = future.result(timeout=max(remaining, 0))
+            except FutureTimeoutError:
+                errors[name] = TimeoutError(
+                    "{name} took longer than {timeout}s".format(
+                        name=name, timeout=timeout[name]
+                    )
+                )
+            except Exception as e:
+                errors[name] = e
+    finally:
+        executor.shutdown(wait=False)
+
+    return results, errors
@@ -1,15 +1,21 @@
+import base64
+import hashlib
 import json
 import os
 from functools import wraps
 
 import attr
 import structlog
-from inflection import camelize, underscore
 
 import quicksilver.logconfig as logconfig
+from quicksilver.utils import compression, metrics, ratelimit
+from quicksilver.utils.serialization import dumps, underscore_key
 
 logger = structlog.get_logger(__name__)
 
+# The API's BinaryMediaTypes in template.yaml
+BINARY_MEDIA_TYPES = ("application/json",)
+
 
 @attr.s
 class Response:
@@ -25,27 +31,135 @@ class Response:
             "Access-Control-Allow-Headers": "Authorization",
         }
     )
+    is_base64_encoded = attr.ib(default=False)
 
     def set_cookie(self, name, value):
         self.headers["Set-Cookie"] = name + "=" + value
         return self
 
+    def etag(self):
+        """
+        A strong entity tag for the body
+        """
+        digest = hashlib.blake2b(self.body.encode(), digest_size=16)
+        return '"%s"' % digest.hexdigest()
+
+    def compress(self, encoding):
+        """
+        Compresses the body, which is then base64 encoded for API Gateway
+        """
+        with metrics.span("compress") as span:
+            data = compression.compress(self.body.encode(), encoding)
+            span.record(payload_bytes=len(data))
+
+        self.body = base64.b64encode(data).decode()
+        self.is_base64_encoded = True
+        self.headers["Content-Encoding"] = encoding
+
+        # The compressed body is equivalent, but not byte for byte the same
+        if self.headers.get("ETag", "").startswith('"'):
+            self.headers["ETag"] = "W/" + self.headers["ETag"]
+
+        return self
+
     def asdict(self):
         response = {"statusCode": self.status_code}
         if self.body is not None:
             response["body"] = self.body
+        if self.is_base64_encoded:
+            response["isBase64Encoded"] = True
         if len(self.headers) != 0:
             response["headers"] = self.headers
 
         return response
 
 
-def api_handler(*args, model=None):
+def build_model(model, fields):
+    """
+    Builds a model instance from a JSON object with camel case fields,
+    leaving out the ones marked as ``server_only`` in their metadata
+    """
+    if not isinstance(fields, dict):
+        raise TypeError("Expected an object, got %r" % (fields,))
+
+    server_only = {
+        field.name
+        for field in attr.fields(model)
+        if field.metadata.get("server_only")
+    }
+    fields = {underscore_key(k): v for k, v in fields.items()}
+    return model(**{k: v for k, v in fields.items() if k not in server_only})
+
+
+def _header(event, name):
+    """
+    A request header, looked up regardless of case
+    """
+    name = name.lower()
+    for header, value in (event.get("headers", {}) or {}).items():
+        if header.lower() == name:
+            return value
+
+    return None
+
+
+def _accepts_binary(event):
+    """
+    Whether API Gateway decodes a base64 encoded body for the request, which
+    it does when the first type in its Accept header is one of the API's
+    binary media types.
+    """
+    accept = _header(event, "Accept") or ""
+    first = accept.split(",")[0].split(";")[0].strip().lower()
+    return first in BINARY_MEDIA_TYPES
+
+
+def _etag_matches(if_none_match, etag):
+    if if_none_match is None:
+        return False
+
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or "W/" + etag in tags
+
+
+def _body_digest(response):
+    """
+    The size of a response's body, and a short hash of it, or ``None`` for
+    both if it has none.
+    """
+    if response.body is None:
+        return None, None
+
+    body = response.body.encode()
+    return len(body), hashlib.blake2b(body, digest_size=8).hexdigest()
+
+
+def _for_item(message, index):
+    if index is None:
+        return message
+
+    return "Item {index}: {message}".format(index=index, message=message)
+
+
+def api_handler(
+    *args, model=None, many=False, cache_control=None, rate_limit=None
+):
     """
     A decorator for API call handlers
 
+    Successful GET responses carry an ETag, and requests with a matching
+    If-None-Match header get a 304 without a body. Bodies over
+    ``compression.MIN_SIZE`` are compressed if the request's Accept-Encoding
+    allows it, and its Accept header asks for JSON first, which makes API
+    Gateway decode them.
+
     Args:
         model (class): An attr class to build an instance from JSON body.
+        many (bool): Whether the JSON body is a list of ``model`` instances.
+        cache_control (str): Cache-Control header for successful GET
+        responses.
+        rate_limit (RateLimiter): Turns requests away with a 429 when their
+        buckets are empty. Requests with ``many`` take a token per item.
     """
 
     def to_handler(f):
@@ -65,9 +179,11 @@ def api_handler(*args, model=None):
                 method=event["httpMethod"],
                 resource=event["resource"],
             )
+            metrics.bind(handler=f.__name__, request_id=context.aws_request_id)
 
-            # Query parameters
+            # Query and path parameters
             query_parameters = event.get("queryStringParameters", {}) or {}
+            path_parameters = event.get("pathParameters", {}) or {}
 
             # Authorization
             auth_context = event.get("requestContext", {}).get(
@@ -79,18 +195,29 @@ def api_handler(*args, model=None):
 
             # Model
             if model:
+                index = None
                 try:
-                    instance = model(
-                        **{
-                            underscore(k): v
-                            for k, v in json.loads(event["body"]).items()
-                        }
-                    )
+                    body = event["body"]
+                    if event.get("isBase64Encoded"):
+                        body = base64.b64decode(body).decode()
+                    body = json.loads(body)
+
+                    if many:
+                        if not isinstance(body, list):
+                            raise TypeError("Expected a list, got %r" % body)
+
+                        instance = []
+                        for index, fields in enumerate(body):
+                            instance.append(build_model(model, fields))
+                    else:
+                        instance = build_model(model, body)
+
                 except TypeError as e:
                     logger.error(
                         "Invalid model fields",
                         model=model,
                         body=event["body"],
+                        index=index,
                         exc_info=e,
                     )
 
@@ -98,8 +225,11 @@ def api_handler(*args, model=None):
                         status_code=400,
                         body=json.dumps(
                             {
-                                "message": "Invalid {model}".format(
-                                    model=model.__name__
+                                "message": _for_item(
+                                    "Invalid {model}".format(
+                                        model=model.__name__
+                                    ),
+                                    index,
                                 )
                             }
                         ),
@@ -109,17 +239,41 @@ def api_handler(*args, model=None):
                         "Invalid model",
                         model=model,
                         body=event["body"],
+                        index=index,
                         exc_info=e,
                     )
                     return Response(
                         status_code=400,
-                        body=json.dumps({"message": str(e)}),
+                        body=json.dumps({"message": _for_item(str(e), index)}),
                     ).asdict()
 
+            # Admission, which costs a token for each item of the body
+            if rate_limit is not None:
+                source_ip = (
+                    event.get("requestContext", {})
+                    .get("identity", {})
+                    .get("sourceIp")
+                )
+                tokens = max(len(instance), 1) if model and many else 1
+                retry_after = rate_limit.check(source_ip, tokens)
+                if retry_after is not None:
+                    log.warning(
+                        "Rate limited", source_ip=source_ip, tokens=tokens
+                    )
+                    response = Response(
+                        status_code=429,
+                        body=json.dumps({"message": "Too many requests"}),
+                    )
+                    response.headers["Retry-After"] = (
+                        ratelimit.retry_after_header(retry_after)
+                    )
+                    return response.asdict()
+
             try:
                 args = [instance] if model else []
                 kwargs = {
                     **query_parameters,
+                    **path_parameters,
                     **(
                         {"auth_context": auth_context}
                         if auth_context
@@ -128,7 +282,8 @@ def api_handler(*args, model=None):
                     ),
                 }
 
-                response = f(*args, **kwargs)
+                with metrics.span("handler"):
+                    response = f(*args, **kwargs)
 
             except TypeError as e:
                 logger.error(
@@ -152,43 +307,61 @@ def api_handler(*args, model=None):
             if response is None:
                 response = Response(status_code=404)
 
-            elif isinstance(response, dict):
-                body = json.dumps(
-                    {
-                        camelize(k, uppercase_first_letter=False): v
-                        for k, v in response.items()
-                    }
-                )
+            elif not isinstance(response, Response):
+                with metrics.span("serialize") as span:
+                    body = dumps(response)
+                    span.record(payload_bytes=len(body))
                 response = Response(status_code=200, body=body)
 
-            elif isinstance(response, list):
-                body = json.dumps(
-                    [
-                        {
-                            camelize(k, uppercase_first_letter=False): v
-                            for k, v in item.asdict().items()
-                        }
-                        for item in response
-                    ]
-                )
-                response = Response(status_code=200, body=body)
+            # Compression is negotiated before a 304 drops the body, so the
+            # 304 varies on the same headers as the full response
+            encoding = None
+            if (
+                response.body is not None
+                and not response.is_base64_encoded
+                and len(response.body) >= compression.MIN_SIZE
+            ):
+                response.headers["Vary"] = "Accept, Accept-Encoding"
+                if _accepts_binary(event):
+                    encoding = compression.negotiate(
+                        _header(event, "Accept-Encoding")
+                    )
 
-            elif not isinstance(response, Response):
-                body = json.dumps(
-                    {
-                        camelize(k, uppercase_first_letter=False): v
-                        for k, v in response.asdict().items()
-                    }
-                )
-                response = Response(status_code=200, body=body)
+            # Conditional requests
+            if (
+                event["httpMethod"] == "GET"
+                and response.status_code == 200
+                and response.body is not None
+            ):
+                etag = response.etag()
+                response.headers["ETag"] = etag
+                if cache_control:
+                    response.headers["Cache-Control"] = cache_control
+
+                if _etag_matches(_header(event, "If-None-Match"), etag):
+                    response = Response(
+                        status_code=304, headers=dict(response.headers)
+                    )
 
-            if 200 <= response.status_code < 300:
-                logger.info(
-                    "Success", response=response, status=response.status_code
+            if encoding and response.body is not None:
+                response.compress(encoding)
+
+            if response.status_code >= 400:
+                # Kept whatever the sample, like the errors behind them
+                logger.warning(
+                    "Failure", status=response.status_code, body=response.body
                 )
-            else:
+            elif logconfig.sampled(context.aws_request_id):
+                # The body's size and hash, which are enough to tell
+                # responses apart, instead of the body itself. Only worked
+                # out for the requests whose logs are kept.
+                body_bytes, body_hash = _body_digest(response)
                 logger.info(
-                    "Failure", response=response, status=response.status_code
+                    "Success",
+                    status=response.status_code,
+                    body_bytes=body_bytes,
+                    body_hash=body_hash,
+                    encoding=response.headers.get("Content-Encoding"),
                 )
 
             return response.asdict()
@@ -0,0 +1,117 @@
+import os
+import time
+from contextlib import ContextDecorator
+
+import structlog
+
+NAMESPACE = os.getenv("METRICS_NAMESPACE", "Quicksilver")
+DIMENSIONS = ["handler", "span"]
+UNITS = {
+    "Latency": "Milliseconds",
+    "ConsumedCapacity": "Count",
+    "PayloadBytes": "Bytes",
+}
+
+# Properties of the current invocation, added to every span. Lambda runs one
+# invocation at a time per container, and spans may run on other threads.
+_properties = {}
+
+# CloudWatch only extracts metrics from lines that are a bare JSON object,
+# so these skip the standard library logging setup.
+_emitter = structlog.wrap_logger(
+    structlog.PrintLogger(),
+    wrapper_class=structlog.BoundLogger,
+    processors=[structlog.processors.JSONRenderer()],
+)
+
+
+def bind(**properties):
+    """
+    Sets the properties of the current invocation, like ``handler`` and
+    ``request_id``, replacing the previous ones.
+    """
+    _properties.clear()
+    _properties.update(properties)
+
+
+def emit(name, **metrics):
+    """
+    Writes a span's metrics in CloudWatch Embedded Metric Format.
+
+    Args:
+        name (str): The span name.
+        metrics: Values for the metrics in ``UNITS``. The ones that are
+        ``None`` are left out.
+    """
+    values = {
+        metric: value for metric, value in metrics.items() if value is not None
+    }
+
+    _emitter.msg(
+        _aws={
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [DIMENSIONS],
+                    "Metrics": [
+                        {"Name": metric, "Unit": UNITS[metric]}
+                        for metric in values
+                    ],
+                }
+            ],
+        },
+        handler=_properties.get("handler", "unknown"),
+        span=name,
+        **{k: v for k, v in _properties.items() if k != "handler"},
+        **values,
+    )
+
+
+class span(ContextDecorator):
+    """
+    Times a block of code, or every call of a decorated function, and emits
+    its latency along with whatever else it records.
+
+    Usage::
+
+        with metrics.span("dynamodb.query") as s:
+            response = table.query(...)
+            s.record(capacity=1.5)
+
+        @metrics.span("s3.put_object")
+        def store(text, img_bytes): ...
+
+    Args:
+        name (str): The span name, which is a metric dimension.
+        capacity (float): Consumed DynamoDB capacity units.
+        payload_bytes (int): Size of the data sent or received.
+    """
+
+    def __init__(self, name, capacity=None, payload_bytes=None):
+        self.name = name
+        self.capacity = capacity
+        self.payload_bytes = payload_bytes
+
+    def record(self, capacity=None, payload_bytes=None):
+        if capacity is not None:
+            self.capacity = (self.capacity or 0) + capacity
+        if payload_bytes is not None:
+            self.payload_bytes = (self.payload_bytes or 0) + payload_bytes
+
+    def _recreate_cm(self):
+        # Each call of a decorated function gets its own span
+        return span(self.name, self.capacity, self.payload_bytes)
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        emit(
+            self.name,
+            Latency=(time.perf_counter() - self.started_at) * 1000,
+            ConsumedCapacity=self.capacity,
+            PayloadBytes=self.payload_bytes,
+        )
+        return False
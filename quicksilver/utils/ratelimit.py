@@ -0,0 +1,215 @@
+"""
+Token buckets kept in DynamoDB, so every container shares them.
+
+A bucket with ``capacity`` tokens that refills at ``rate`` tokens a second
+is stored as the time it would be full again, its theoretical arrival
+time. Each request moves it one interval (``1 / rate``) forward for every
+token it takes, and is turned away if that puts it more than ``capacity``
+intervals ahead of now. That takes a single conditional update per
+request, with no read first.
+"""
+
+import math
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import attr
+import structlog
+from botocore.exceptions import ClientError
+
+from quicksilver.utils import clients
+
+# An idle bucket is full by then, which is the same as not having an item
+EXPIRY_MARGIN = 60
+MAX_ATTEMPTS = 3
+# Rejected keys remembered in the container
+BLOCKED_MAXSIZE = 1024
+
+START = "SET tat = :tat, expires_at = :expires_at"
+START_CONDITION = "attribute_not_exists(tat) OR tat <= :now"
+ADVANCE = "SET tat = tat + :interval, expires_at = :expires_at"
+ADVANCE_CONDITION = "tat > :now AND tat <= :limit"
+
+logger = structlog.get_logger(__name__)
+
+if os.getenv("AWS_SAM_LOCAL"):
+    os.environ.setdefault("RATE_LIMIT_TABLE_NAME", "RateLimitTable")
+
+
+@lru_cache(maxsize=None)
+def _table(name):
+    return clients.dynamodb().Table(name)
+
+
+def _is_conditional_failure(error):
+    return error.response["Error"]["Code"] == "ConditionalCheckFailedException"
+
+
+def _update(table, key, update, condition, values):
+    clients.call_dynamodb(
+        table.update_item,
+        Key={"id": key},
+        UpdateExpression=update,
+        ConditionExpression=condition,
+        ExpressionAttributeValues=values,
+    )
+
+
+@attr.s(frozen=True)
+class TokenBucket:
+    """
+    Allows ``capacity`` requests at once, and ``rate`` a second after that.
+    """
+
+    capacity = attr.ib(converter=float)
+    rate = attr.ib(converter=float)
+
+    @property
+    def interval_ms(self):
+        return int(1000 / self.rate)
+
+
+@attr.s
+class RateLimiter:
+    """
+    Token buckets for each source IP and for everyone, in the table named by
+    ``RATE_LIMIT_TABLE_NAME``. Without a table, every request is let in.
+
+    Args:
+        name (str): Prefix of the bucket keys, so limiters don't share them.
+        per_ip (TokenBucket): The bucket of each source IP.
+        overall (TokenBucket): The bucket of all requests.
+    """
+
+    name = attr.ib()
+    per_ip = attr.ib(default=None)
+    overall = attr.ib(default=None)
+    table_name = attr.ib(
+        default=attr.Factory(lambda: os.getenv("RATE_LIMIT_TABLE_NAME"))
+    )
+    # Keys to monotonic times until which they are known to be empty
+    blocked = attr.ib(factory=OrderedDict, repr=False)
+
+    def _buckets(self, source_ip):
+        buckets = []
+        if self.per_ip is not None and source_ip:
+            buckets.append(("%s#ip#%s" % (self.name, source_ip), self.per_ip))
+        if self.overall is not None:
+            buckets.append(("%s#all" % self.name, self.overall))
+
+        return buckets
+
+    def _block(self, key, retry_after):
+        self.blocked[key] = time.monotonic() + retry_after
+        self.blocked.move_to_end(key)
+        if len(self.blocked) > BLOCKED_MAXSIZE:
+            self.blocked.popitem(last=False)
+
+    def _take(self, key, bucket, tokens=1):
+        """
+        Takes ``tokens`` from a bucket. Taking more than it holds needs it
+        full, and empties it.
+
+        Returns:
+            ``None`` if there were enough, or the seconds until there are.
+        """
+        table = _table(self.table_name)
+        interval = bucket.interval_ms
+        burst = int(bucket.capacity * interval)
+        cost = int(min(tokens, bucket.capacity) * interval)
+
+        for _ in range(MAX_ATTEMPTS):
+            now = int(time.time() * 1000)
+            expires_at = (now + burst) // 1000 + EXPIRY_MARGIN
+
+            try:
+                # Idle long enough to be full
+                _update(
+                    table,
+                    key,
+                    START,
+                    START_CONDITION,
+                    {
+                        ":tat": now + cost,
+                        ":now": now,
+                        ":expires_at": expires_at,
+                    },
+                )
+                return None
+            except ClientError as e:
+                if not _is_conditional_failure(e):
+                    raise
+
+            try:
+                # Still has tokens
+                _update(
+                    table,
+                    key,
+                    ADVANCE,
+                    ADVANCE_CONDITION,
+                    {
+                        ":interval": cost,
+                        ":now": now,
+                        ":limit": now + burst - cost,
+                        ":expires_at": expires_at,
+                    },
+                )
+                return None
+            except ClientError as e:
+                if not _is_conditional_failure(e):
+                    raise
+
+            item = clients.call_dynamodb(
+                table.get_item, Key={"id": key}, ConsistentRead=True
+            )
+            tat = int(item.get("Item", {}).get("tat", 0))
+            if tat > now + burst - cost:
+                return (tat - (now + burst - cost)) / 1000
+
+            # It refilled in between, try again
+
+        return None
+
+    def check(self, source_ip, tokens=1):
+        """
+        Takes ``tokens`` from each bucket of a request.
+
+        Returns:
+            ``None`` if the request can go ahead, or the seconds to wait
+            before trying again.
+        """
+        if not self.table_name:
+            return None
+
+        now = time.monotonic()
+        for key, bucket in self._buckets(source_ip):
+            until = self.blocked.get(key)
+            if until is not None:
+                if until > now:
+                    return until - now
+                del self.blocked[key]
+
+            try:
+                retry_after = self._take(key, bucket, tokens)
+            except ClientError as e:
+                # Better to let requests in than to turn everyone away
+                logger.error("Rate limit failure", key=key, exc_info=e)
+                return None
+
+            if retry_after is not None:
+                if tokens == 1:
+                    # A bigger request can be turned away while there are
+                    # still tokens for smaller ones
+                    self._block(key, retry_after)
+                return retry_after
+
+        return None
+
+
+def retry_after_header(seconds):
+    """
+    The value of a Retry-After header, in whole seconds
+    """
+    return str(max(1, math.ceil(seconds)))
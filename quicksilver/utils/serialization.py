@@ -0,0 +1,102 @@
+import json
+from functools import lru_cache
+
+import attr
+from inflection import camelize, underscore
+
+_encoder = json.JSONEncoder()
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+@lru_cache(maxsize=None)
+def camelize_key(key):
+    return camelize(key, uppercase_first_letter=False)
+
+
+@lru_cache(maxsize=None)
+def underscore_key(key):
+    return underscore(key)
+
+
+@lru_cache(maxsize=None)
+def _compile(cls):
+    """
+    Compiles a writer for instances of an attrs class
+
+    The camelized field names are encoded once, so writing an instance only
+    takes its field values.
+    """
+    names = [field.name for field in attr.fields(cls)]
+    prefixes = [
+        ("{" if i == 0 else ", ") + _encode_string(camelize_key(name)) + ": "
+        for i, name in enumerate(names)
+    ]
+    fields = list(zip(prefixes, names))
+
+    def write(instance, chunks):
+        if not fields:
+            chunks.append("{}")
+            return
+
+        for prefix, name in fields:
+            chunks.append(prefix)
+            _write(getattr(instance, name), chunks)
+        chunks.append("}")
+
+    return write
+
+
+def _write_dict(value, chunks):
+    if not value:
+        chunks.append("{}")
+        return
+
+    separator = "{"
+    for k, v in value.items():
+        chunks.append(separator)
+        chunks.append(_encode_string(camelize_key(k)))
+        chunks.append(": ")
+        _write(v, chunks)
+        separator = ", "
+    chunks.append("}")
+
+
+def _write(value, chunks):
+    if isinstance(value, str):
+        chunks.append(_encode_string(value))
+
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            chunks.append("[]")
+            return
+
+        separator = "["
+        for item in value:
+            chunks.append(separator)
+            _write(item, chunks)
+            separator = ", "
+        chunks.append("]")
+
+    elif isinstance(value, dict):
+        _write_dict(value, chunks)
+
+    elif attr.has(type(value)):
+        _compile(type(value))(value, chunks)
+
+    elif hasattr(value, "asdict"):
+        _write_dict(value.asdict(), chunks)
+
+    else:
+        chunks.append(_encoder.encode(value))
+
+
+def dumps(value):
+    """
+    Serializes a handler's return value to JSON
+
+    Models and dictionaries are written with camelized field names,
+    recursively. Writers for attrs classes are compiled once per class.
+    """
+    chunks = []
+    _write(value, chunks)
+    return "".join(chunks)
@@ -0,0 +1,243 @@
+"""
+Serves the API handlers over plain HTTP, for local load testing.
+
+Each request is turned into the API Gateway proxy event that
+``api_handler`` expects, and its response back into an HTTP one. Requests
+are handled by a pool of threads, like warm Lambda containers sharing the
+same process.
+
+Usage:
+
+    PROMPT_STORE=sqlite python -m quicksilver.utils.wsgi [--port 8000]
+"""
+
+import argparse
+import base64
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import attr
+
+import quicksilver
+
+# Method, resource and handler name, as in template.yaml
+ROUTES = [
+    ("POST", "/prompt", "save_prompt"),
+    ("POST", "/prompts", "save_prompts"),
+    ("GET", "/prompt", "get_latest_prompts"),
+    ("GET", "/prompt/{prompt_id}", "get_prompt"),
+    ("GET", "/stats", "get_stats"),
+]
+# Like the API's functions
+TIMEOUT_MS = 300000
+_PARAMETER = re.compile(r"\{(\w+)\}")
+
+
+@attr.s
+class Context:
+    """
+    The parts of the Lambda context the handlers use
+    """
+
+    aws_request_id = attr.ib(factory=lambda: str(uuid.uuid4()))
+    deadline = attr.ib(
+        factory=lambda: time.monotonic() + TIMEOUT_MS / 1000, repr=False
+    )
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+def _pattern(resource):
+    # Literal parts and parameter names alternate
+    parts = _PARAMETER.split(resource)
+    return re.compile(
+        "^%s$"
+        % "".join(
+            "(?P<%s>[^/]+)" % part if i % 2 else re.escape(part)
+            for i, part in enumerate(parts)
+        )
+    )
+
+
+def _headers(environ):
+    headers = {
+        key[5:].replace("_", "-").title(): value
+        for key, value in environ.items()
+        if key.startswith("HTTP_")
+    }
+    for key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+        if environ.get(key):
+            headers[key.replace("_", "-").title()] = environ[key]
+
+    return headers
+
+
+def _body(environ):
+    """
+    The request body as API Gateway passes it, and whether it's base64
+    encoded.
+    """
+    length = int(environ.get("CONTENT_LENGTH") or 0)
+    if not length:
+        return None, False
+
+    data = environ["wsgi.input"].read(length)
+    try:
+        return data.decode(), False
+    except UnicodeDecodeError:
+        return base64.b64encode(data).decode(), True
+
+
+@attr.s
+class Application:
+    """
+    A WSGI application that routes requests to the handlers in ``routes``.
+    """
+
+    routes = attr.ib(default=ROUTES)
+    _compiled = attr.ib(init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self._compiled = [
+            (method, resource, _pattern(resource), name)
+            for method, resource, name in self.routes
+        ]
+
+    def _route(self, method, path):
+        for route_method, resource, pattern, name in self._compiled:
+            match = pattern.match(path)
+            if route_method == method and match:
+                return resource, match.groupdict(), name
+
+        return None, None, None
+
+    def event(self, environ):
+        """
+        The API Gateway proxy event for a request, and its handler's name.
+        """
+        method = environ["REQUEST_METHOD"]
+        path = environ.get("PATH_INFO") or "/"
+        resource, path_parameters, name = self._route(method, path)
+
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        body, is_base64_encoded = _body(environ)
+
+        return (
+            {
+                "httpMethod": method,
+                "resource": resource,
+                "path": path,
+                "pathParameters": path_parameters or None,
+                "queryStringParameters": {
+                    key: values[-1] for key, values in query.items()
+                }
+                or None,
+                "multiValueQueryStringParameters": query or None,
+                "headers": _headers(environ),
+                "body": body,
+                "isBase64Encoded": is_base64_encoded,
+                "requestContext": {
+                    "httpMethod": method,
+                    "resourcePath": resource,
+                    "stage": "local",
+                    "identity": {"sourceIp": environ.get("REMOTE_ADDR")},
+                },
+            },
+            name,
+        )
+
+    def __call__(self, environ, start_response):
+        event, name = self.event(environ)
+
+        if name is None:
+            response = {"statusCode": 404, "body": '{"message":"Not Found"}'}
+        else:
+            handler = getattr(quicksilver, name)
+            response = handler(event, Context())
+
+        status = HTTPStatus(response["statusCode"])
+        headers = [
+            (header, value)
+            for header, value in (response.get("headers") or {}).items()
+            if value is not None
+        ]
+
+        body = response.get("body")
+        if body is None:
+            data = b""
+        elif response.get("isBase64Encoded"):
+            data = base64.b64decode(body)
+        else:
+            data = body.encode()
+
+        headers.append(("Content-Length", str(len(data))))
+        if data and not any(h.lower() == "content-type" for h, _ in headers):
+            headers.append(("Content-Type", "application/json"))
+
+        start_response("%d %s" % (status, status.phrase), headers)
+        return [data]
+
+
+class PooledWSGIServer(ThreadingMixIn, WSGIServer):
+    """
+    A WSGI server that handles requests in a fixed pool of threads, instead
+    of a new thread for each one.
+    """
+
+    workers = 8
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def make_app_server(host="127.0.0.1", port=8000, workers=8, quiet=False):
+    """
+    A server for the API, ready to ``serve_forever()``. Port ``0`` picks a
+    free one, in ``server.server_port``.
+    """
+    server_class = type(
+        "PooledWSGIServer", (PooledWSGIServer,), {"workers": workers}
+    )
+    return make_server(
+        host,
+        port,
+        Application(),
+        server_class=server_class,
+        handler_class=_QuietHandler if quiet else WSGIRequestHandler,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with make_app_server(args.host, args.port, args.workers) as server:
+        print("Serving on http://%s:%d" % server.server_address)
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
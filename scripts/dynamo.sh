@@ -1,3 +1,5 @@
 #!/bin/bash
 
-aws dynamodb create-table --table-name PromptTable --attribute-definitions AttributeName=id,AttributeType=S AttributeName=created_at,AttributeType=N AttributeName=used_at,AttributeType=N --key-schema AttributeName=id,KeyType=HASH --global-secondary-indexes IndexName=created_at,KeySchema=[\{AttributeName=id,KeyType=HASH\},\{AttributeName=created_at,KeyType=RANGE\}],Projection=\{ProjectionType=INCLUDE,NonKeyAttributes=used_at\},ProvisionedThroughput=\{ReadCapacityUnits=5,WriteCapacityUnits=5\} IndexName=used_at,KeySchema=[\{AttributeName=id,KeyType=HASH\},\{AttributeName=used_at,KeyType=RANGE\}],Projection=\{ProjectionType=ALL\},ProvisionedThroughput=\{ReadCapacityUnits=5,WriteCapacityUnits=5\} --provisioned-throughput ReadCapacityUnits=5,WriteCapacityUnits=5 --endpoint http://localhost:8000
+aws dynamodb create-table --table-name PromptTable --attribute-definitions AttributeName=id,AttributeType=S AttributeName=created_at,AttributeType=N AttributeName=used_at,AttributeType=N AttributeName=used_year,AttributeType=N AttributeName=unused_block,AttributeType=N AttributeName=token,AttributeType=S --key-schema AttributeName=id,KeyType=HASH --global-secondary-indexes IndexName=unused,KeySchema=[\{AttributeName=unused_block,KeyType=HASH\},\{AttributeName=created_at,KeyType=RANGE\}],Projection=\{ProjectionType=KEYS_ONLY\},ProvisionedThroughput=\{ReadCapacityUnits=5,WriteCapacityUnits=5\} IndexName=latest,KeySchema=[\{AttributeName=used_year,KeyType=HASH\},\{AttributeName=used_at,KeyType=RANGE\}],Projection=\{ProjectionType=ALL\},ProvisionedThroughput=\{ReadCapacityUnits=5,WriteCapacityUnits=5\} IndexName=search,KeySchema=[\{AttributeName=token,KeyType=HASH\}],Projection=\{ProjectionType=INCLUDE,NonKeyAttributes=[prompt_id,frequency]\},ProvisionedThroughput=\{ReadCapacityUnits=5,WriteCapacityUnits=5\} --provisioned-throughput ReadCapacityUnits=5,WriteCapacityUnits=5 --endpoint http://localhost:8000
+aws dynamodb create-table --table-name StatsTable --attribute-definitions AttributeName=id,AttributeType=S --key-schema AttributeName=id,KeyType=HASH --provisioned-throughput ReadCapacityUnits=5,WriteCapacityUnits=5 --endpoint http://localhost:8000
+aws dynamodb create-table --table-name RateLimitTable --attribute-definitions AttributeName=id,AttributeType=S --key-schema AttributeName=id,KeyType=HASH --provisioned-throughput ReadCapacityUnits=5,WriteCapacityUnits=5 --endpoint http://localhost:8000
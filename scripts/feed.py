@@ -0,0 +1,13 @@
+"""
+Writes the static feed of latest prompts from scratch, e.g. to start it
+off or to repair it.
+
+Usage:
+
+    DYNAMO_TABLE_NAME=AvatarPrompt-Prod AVATAR_BUCKET=<bucket> python scripts/feed.py
+"""
+
+from quicksilver import feed
+
+if __name__ == "__main__":
+    feed.rebuild()
@@ -0,0 +1,14 @@
+"""
+Claims the text fingerprint of every prompt, and lists the duplicates it
+finds. The oldest prompt with a text keeps it.
+
+Usage:
+
+    DYNAMO_TABLE_NAME=AvatarPrompt-Prod python scripts/fingerprints.py
+"""
+
+from quicksilver.repository import Prompts
+
+if __name__ == "__main__":
+    for prompt_id, original_id in Prompts.backfill_fingerprints().items():
+        print(prompt_id, original_id)
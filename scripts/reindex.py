@@ -0,0 +1,12 @@
+"""
+Rewrites every prompt so it carries the attributes the indexes rely on.
+
+Usage:
+
+    DYNAMO_TABLE_NAME=AvatarPrompt-Prod python scripts/reindex.py
+"""
+
+from quicksilver.repository import Prompts
+
+if __name__ == "__main__":
+    Prompts.reindex()
@@ -0,0 +1,16 @@
+"""
+Counts the prompts already in the table into the stats table, once, right
+after update_stats is deployed. Prompts the stream counted in the last week
+aren't counted again.
+
+Usage:
+
+    DYNAMO_TABLE_NAME=AvatarPrompt-Prod STATS_TABLE_NAME=AvatarStats-Prod \
+        python scripts/seed_stats.py
+"""
+
+from quicksilver import stats
+from quicksilver.stores import get_store
+
+if __name__ == "__main__":
+    print(stats.seed(get_store().scan()))
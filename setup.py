@@ -16,9 +16,11 @@ setup(
         "structlog>=20.1.0",
         "requests>=2.25.1",
         "Mastodon.py>=1.8.0",
-        "banana-dev>=4.0.1",
+        "Pillow>=9.0.0",
     ],
     extras_require={
+        "brotli": ["brotli>=1.0.9"],
+        "orjson": ["orjson>=3.8.0"],
         "dev": [
             "aws-sam-cli>=0.51.0",
             "awscli>=1.18.66",
@@ -29,7 +31,8 @@ setup(
             "flake8>=3.8.2",
             "pytest>=7.2.1",
             "isort>=5.11.4",
-        ]
+            "moto[dynamodb]>=5.0.0",
+        ],
     },
     zip_safe=False,
 )
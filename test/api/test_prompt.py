@@ -0,0 +1,614 @@
+import json
+import time
+from collections import Counter
+from io import BytesIO
+
+import attr
+import pytest
+from botocore.exceptions import ClientError
+from PIL import Image
+
+from quicksilver.api import prompt as api
+from quicksilver.prompt import Prompt
+from quicksilver.publishers import Publisher
+from quicksilver.repository import Prompts
+
+
+@attr.s
+class FakeContext:
+    aws_request_id = attr.ib(default="Test")
+    # Milliseconds left on each call, the last one repeated
+    remaining_ms = attr.ib(factory=lambda: [900000])
+
+    def get_remaining_time_in_millis(self):
+        if len(self.remaining_ms) > 1:
+            return self.remaining_ms.pop(0)
+        return self.remaining_ms[0]
+
+
+@attr.s
+class FakePublisher(Publisher):
+    published = attr.ib(factory=list, kw_only=True)
+
+    def send(self, prompt, img_bytes):
+        self.published.append(prompt.id)
+
+
+@attr.s
+class FakeGeneration:
+    img_bytes = attr.ib()
+    failing = attr.ib(factory=set)
+    slow = attr.ib(factory=set)
+    calls = attr.ib(factory=list)
+
+    def render(self, text, deadline=None, call_id=None, on_start=None):
+        self.calls.append((text, call_id))
+        if text in self.failing:
+            raise RuntimeError("Banana dev failure")
+        if text in self.slow:
+            raise api.generation.GenerationTimeout("some-call")
+
+        return self.img_bytes
+
+
+@pytest.fixture
+def jpeg():
+    buffer = BytesIO()
+    Image.new("RGB", (64, 64), "orange").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def generation(monkeypatch, jpeg):
+    generation = FakeGeneration(jpeg)
+    monkeypatch.setattr(api.generation, "render", generation.render)
+    return generation
+
+
+@pytest.fixture
+def publisher(monkeypatch):
+    publisher = FakePublisher("fake")
+    monkeypatch.setattr(api.publishers, "registry", lambda: (publisher,))
+    return publisher
+
+
+@pytest.fixture
+def prompts(memory_store):
+    prompts = [
+        Prompt(prompt="jairtrejo in the %s" % place, id=place)
+        for place in ("rain", "snow", "sun")
+    ]
+    for prompt in prompts:
+        Prompts.add(prompt)
+
+    return prompts
+
+
+class FakeSQS:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self.messages.append(dict(kwargs, MessageBody=MessageBody))
+
+
+@pytest.fixture
+def sqs(monkeypatch):
+    sqs = FakeSQS()
+    monkeypatch.setenv("PROMPT_QUEUE_URL", "queue")
+    monkeypatch.setattr(api.clients, "sqs", lambda: sqs)
+    return sqs
+
+
+def sqs_event(*prompt_ids):
+    return {
+        "Records": [
+            {
+                "messageId": "message-%s" % prompt_id,
+                "body": json.dumps({"responsePayload": prompt_id}),
+            }
+            for prompt_id in prompt_ids
+        ]
+    }
+
+
+def api_event(method, resource, body=None, query=None):
+    return {
+        "httpMethod": method,
+        "resource": resource,
+        "body": None if body is None else json.dumps(body),
+        "queryStringParameters": query,
+    }
+
+
+def failures(result):
+    return [item["itemIdentifier"] for item in result["batchItemFailures"]]
+
+
+@pytest.mark.usefixtures("s3")
+class TestUpdatePicture:
+    def test_publishes_each_prompt(self, s3, prompts, generation, publisher):
+        result = api.update_picture(sqs_event("rain", "snow"), FakeContext())
+
+        assert failures(result) == []
+        assert "images/rain.jpg" in s3.objects
+        assert publisher.published == ["rain", "snow"]
+        assert Prompts.from_id("rain").used_at is not None
+        assert Prompts.from_id("snow").publications[0]["name"] == "fake"
+        assert Prompts.from_id("sun").used_at is None
+
+    def test_fails_only_the_messages_that_failed(
+        self, prompts, generation, publisher
+    ):
+        generation.failing.add("jairtrejo in the snow")
+
+        result = api.update_picture(
+            sqs_event("rain", "snow", "sun"), FakeContext()
+        )
+
+        assert failures(result) == ["message-snow"]
+        assert publisher.published == ["rain", "sun"]
+        assert Prompts.from_id("snow").used_at is None
+
+    def test_skips_used_prompts(self, prompts, generation, publisher):
+        used = Prompts.from_id("rain")
+        used.use()
+        Prompts.save(used)
+
+        result = api.update_picture(sqs_event("rain", "snow"), FakeContext())
+
+        assert failures(result) == []
+        assert [text for text, _ in generation.calls] == [
+            "jairtrejo in the snow"
+        ]
+        assert publisher.published == ["snow"]
+
+    def test_leaves_the_rest_of_the_batch_near_the_timeout(
+        self, prompts, generation, publisher
+    ):
+        context = FakeContext(
+            remaining_ms=[api.UPDATE_MARGIN_MS + 1, api.UPDATE_MARGIN_MS - 1]
+        )
+
+        result = api.update_picture(sqs_event("rain", "snow", "sun"), context)
+
+        assert failures(result) == ["message-snow", "message-sun"]
+        assert publisher.published == ["rain"]
+        assert Prompts.from_id("snow").used_at is None
+
+
+@pytest.mark.usefixtures("s3")
+class TestResume:
+    def test_fails_while_another_owner_holds_the_lease(
+        self, prompts, generation, publisher
+    ):
+        Prompts.claim("rain", "other", api.LEASE_SECONDS)
+
+        result = api.update_picture(sqs_event("rain"), FakeContext())
+
+        assert failures(result) == ["message-rain"]
+        assert generation.calls == []
+
+    def test_skips_the_steps_already_done(
+        self, s3, prompts, generation, publisher
+    ):
+        Prompts.claim("rain", "earlier", api.LEASE_SECONDS)
+        for step in ("call:some-call", "generated", "uploaded"):
+            Prompts.record_step("rain", "earlier", step)
+        Prompts.release("rain", "earlier")
+
+        result = api.update_picture(sqs_event("rain"), FakeContext())
+
+        assert failures(result) == []
+        assert generation.calls == [("jairtrejo in the rain", "some-call")]
+        assert not any(key.startswith("images/") for key in s3.objects)
+        assert publisher.published == ["rain"]
+        assert Prompts.from_id("rain").used_at is not None
+
+    def test_skips_the_publishers_already_done(
+        self, prompts, generation, publisher
+    ):
+        Prompts.claim("rain", "earlier", api.LEASE_SECONDS)
+        Prompts.record_step("rain", "earlier", api.PUBLISHED_STEP + "fake")
+        Prompts.release("rain", "earlier")
+
+        result = api.update_picture(sqs_event("rain"), FakeContext())
+
+        assert failures(result) == []
+        assert publisher.published == []
+        assert Prompts.from_id("rain").publications == [
+            {"name": "fake", "status": "published"}
+        ]
+
+    def test_returns_at_once_for_finished_prompts(
+        self, prompts, generation, publisher
+    ):
+        finished = Prompts.from_id("rain")
+        finished.use()
+        Prompts.save(finished)
+        # Even with the lease held elsewhere, there's nothing left to do
+        Prompts.claim("rain", "other", api.LEASE_SECONDS)
+
+        result = api.update_picture(sqs_event("rain"), FakeContext())
+
+        assert failures(result) == []
+        assert generation.calls == []
+        assert publisher.published == []
+
+
+@pytest.mark.usefixtures("s3", "prompts", "publisher")
+class TestHandOff:
+    def test_hands_slow_generations_back_to_the_queue(self, generation, sqs):
+        generation.slow.add("jairtrejo in the rain")
+
+        result = api.update_picture(sqs_event("rain"), FakeContext())
+
+        assert failures(result) == []
+        (message,) = sqs.messages
+        assert json.loads(message["MessageBody"]) == {
+            "responsePayload": "rain"
+        }
+        assert message["MessageAttributes"] == {
+            api.HAND_OFFS_ATTRIBUTE: {"DataType": "Number", "StringValue": "1"}
+        }
+
+    def test_counts_the_hand_offs(self, generation, sqs):
+        generation.slow.add("jairtrejo in the rain")
+        event = sqs_event("rain")
+        event["Records"][0]["messageAttributes"] = {
+            api.HAND_OFFS_ATTRIBUTE: {"stringValue": "2", "dataType": "Number"}
+        }
+
+        api.update_picture(event, FakeContext())
+
+        (message,) = sqs.messages
+        attribute = message["MessageAttributes"][api.HAND_OFFS_ATTRIBUTE]
+        assert attribute["StringValue"] == "3"
+
+    def test_fails_the_message_after_too_many_hand_offs(self, generation, sqs):
+        generation.slow.add("jairtrejo in the rain")
+        event = sqs_event("rain")
+        event["Records"][0]["messageAttributes"] = {
+            api.HAND_OFFS_ATTRIBUTE: {
+                "stringValue": str(api.MAX_HAND_OFFS),
+                "dataType": "Number",
+            }
+        }
+
+        result = api.update_picture(event, FakeContext())
+
+        assert failures(result) == ["message-rain"]
+        assert sqs.messages == []
+
+
+class TestSavePrompt:
+    @pytest.fixture(autouse=True)
+    def existing(self, memory_store):
+        return Prompts.add(Prompt(prompt="jairtrejo in the rain", id="rain"))
+
+    def save(self, text):
+        return api.save_prompt(
+            api_event("POST", "/prompt", {"prompt": text}), FakeContext()
+        )
+
+    def test_saves_new_prompts(self):
+        response = self.save("jairtrejo in the snow")
+
+        assert response["statusCode"] == 200
+        saved = json.loads(response["body"])
+        assert Prompts.from_id(saved["id"]).prompt == "jairtrejo in the snow"
+
+    def test_doesnt_overwrite_prompts(self):
+        response = api.save_prompt(
+            api_event(
+                "POST",
+                "/prompt",
+                {"prompt": "jairtrejo in the snow", "id": "rain"},
+            ),
+            FakeContext(),
+        )
+
+        assert response["statusCode"] == 409
+        assert json.loads(response["body"]) == {
+            "message": "Prompt already exists",
+            "id": "rain",
+        }
+        assert Prompts.from_id("rain").prompt == "jairtrejo in the rain"
+
+    def test_ignores_images_in_the_body(self):
+        response = api.save_prompt(
+            api_event(
+                "POST",
+                "/prompt",
+                {"prompt": "jairtrejo in the snow", "images": [{}]},
+            ),
+            FakeContext(),
+        )
+
+        assert response["statusCode"] == 200
+        saved = json.loads(response["body"])
+        assert Prompts.from_id(saved["id"]).images is None
+
+    def test_ignores_publications_in_the_body(self):
+        response = api.save_prompt(
+            api_event(
+                "POST",
+                "/prompt",
+                {"prompt": "jairtrejo in the snow", "publications": [1]},
+            ),
+            FakeContext(),
+        )
+
+        assert response["statusCode"] == 200
+        saved = json.loads(response["body"])
+        assert Prompts.from_id(saved["id"]).publications is None
+
+    def test_rejects_duplicates(self, monkeypatch):
+        monkeypatch.setattr(api, "DUPLICATE_POLICY", "reject")
+
+        response = self.save("jairtrejo in the RAIN!")
+
+        assert response["statusCode"] == 409
+        assert json.loads(response["body"]) == {
+            "message": "Duplicate prompt",
+            "id": "rain",
+        }
+        assert Prompts.unused_count() == 1
+
+    def test_merges_duplicates(self, monkeypatch):
+        monkeypatch.setattr(api, "DUPLICATE_POLICY", "merge")
+
+        response = self.save("jairtrejo in the RAIN!")
+
+        assert response["statusCode"] == 200
+        merged = json.loads(response["body"])
+        assert (merged["id"], merged["prompt"]) == (
+            "rain",
+            "jairtrejo in the rain",
+        )
+        assert Prompts.unused_count() == 1
+
+
+class TestPrerenderPrompts:
+    @pytest.fixture(autouse=True)
+    def model(self, monkeypatch, s3):
+        monkeypatch.setenv("BANANA_MODEL_KEY", "model")
+
+    @pytest.fixture
+    def generate(self, monkeypatch):
+        calls = []
+        outcomes = {}
+
+        def generate(text, deadline=None, call_id=None, on_start=None):
+            calls.append((text, call_id))
+            if call_id is None:
+                on_start("call-%d" % len(calls))
+
+            outcome = outcomes.get(text, b"jpeg")
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        generate.calls = calls
+        generate.outcomes = outcomes
+        monkeypatch.setattr(api.generation, "generate", generate)
+        return generate
+
+    def test_renders_the_uncached_prompts(self, prompts, generate):
+        api.generation.store("jairtrejo in the snow", b"jpeg")
+
+        assert api.prerender_prompts(None, FakeContext()) == 2
+        assert {text for text, _ in generate.calls} == {
+            "jairtrejo in the rain",
+            "jairtrejo in the sun",
+        }
+        assert api.generation.is_cached("jairtrejo in the rain")
+
+    def test_skips_unknown_prompts(self, monkeypatch, prompts, generate):
+        monkeypatch.setattr(
+            Prompts, "newest_unused_ids", lambda limit: ["gone", "rain"]
+        )
+
+        assert api.prerender_prompts(None, FakeContext()) == 1
+
+    def test_goes_on_after_a_failure(self, prompts, generate):
+        generate.outcomes["jairtrejo in the snow"] = RuntimeError("Down")
+
+        assert api.prerender_prompts(None, FakeContext()) == 2
+        assert not api.generation.is_cached("jairtrejo in the snow")
+
+    def test_goes_on_after_an_aws_failure(
+        self, monkeypatch, prompts, generate
+    ):
+        claim = Prompts.claim
+
+        def claim_or_deny(prompt_id, owner, lease_seconds):
+            if prompt_id == "snow":
+                raise ClientError(
+                    {"Error": {"Code": "AccessDeniedException"}}, "UpdateItem"
+                )
+            return claim(prompt_id, owner, lease_seconds)
+
+        monkeypatch.setattr(Prompts, "claim", claim_or_deny)
+
+        assert api.prerender_prompts(None, FakeContext()) == 2
+
+    def test_resumes_the_call_after_a_timeout(self, prompts, generate):
+        newest = Prompts.from_id(Prompts.newest_unused_ids(1)[0])
+        generate.outcomes[newest.prompt] = api.generation.GenerationTimeout(
+            "call-1"
+        )
+
+        assert api.prerender_prompts(None, FakeContext()) == 0
+
+        del generate.outcomes[newest.prompt]
+
+        assert api.prerender_prompts(None, FakeContext()) == 3
+        assert generate.calls[1] == (newest.prompt, "call-1")
+
+
+class TestPickPrompt:
+    def test_doubles_the_chances_of_the_newest_half(
+        self, monkeypatch, memory_store
+    ):
+        for i in range(4):
+            Prompts.add(
+                Prompt(
+                    prompt="jairtrejo %d" % i, id="p%d" % i, created_at=i + 1
+                )
+            )
+        slots = iter(range(6))
+
+        def randrange(stop):
+            assert stop == 6
+            return next(slots)
+
+        monkeypatch.setattr(api.random, "randrange", randrange)
+
+        picked = Counter(
+            api.pick_prompt(None, FakeContext()) for _ in range(6)
+        )
+
+        assert picked == {"p3": 2, "p2": 2, "p1": 1, "p0": 1}
+
+    def test_fails_without_unused_prompts(self, memory_store):
+        Prompts.save(Prompt(prompt="jairtrejo", used_at=1))
+
+        with pytest.raises(RuntimeError):
+            api.pick_prompt(None, FakeContext())
+
+
+class TestSavePrompts:
+    @pytest.fixture(autouse=True)
+    def existing(self, memory_store):
+        return Prompts.add(Prompt(prompt="jairtrejo in the rain", id="rain"))
+
+    def save(self, prompts):
+        return api.save_prompts(
+            api_event("POST", "/prompts", prompts), FakeContext()
+        )
+
+    def test_reports_each_prompt(self):
+        response = self.save(
+            [
+                {"prompt": "jairtrejo in the snow", "id": "snow"},
+                {"prompt": "jairtrejo in the RAIN", "id": "drizzle"},
+                {"prompt": "jairtrejo in the hail", "id": "rain"},
+            ]
+        )
+
+        assert response["statusCode"] == 200
+        assert json.loads(response["body"]) == [
+            {"id": "snow", "status": "saved"},
+            {"id": "drizzle", "status": "duplicate", "duplicateOf": "rain"},
+            {"id": "rain", "status": "duplicate", "duplicateOf": "rain"},
+        ]
+        assert Prompts.from_id("rain").prompt == "jairtrejo in the rain"
+
+    def test_rejects_repeated_ids(self):
+        response = self.save(
+            [
+                {"prompt": "jairtrejo in the snow", "id": "snow"},
+                {"prompt": "jairtrejo in the hail", "id": "snow"},
+            ]
+        )
+
+        assert response["statusCode"] == 400
+        assert json.loads(response["body"]) == {
+            "message": "Repeated ids: snow"
+        }
+        assert Prompts.from_id("snow") is None
+
+    def test_rejects_too_many_prompts(self, monkeypatch):
+        monkeypatch.setattr(api, "MAX_BULK_PROMPTS", 1)
+
+        response = self.save(
+            [
+                {"prompt": "jairtrejo in the snow"},
+                {"prompt": "jairtrejo in the hail"},
+            ]
+        )
+
+        assert response["statusCode"] == 400
+        assert Prompts.unused_count() == 1
+
+
+class TestGetLatestPrompts:
+    @pytest.fixture(autouse=True)
+    def used(self, memory_store):
+        now = int(time.time())
+        for i in range(3):
+            Prompts.save(
+                Prompt(
+                    prompt="jairtrejo portrait %d" % i,
+                    id="p%d" % i,
+                    used_at=now + i,
+                )
+            )
+
+    def get(self, **query):
+        response = api.get_latest_prompts(
+            api_event("GET", "/prompt", query=query), FakeContext()
+        )
+        return response["statusCode"], json.loads(response["body"])
+
+    def test_pages_with_the_cursor(self):
+        status, first = self.get(limit="2")
+        _, second = self.get(limit="2", cursor=first["nextCursor"])
+
+        assert status == 200
+        assert [p["id"] for p in first["prompts"]] == ["p2", "p1"]
+        assert [p["id"] for p in second["prompts"]] == ["p0"]
+        assert second["nextCursor"] is None
+
+    def test_searches_only_used_prompts(self):
+        Prompts.add(Prompt(prompt="jairtrejo portrait 3", id="unused"))
+
+        status, body = self.get(q="portrait", fields="id")
+
+        assert status == 200
+        assert sorted(p["id"] for p in body["prompts"]) == ["p0", "p1", "p2"]
+
+    def test_rejects_pages_over_the_maximum(self):
+        status, body = self.get(limit=str(api.MAX_PAGE_SIZE + 1))
+
+        assert status == 400
+        assert body == {
+            "message": "limit must be between 1 and %d" % api.MAX_PAGE_SIZE
+        }
+
+
+class TestGetPrompt:
+    @pytest.fixture(autouse=True)
+    def stored(self, memory_store):
+        Prompts.save(
+            Prompt(prompt="jairtrejo in the rain", id="rain", used_at=1)
+        )
+        Prompts.add(Prompt(prompt="jairtrejo in the snow", id="snow"))
+
+    def get(self, prompt_id, **query):
+        event = api_event("GET", "/prompt/{prompt_id}", query=query or None)
+        event["pathParameters"] = {"prompt_id": prompt_id}
+        response = api.get_prompt(event, FakeContext())
+        return response["statusCode"], response.get("body")
+
+    def test_returns_used_prompts(self):
+        status, body = self.get("rain")
+
+        assert status == 200
+        assert json.loads(body)["prompt"] == "jairtrejo in the rain"
+
+    def test_returns_only_requested_fields(self):
+        status, body = self.get("rain", fields="id")
+
+        assert status == 200
+        assert json.loads(body) == {"id": "rain"}
+
+    def test_hides_unused_prompts(self):
+        assert self.get("snow")[0] == 404
+        assert self.get("snow", fields="id")[0] == 404
+
+    def test_hides_the_tables_own_items(self, monkeypatch):
+        monkeypatch.setattr(Prompts, "from_id", pytest.fail)
+
+        assert self.get("#meta")[0] == 404
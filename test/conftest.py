@@ -1,4 +1,11 @@
+import io
+import json
+
 import pytest
+from botocore.exceptions import ClientError
+
+from quicksilver import feed, repository, stores
+from quicksilver.utils import clients
 
 
 @pytest.fixture
@@ -9,3 +16,139 @@ def environment(monkeypatch):
     monkeypatch.setenv("LYFT_CLIENT_SECRET", "lyft:fakesecret")
     monkeypatch.setenv("GOOGLE_CLIENT_ID", "google:fakeid")
     monkeypatch.setenv("GOOGLE_CLIENT_SECRET", "google:fakesecret")
+
+
+class FakeS3:
+    """
+    An in-memory bucket, with the conditional writes the feed relies on
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.etags = {}
+        self.headers = {}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+
+        return {"Body": io.BytesIO(self.objects[Key]), "ETag": self.etags[Key]}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+
+        return {"ETag": self.etags[Key]}
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, **kwargs):
+        current = self.etags.get(Key)
+        if ("IfNoneMatch" in kwargs and current is not None) or (
+            IfMatch is not None and current != IfMatch
+        ):
+            raise ClientError(
+                {"Error": {"Code": "PreconditionFailed"}}, "PutObject"
+            )
+
+        kwargs.pop("IfNoneMatch", None)
+        self.objects[Key] = Body
+        self.etags[Key] = '"%d"' % hash(Body)
+        self.headers[Key] = kwargs
+
+    def document(self, key):
+        return json.loads(self.objects[key])
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    s3 = FakeS3()
+    monkeypatch.setattr(clients, "s3", lambda: s3)
+    monkeypatch.setenv("AVATAR_BUCKET", "bucket")
+    return s3
+
+
+@pytest.fixture
+def memory_store(monkeypatch):
+    """
+    A fresh ``MemoryStore`` as the configured store, with empty caches
+    """
+    monkeypatch.setenv("PROMPT_STORE", "memory")
+    stores.get_store.cache_clear()
+    repository._cache.invalidate()
+    feed._cache.invalidate()
+    yield stores.get_store()
+    stores.get_store.cache_clear()
+    repository._cache.invalidate()
+    feed._cache.invalidate()
+
+
+def _create_prompt_table(name):
+    # Like PromptTable in template.yaml
+    import boto3
+
+    keys = {
+        "id": "S",
+        "created_at": "N",
+        "used_at": "N",
+        "used_year": "N",
+        "unused_block": "N",
+        "token": "S",
+    }
+    boto3.client("dynamodb").create_table(
+        TableName=name,
+        AttributeDefinitions=[
+            {"AttributeName": key, "AttributeType": kind}
+            for key, kind in keys.items()
+        ],
+        KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": "latest",
+                "KeySchema": [
+                    {"AttributeName": "used_year", "KeyType": "HASH"},
+                    {"AttributeName": "used_at", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            },
+            {
+                "IndexName": "unused",
+                "KeySchema": [
+                    {"AttributeName": "unused_block", "KeyType": "HASH"},
+                    {"AttributeName": "created_at", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "KEYS_ONLY"},
+            },
+            {
+                "IndexName": "search",
+                "KeySchema": [{"AttributeName": "token", "KeyType": "HASH"}],
+                "Projection": {
+                    "ProjectionType": "INCLUDE",
+                    "NonKeyAttributes": ["prompt_id", "frequency"],
+                },
+            },
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+@pytest.fixture
+def dynamodb_store(monkeypatch):
+    """
+    A ``DynamoDBStore`` on a table mocked with moto
+    """
+    moto = pytest.importorskip("moto")
+    from quicksilver.stores import dynamodb
+
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.delenv("DYNAMO_ENDPOINT", raising=False)
+
+    with moto.mock_aws():
+        # Clients made outside of the mock would reach AWS
+        clients.dynamodb.cache_clear()
+        dynamodb._table.cache_clear()
+        _create_prompt_table("PromptTable")
+        yield dynamodb.DynamoDBStore(table_name="PromptTable")
+
+    clients.dynamodb.cache_clear()
+    dynamodb._table.cache_clear()
@@ -0,0 +1,119 @@
+from datetime import datetime
+
+import pytest
+
+from quicksilver import archive, repository, stores
+from quicksilver.prompt import Prompt
+from quicksilver.repository import Prompts
+
+LAST_YEAR = datetime.now().year - 1
+
+
+@pytest.fixture(autouse=True)
+def archive_bucket(monkeypatch, s3, memory_store):
+    monkeypatch.setattr(archive, "_archived", set())
+
+
+def used_in(month, day, i):
+    return Prompt(
+        prompt="jairtrejo in the rain %d" % i,
+        id="p%d" % i,
+        used_at=int(datetime(LAST_YEAR, month, day).timestamp()),
+    )
+
+
+class TestArchive:
+    @pytest.fixture
+    def prompts(self):
+        prompts = [used_in(1, 1, 0), used_in(1, 2, 1), used_in(3, 1, 2)]
+        for prompt in prompts:
+            Prompts.save(prompt)
+        Prompts.save(
+            Prompt(
+                prompt="jairtrejo in the rain",
+                id="now",
+                used_at=int(datetime.now().timestamp()),
+            )
+        )
+        return prompts
+
+    def test_moves_a_year_to_the_archive(self, s3, prompts):
+        assert Prompts.archive(LAST_YEAR) == 3
+
+        assert stores.get_store().latest(10, year=LAST_YEAR) == ([], None)
+        assert [p.id for p in Prompts.search("rain")[0]] == ["now"]
+        assert stores.get_store().document_count() == 1
+        assert sorted(s3.objects) == [
+            "archive/year=%d/_SUCCESS" % LAST_YEAR,
+            "archive/year=%d/month=01/prompts.jsonl.gz" % LAST_YEAR,
+            "archive/year=%d/month=03/prompts.jsonl.gz" % LAST_YEAR,
+        ]
+
+    def test_pages_through_an_archived_year(self, prompts):
+        Prompts.archive(LAST_YEAR)
+
+        first, cursor = Prompts.latest(limit=2, year=LAST_YEAR)
+        second, cursor = Prompts.latest(limit=2, cursor=cursor, year=LAST_YEAR)
+
+        assert first + second == prompts[::-1]
+        assert cursor is None
+
+    def test_reads_only_the_requested_fields(self, prompts):
+        Prompts.archive(LAST_YEAR)
+
+        assert Prompts.latest(limit=1, fields=("id",), year=LAST_YEAR)[0] == [
+            {"id": "p2"}
+        ]
+
+    def test_reads_the_store_until_the_year_is_archived(self, prompts):
+        assert Prompts.latest(limit=10, year=LAST_YEAR)[0] == prompts[::-1]
+
+    def test_keeps_archived_prompts_when_run_again(self, prompts):
+        Prompts.archive(LAST_YEAR)
+        archive._archived.clear()
+
+        Prompts.archive(LAST_YEAR)
+
+        assert Prompts.latest(limit=10, year=LAST_YEAR)[0] == prompts[::-1]
+
+    def test_counts_prompts_out_of_the_index_once(
+        self, monkeypatch, dynamodb_store, prompts
+    ):
+        # DynamoDB keeps expiring prompts, so a second run reads them again
+        monkeypatch.setattr(repository, "get_store", lambda: dynamodb_store)
+        for prompt in prompts:
+            Prompts.save(prompt)
+        Prompts.save(
+            Prompt(
+                prompt="jairtrejo in the rain",
+                id="now",
+                used_at=int(datetime.now().timestamp()),
+            )
+        )
+
+        finish = archive.finish
+        calls = []
+
+        def crash_once(year, count):
+            calls.append(year)
+            if len(calls) == 1:
+                raise RuntimeError("Lambda timed out")
+            finish(year, count)
+
+        monkeypatch.setattr(archive, "finish", crash_once)
+        with pytest.raises(RuntimeError):
+            Prompts.archive(LAST_YEAR)
+
+        assert Prompts.archive(LAST_YEAR) == 3
+        assert dynamodb_store.document_count() == 1
+        assert [p.id for p in Prompts.search("rain")[0]] == ["now"]
+
+    def test_only_archives_past_years(self):
+        with pytest.raises(ValueError):
+            Prompts.archive(datetime.now().year)
+
+    def test_rejects_invalid_cursors(self, prompts):
+        Prompts.archive(LAST_YEAR)
+
+        with pytest.raises(ValueError):
+            Prompts.latest(limit=1, cursor="not-a-cursor", year=LAST_YEAR)
@@ -0,0 +1,94 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from quicksilver import feed
+from quicksilver.prompt import Prompt
+from quicksilver.repository import Prompts
+from quicksilver.utils.serialization import dumps
+
+NOW = int(datetime.now().timestamp())
+
+
+@pytest.fixture(autouse=True)
+def feed_pages(monkeypatch, memory_store):
+    monkeypatch.setattr(feed, "PAGE_SIZE", 3)
+    monkeypatch.setattr(feed, "SHARD_SIZE", 2)
+
+
+def use(i):
+    prompt = Prompt(
+        prompt="A portrait of jairtrejo %d" % i, id="p%d" % i, used_at=NOW + i
+    )
+    feed.publish(prompt)
+    Prompts.save(prompt)
+    return prompt
+
+
+class TestPublish:
+    def test_matches_the_latest_page(self, s3):
+        for i in range(5):
+            use(i)
+
+        prompts, next_cursor = Prompts.latest(limit=3)
+
+        assert s3.document(feed.LATEST_KEY) == json.loads(
+            dumps({"prompts": prompts, "next_cursor": next_cursor})
+        )
+
+    def test_starts_from_the_prompts_already_used(self, s3):
+        for i in range(2):
+            Prompts.save(
+                Prompt(prompt="jairtrejo %d" % i, id="p%d" % i, used_at=NOW)
+            )
+
+        use(2)
+
+        assert [p["id"] for p in s3.document(feed.LATEST_KEY)["prompts"]] == [
+            "p2",
+            "p1",
+            "p0",
+        ]
+
+    def test_appends_to_shards(self, s3):
+        for i in range(3):
+            use(i)
+
+        year = datetime.now().year
+        assert [
+            p["id"] for p in s3.document("feed/%d/0.json" % year)["prompts"]
+        ] == ["p0", "p1"]
+        assert s3.headers["feed/%d/0.json" % year]["CacheControl"] == (
+            feed.IMMUTABLE
+        )
+        assert [
+            p["id"] for p in s3.document("feed/%d/1.json" % year)["prompts"]
+        ] == ["p2"]
+        assert s3.document("feed/%d/index.json" % year) == {
+            "pages": 2,
+            "count": 3,
+            "pageSize": 2,
+        }
+
+    def test_replaces_entries_on_retries(self, s3):
+        prompt = use(0)
+
+        prompt.used_at += 1
+        feed.publish(prompt)
+
+        year = datetime.now().year
+        assert s3.document(feed.LATEST_KEY)["prompts"][0]["usedAt"] == (
+            NOW + 1
+        )
+        assert len(s3.document("feed/%d/0.json" % year)["prompts"]) == 1
+
+
+class TestLatest:
+    def test_reads_the_feed(self, s3):
+        use(0)
+
+        assert json.loads(feed.latest())["prompts"][0]["id"] == "p0"
+
+    def test_is_none_without_a_feed(self, s3):
+        assert feed.latest() is None
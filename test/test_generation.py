@@ -0,0 +1,115 @@
+import base64
+import time
+
+import pytest
+
+from quicksilver import generation
+from quicksilver.generation import cache_key
+
+
+class TestCacheKey:
+    def test_is_content_addressed(self):
+        key = cache_key("A portrait of jairtrejo", "model")
+
+        assert key.startswith("generated/")
+        assert key == cache_key("A portrait of jairtrejo", "model")
+
+    def test_ignores_whitespace_differences(self):
+        assert cache_key(" A  portrait\nof jairtrejo ", "model") == cache_key(
+            "A portrait of jairtrejo", "model"
+        )
+
+    def test_depends_on_the_model(self):
+        assert cache_key("jairtrejo", "model") != cache_key(
+            "jairtrejo", "other-model"
+        )
+
+
+class FakeResponse:
+    def __init__(self, result):
+        self.result = result
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.result
+
+
+class FakeBanana:
+    def __init__(self, checks_until_ready):
+        self.checks_until_ready = checks_until_ready
+        self.calls = []
+
+    def post(self, url, json, timeout):
+        self.calls.append(url.split("/")[-3])
+        if url.endswith("/start/v4/"):
+            return FakeResponse({"callID": "call", "message": ""})
+
+        self.checks_until_ready -= 1
+        if self.checks_until_ready > 0:
+            return FakeResponse({"message": "running"})
+
+        image = base64.b64encode(b"jpeg").decode()
+        return FakeResponse(
+            {"message": "success", "modelOutputs": [{"image_base64": image}]}
+        )
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    monkeypatch.setenv("BANANA_API_KEY", "key")
+    monkeypatch.setenv("BANANA_MODEL_KEY", "model")
+    sleeps = []
+    monkeypatch.setattr(generation.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def banana(monkeypatch, checks_until_ready):
+    banana = FakeBanana(checks_until_ready)
+    monkeypatch.setattr(generation.clients, "http", lambda: banana)
+    return banana
+
+
+class TestGenerate:
+    def test_polls_with_backoff(self, monkeypatch, sleeps):
+        api = banana(monkeypatch, checks_until_ready=6)
+        started = []
+
+        assert generation.generate("jairtrejo", on_start=started.append) == (
+            b"jpeg"
+        )
+        assert api.calls == ["start"] + ["check"] * 6
+        assert started == ["call"]
+        assert sleeps == [1.0, 2.0, 4.0, 8.0, 8.0]
+
+    def test_gives_up_at_the_deadline(self, monkeypatch, sleeps):
+        banana(monkeypatch, checks_until_ready=6)
+
+        with pytest.raises(generation.GenerationTimeout) as e:
+            generation.generate("jairtrejo", deadline=time.monotonic() - 1)
+
+        assert e.value.call_id == "call"
+
+    def test_resumes_a_call(self, monkeypatch, sleeps):
+        api = banana(monkeypatch, checks_until_ready=1)
+
+        assert generation.generate("jairtrejo", call_id="call") == b"jpeg"
+        assert api.calls == ["check"]
+
+
+@pytest.mark.usefixtures("s3")
+class TestRender:
+    def test_returns_cached_images(self, monkeypatch, sleeps):
+        api = banana(monkeypatch, checks_until_ready=1)
+        generation.store("jairtrejo", b"cached")
+
+        assert generation.render("jairtrejo") == b"cached"
+        assert api.calls == []
+
+    def test_generates_and_stores_missing_images(self, monkeypatch, sleeps):
+        api = banana(monkeypatch, checks_until_ready=1)
+
+        assert generation.render(" jairtrejo ") == b"jpeg"
+        assert api.calls == ["start", "check"]
+        assert generation.cached("jairtrejo") == b"jpeg"
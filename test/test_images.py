@@ -0,0 +1,51 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from quicksilver.images import variants
+
+
+@pytest.fixture
+def jpeg():
+    buffer = BytesIO()
+    Image.new("RGB", (512, 512), "orange").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class TestVariants:
+    def test_includes_the_original_image(self, jpeg):
+        original, body = variants("some-id", jpeg)[0]
+
+        assert original == {
+            "key": "images/some-id.jpg",
+            "width": 512,
+            "type": "image/jpeg",
+        }
+        assert body is jpeg
+
+    def test_resizes_to_jpeg_and_webp(self, jpeg):
+        derivatives = {
+            variant["key"]: Image.open(BytesIO(body))
+            for variant, body in variants("some-id", jpeg)[1:]
+        }
+
+        assert set(derivatives) == {
+            "images/some-id-128.jpg",
+            "images/some-id-128.webp",
+            "images/some-id-256.jpg",
+            "images/some-id-256.webp",
+        }
+        assert derivatives["images/some-id-128.webp"].format == "WEBP"
+        assert derivatives["images/some-id-256.jpg"].size == (256, 256)
+
+    def test_doesnt_enlarge_small_images(self, jpeg):
+        buffer = BytesIO()
+        Image.new("RGB", (200, 100)).save(buffer, format="JPEG")
+
+        widths = [
+            variant["width"]
+            for variant, _ in variants("id", buffer.getvalue())
+        ]
+
+        assert widths == [200, 128, 128]
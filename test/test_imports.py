@@ -0,0 +1,53 @@
+import subprocess
+import sys
+
+import pytest
+
+PUBLISHING_MODULES = {"banana_dev", "mastodon", "requests"}
+
+
+def imported_modules(handler):
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, quicksilver; quicksilver.%s; print(*sys.modules)"
+            % handler,
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split())
+
+
+@pytest.mark.parametrize(
+    "handler",
+    [
+        "save_prompt",
+        "save_prompts",
+        "get_prompt",
+        "get_latest_prompts",
+        "archive_prompts",
+        "pick_prompt",
+        "update_stats",
+        "get_stats",
+    ],
+)
+def test_dynamodb_handlers_dont_import_publishing_clients(handler):
+    assert not imported_modules(handler) & PUBLISHING_MODULES
+
+
+def test_importing_the_package_doesnt_import_handlers():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, quicksilver; print(*sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert "quicksilver.api" not in result.stdout.split()
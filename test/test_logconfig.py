@@ -0,0 +1,103 @@
+import json
+
+import pytest
+import structlog
+
+from quicksilver import logconfig
+
+
+@pytest.fixture
+def sample_rate(monkeypatch):
+    def _sample_rate(rate):
+        monkeypatch.setattr(logconfig, "SAMPLE_RATE", rate)
+
+    return _sample_rate
+
+
+def kept(method_name, event_dict):
+    try:
+        logconfig.sample(None, method_name, event_dict)
+    except structlog.DropEvent:
+        return False
+
+    return True
+
+
+class TestSample:
+    def test_keeps_everything_by_default(self):
+        assert kept("info", {"event": "Success", "request_id": "a"})
+
+    def test_keeps_a_share_of_requests(self, sample_rate):
+        sample_rate(0.25)
+
+        share = sum(
+            kept("info", {"event": "Success", "request_id": str(i)})
+            for i in range(10000)
+        )
+
+        assert 2000 < share < 3000
+
+    def test_keeps_or_drops_a_whole_request(self, sample_rate):
+        sample_rate(0.5)
+
+        for i in range(100):
+            first = kept("info", {"event": "Start", "request_id": str(i)})
+            assert kept("debug", {"event": "End", "request_id": str(i)}) == (
+                first
+            )
+
+    def test_always_keeps_errors_and_warnings(self, sample_rate):
+        sample_rate(0)
+
+        assert kept("error", {"event": "Unexpected", "request_id": "a"})
+        assert kept("warning", {"event": "Retry", "request_id": "a"})
+        assert not kept("info", {"event": "Success", "request_id": "a"})
+
+    def test_tells_if_a_request_is_kept(self, sample_rate):
+        sample_rate(0.5)
+
+        for i in range(100):
+            assert logconfig.sampled(str(i)) == kept(
+                "info", {"event": "Success", "request_id": str(i)}
+            )
+
+    def test_keeps_logs_outside_of_requests(self, sample_rate):
+        sample_rate(0)
+
+        assert kept("info", {"event": "Archived prompts"})
+
+
+class TestTruncate:
+    def test_shortens_long_strings(self):
+        body = "x" * (logconfig.MAX_FIELD_LENGTH + 10)
+
+        event_dict = logconfig.truncate(None, "info", {"body": body})
+
+        assert event_dict["body"] == (
+            "x" * logconfig.MAX_FIELD_LENGTH + "... (10 more characters)"
+        )
+
+    def test_shortens_nested_containers(self):
+        event_dict = logconfig.truncate(
+            None,
+            "info",
+            {"ids": list(range(30)), "event_body": {"data": b"\xff" * 100}},
+        )
+
+        assert event_dict["ids"][-1] == "... 10 more items"
+        assert len(event_dict["ids"]) == logconfig.MAX_FIELD_ITEMS + 1
+        assert event_dict["event_body"] == {"data": "<100 bytes>"}
+
+    def test_leaves_the_message_and_traceback(self):
+        long = "x" * (logconfig.MAX_FIELD_LENGTH + 1)
+        event_dict = {"event": long, "exception": long}
+
+        assert logconfig.truncate(None, "error", event_dict) == event_dict
+
+
+def test_renders_json():
+    render = logconfig._renderer()
+
+    line = render(None, "info", {"event": "Success", "years": {2022: 3}})
+
+    assert json.loads(line) == {"event": "Success", "years": {"2022": 3}}
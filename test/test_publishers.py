@@ -0,0 +1,205 @@
+import hashlib
+import hmac
+import json
+import threading
+
+import attr
+import pytest
+
+from quicksilver import publishers
+from quicksilver.prompt import Prompt
+from quicksilver.publishers import (
+    MastodonPublisher,
+    Publisher,
+    S3AliasPublisher,
+    WebhookPublisher,
+    from_config,
+    publish_all,
+)
+
+
+@attr.s
+class FakePublisher(Publisher):
+    failures = attr.ib(default=0, kw_only=True)
+    wait = attr.ib(default=None, kw_only=True)
+    calls = attr.ib(default=0, kw_only=True)
+
+    def send(self, prompt, img_bytes):
+        self.calls += 1
+        if self.wait is not None:
+            self.wait.wait()
+        if self.calls <= self.failures:
+            raise ConnectionError("Unreachable")
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(publishers.time, "sleep", lambda seconds: None)
+
+
+@pytest.fixture
+def prompt():
+    return Prompt(prompt="jairtrejo in the rain", id="some-id")
+
+
+class TestFromConfig:
+    def test_builds_each_type(self):
+        config = [
+            {
+                "type": "mastodon",
+                "name": "hachyderm",
+                "api_base_url": "https://hachyderm.io",
+                "client_key": "key",
+                "client_secret": "secret",
+                "access_token": "token",
+            },
+            {"type": "webhook", "url": "https://example.com", "attempts": 3},
+            {"type": "s3_alias", "required": False},
+        ]
+
+        mastodon, webhook, alias = from_config(config)
+
+        assert isinstance(mastodon, MastodonPublisher)
+        assert mastodon.name == "hachyderm"
+        assert isinstance(webhook, WebhookPublisher)
+        assert (webhook.name, webhook.attempts) == ("webhook", 3)
+        assert isinstance(alias, S3AliasPublisher)
+        assert not alias.required
+
+    def test_rejects_unknown_types(self):
+        with pytest.raises(ValueError):
+            from_config([{"type": "carrier_pigeon"}])
+
+    def test_rejects_repeated_names(self):
+        with pytest.raises(ValueError):
+            from_config([{"type": "s3_alias"}, {"type": "s3_alias"}])
+
+    def test_defaults_to_the_mastodon_account(self, monkeypatch):
+        monkeypatch.delenv("PUBLISHERS", raising=False)
+        monkeypatch.setenv("MASTODON_CLIENT_KEY", "key")
+        monkeypatch.setenv("MASTODON_CLIENT_SECRET", "secret")
+        monkeypatch.setenv("MASTODON_ACCESS_TOKEN", "token")
+
+        (mastodon,) = from_config(publishers._config())
+
+        assert mastodon.name == "mastodon"
+        assert mastodon.api_base_url == "https://hachyderm.io"
+
+    def test_reads_the_config_from_ssm(self, monkeypatch):
+        class FakeSSM:
+            def get_parameter(self, Name, WithDecryption):
+                assert Name == "/Avatar/Publishers"
+                return {"Parameter": {"Value": '[{"type": "s3_alias"}]'}}
+
+        monkeypatch.setenv("PUBLISHERS", "ssm:/Avatar/Publishers")
+        monkeypatch.setattr(publishers.clients, "ssm", lambda: FakeSSM())
+
+        assert publishers._config() == [{"type": "s3_alias"}]
+
+
+class TestPublish:
+    def test_retries_with_backoff(self, monkeypatch):
+        sleeps = []
+        monkeypatch.setattr(publishers.time, "sleep", sleeps.append)
+        publisher = FakePublisher("fake", attempts=3, backoff=1, failures=2)
+
+        assert publisher.publish(None, b"") == 3
+        assert sleeps == [1, 2]
+
+    def test_gives_up_after_the_last_attempt(self):
+        publisher = FakePublisher("fake", attempts=2, failures=5)
+
+        with pytest.raises(ConnectionError):
+            publisher.publish(None, b"")
+        assert publisher.calls == 2
+
+    def test_doesnt_retry_past_the_deadline(self):
+        publisher = FakePublisher("fake", attempts=3, failures=5, timeout=10)
+
+        with pytest.raises(ConnectionError):
+            publisher.publish(
+                None, b"", deadline=publishers.time.monotonic() + 5
+            )
+        assert publisher.calls == 1
+
+    def test_budget_is_capped(self):
+        assert FakePublisher("fake", timeout=60).budget == (
+            publishers.PUBLISH_BUDGET
+        )
+
+
+class TestPublishAll:
+    def test_records_the_result_of_each_publisher(self, prompt):
+        publications, errors = publish_all(
+            [
+                FakePublisher("ok"),
+                FakePublisher("flaky", failures=1),
+                FakePublisher("down", failures=5, required=False),
+            ],
+            prompt,
+            b"",
+        )
+
+        assert errors == {}
+        assert [(p["name"], p["status"]) for p in publications] == [
+            ("ok", "published"),
+            ("flaky", "published"),
+            ("down", "failed"),
+        ]
+        assert publications[1]["attempts"] == 2
+        assert publications[2]["error"] == "ConnectionError"
+
+    def test_fails_for_required_publishers_and_tasks(self, prompt):
+        def upload():
+            raise RuntimeError("Access denied")
+
+        _, errors = publish_all(
+            [FakePublisher("down", failures=5)],
+            prompt,
+            b"",
+            tasks={"images/some-id.jpg": upload},
+        )
+
+        assert set(errors) == {"down", "images/some-id.jpg"}
+
+    def test_slow_publishers_dont_hold_up_the_others(self, prompt):
+        stuck = threading.Event()
+        slow = FakePublisher("slow", timeout=0.05, attempts=1, wait=stuck)
+
+        try:
+            publications, errors = publish_all(
+                [slow, FakePublisher("fast")], prompt, b""
+            )
+        finally:
+            stuck.set()
+
+        assert [p["status"] for p in publications] == ["failed", "published"]
+        assert isinstance(errors["slow"], TimeoutError)
+
+
+class TestWebhookPublisher:
+    def test_posts_the_signed_prompt(self, monkeypatch, prompt):
+        requests = []
+
+        class FakeResponse:
+            def raise_for_status(self):
+                pass
+
+        class FakeSession:
+            def post(self, url, data, headers, timeout):
+                requests.append((url, data, headers))
+                return FakeResponse()
+
+        monkeypatch.setattr(publishers.clients, "http", lambda: FakeSession())
+        publisher = WebhookPublisher(
+            "webhook", url="https://example.com", secret="shh"
+        )
+
+        publisher.send(prompt, b"")
+
+        ((url, data, headers),) = requests
+        assert url == "https://example.com"
+        assert json.loads(data)["id"] == "some-id"
+        assert headers[publishers.SIGNATURE_HEADER] == (
+            "sha256=" + hmac.new(b"shh", data, hashlib.sha256).hexdigest()
+        )
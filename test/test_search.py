@@ -0,0 +1,34 @@
+from quicksilver.search import rank, terms, tokenize
+
+
+class TestTokenize:
+    def test_ignores_case_accents_and_punctuation(self):
+        assert tokenize("Café, CAFE; café!") == ["cafe", "cafe", "cafe"]
+
+    def test_skips_stop_words_and_the_alias(self):
+        assert tokenize("A portrait of jairtrejo in the rain") == [
+            "portrait",
+            "rain",
+        ]
+
+    def test_counts_terms(self):
+        assert terms("rain, rain and sun") == {"rain": 2, "sun": 1}
+
+
+class TestRank:
+    def test_intersects_posting_lists(self):
+        postings = [{"a": 1, "b": 1, "c": 1}, {"b": 1, "c": 1}, {"c": 1}]
+
+        assert rank(postings, 10) == ["c"]
+
+    def test_ranks_by_term_frequency(self):
+        assert rank([{"a": 1, "b": 3}], 10) == ["b", "a"]
+
+    def test_weighs_rare_terms_higher(self):
+        common = {"a": 2, "b": 1, "c": 1, "d": 1}
+        rare = {"a": 1, "b": 2}
+
+        assert rank([common, rare], 4) == ["b", "a"]
+
+    def test_matches_nothing_without_terms(self):
+        assert rank([], 10) == []
@@ -0,0 +1,158 @@
+import json
+import os
+from collections import Counter
+from datetime import datetime
+from unittest.mock import Mock
+
+import pytest
+
+from quicksilver import stats
+from quicksilver.api.stats import update_stats
+from quicksilver.prompt import Prompt
+
+FIXTURE = os.path.join(
+    os.path.dirname(__file__), "fixtures", "prompt_stream.json"
+)
+# created_at of the first prompt in the fixture
+CREATED = 1792281600
+
+
+class FakeStats:
+    def __init__(self):
+        self.markers = set()
+        self.counts = Counter()
+        self.fail = set()
+
+    def transact(self, prompt_id, transition, names):
+        if prompt_id in self.fail:
+            raise RuntimeError("Throttled")
+
+        if (prompt_id, transition) in self.markers:
+            return False
+
+        self.markers.add((prompt_id, transition))
+        self.counts.update(names)
+        return True
+
+    def read(self, names):
+        return {
+            name: self.counts[name] for name in names if name in self.counts
+        }
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeStats()
+    monkeypatch.setattr(stats, "_transact", table.transact)
+    monkeypatch.setattr(stats, "_read", table.read)
+    return table
+
+
+@pytest.fixture
+def event():
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+def context():
+    return Mock(aws_request_id="request")
+
+
+def day(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+
+
+def month(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m")
+
+
+class TestTransitions:
+    def test_finds_submitted_and_used_prompts(self, event):
+        found = [
+            transition
+            for record in event["Records"]
+            for transition in stats.transitions(record)
+        ]
+
+        assert found == [
+            ("prompt-a", stats.SUBMITTED, CREATED),
+            ("prompt-b", stats.SUBMITTED, CREATED + 60),
+            ("prompt-a", stats.USED, CREATED + 3600),
+        ]
+
+    def test_counts_by_day_and_month(self):
+        assert stats.counters(stats.SUBMITTED, CREATED) == [
+            "submitted",
+            "submitted#%s" % day(CREATED),
+        ]
+        assert stats.counters(stats.USED, CREATED) == [
+            "used",
+            "used#%s" % month(CREATED),
+        ]
+
+
+class TestUpdateStats:
+    def test_counts_the_stream(self, table, event):
+        assert update_stats(event, context()) == {"batchItemFailures": []}
+
+        assert table.counts == {
+            "submitted": 2,
+            "submitted#%s" % day(CREATED): 2,
+            "used": 1,
+            "used#%s" % month(CREATED + 3600): 1,
+        }
+
+    def test_replays_dont_count_twice(self, table, event):
+        update_stats(event, context())
+        counts = dict(table.counts)
+
+        update_stats(event, context())
+
+        assert table.counts == counts
+
+    def test_retries_from_the_first_failure(self, table, event):
+        table.fail.add("prompt-b")
+
+        response = update_stats(event, context())
+
+        assert response == {
+            "batchItemFailures": [
+                {
+                    "itemIdentifier": event["Records"][3]["dynamodb"][
+                        "SequenceNumber"
+                    ]
+                }
+            ]
+        }
+        assert table.counts["submitted"] == 1
+
+    def test_reads_the_stats(self, table, event):
+        update_stats(event, context())
+
+        assert stats.read(now=CREATED + 3600) == {
+            "queued": 1,
+            "submitted_today": 2 if day(CREATED + 3600) == day(CREATED) else 0,
+            "used_this_month": 1,
+            "submitted": 2,
+            "used": 1,
+        }
+
+
+class TestSeed:
+    def test_counts_existing_prompts_once(self, table, event):
+        update_stats(event, context())
+        prompts = [
+            Prompt(prompt="jairtrejo", id="prompt-a", created_at=CREATED),
+            Prompt(
+                prompt="jairtrejo",
+                id="prompt-c",
+                created_at=CREATED,
+                used_at=CREATED + 60,
+            ),
+        ]
+
+        assert stats.seed(prompts) == 2
+        assert stats.seed(prompts) == 0
+        assert table.counts["submitted"] == 3
+        assert table.counts["used"] == 2
+        assert table.counts["used#%s" % month(CREATED + 60)] == 2
@@ -0,0 +1,348 @@
+from datetime import datetime
+
+import pytest
+
+from quicksilver import stores
+from quicksilver.prompt import Prompt
+from quicksilver.repository import DuplicatePrompt, PromptExists, Prompts
+from quicksilver.stores.base import encode_cursor, used_year
+from quicksilver.stores.memory import MemoryStore
+from quicksilver.stores.sqlite import SQLiteStore
+
+NOW = int(datetime.now().timestamp())
+
+
+def make_prompt(i, used_at=None):
+    return Prompt(
+        prompt="A portrait of jairtrejo number %d" % i,
+        id="prompt-%d" % i,
+        created_at=NOW - 1000 + i,
+        used_at=used_at,
+    )
+
+
+@pytest.fixture(params=["memory", "sqlite", "dynamodb"])
+def store(request):
+    if request.param == "dynamodb":
+        return request.getfixturevalue("dynamodb_store")
+
+    return {"memory": MemoryStore, "sqlite": SQLiteStore}[request.param]()
+
+
+class TestPromptStore:
+    def test_gets_saved_prompts(self, store):
+        prompt = make_prompt(1)
+        prompt.images = [{"key": "images/1.jpg", "width": 512, "type": "jpeg"}]
+        store.save(prompt)
+
+        assert store.get("prompt-1") == prompt
+        assert store.get("missing") is None
+
+    def test_reads_only_the_requested_fields(self, store):
+        store.save(make_prompt(1, used_at=NOW))
+
+        assert store.get("prompt-1", ("id", "used_at")) == {
+            "id": "prompt-1",
+            "used_at": NOW,
+        }
+        assert store.latest(1, fields=("prompt",))[0] == [
+            {"prompt": "A portrait of jairtrejo number 1"}
+        ]
+
+    def test_ranks_unused_prompts_newest_first(self, store):
+        store.save_many([make_prompt(i) for i in range(5)])
+
+        assert store.unused_count() == 5
+        assert store.unused_id(0) == "prompt-4"
+        assert store.unused_id(4) == "prompt-0"
+        assert store.unused_id(5) is None
+        assert store.newest_unused_ids(2) == ["prompt-4", "prompt-3"]
+
+    def test_used_prompts_leave_the_unused_ones(self, store):
+        store.save_many([make_prompt(i) for i in range(3)])
+
+        store.save(make_prompt(2, used_at=NOW))
+
+        assert store.unused_count() == 2
+        assert store.unused_id(0) == "prompt-1"
+
+    def test_used_prompts_stay_used_when_saved_again(self, store):
+        store.save_many([make_prompt(0), make_prompt(1, used_at=NOW)])
+
+        store.save(make_prompt(1))
+
+        assert store.get("prompt-1").used_at == NOW
+        assert store.unused_count() == 1
+        assert store.unused_id(0) == "prompt-0"
+
+    def test_unused_prompts_keep_their_rank_when_saved_again(self, store):
+        store.save_many([make_prompt(i) for i in range(3)])
+
+        store.save(make_prompt(0))
+
+        assert store.unused_id(2) == "prompt-0"
+
+    def test_pages_through_latest_prompts(self, store):
+        store.save_many([make_prompt(i, used_at=NOW - i) for i in range(5)])
+
+        first, cursor = store.latest(2)
+        second, cursor = store.latest(2, cursor)
+        third, cursor = store.latest(2, cursor)
+
+        assert [p.id for p in first + second + third] == [
+            "prompt-%d" % i for i in range(5)
+        ]
+        assert cursor is None
+
+    def test_rejects_invalid_cursors(self, store):
+        with pytest.raises(ValueError):
+            store.latest(2, "not-a-cursor")
+
+    def test_bumps_the_version_on_writes(self, store):
+        version = store.version()
+
+        store.save(make_prompt(1))
+
+        assert store.version() != version
+
+    def test_reads_several_prompts_in_order(self, store):
+        store.save_many([make_prompt(i) for i in range(3)])
+
+        prompts = store.get_many(["prompt-2", "missing", "prompt-0"])
+
+        assert [p.id for p in prompts] == ["prompt-2", "prompt-0"]
+
+    def test_keeps_posting_lists(self, store):
+        store.update_postings(
+            added=[("rain", "a", 2), ("rain", "b", 1), ("sun", "a", 1)],
+            documents=2,
+        )
+        store.update_postings(removed=[("rain", "b")])
+
+        assert store.postings("rain") == {"a": 2}
+        assert store.postings("snow") == {}
+        assert store.document_count() == 2
+
+    def test_leases_prompts_to_one_owner(self, store):
+        store.save(make_prompt(1))
+
+        prompt, steps = store.claim("prompt-1", "a", 60)
+        store.record_step("prompt-1", "a", "generated")
+
+        assert prompt.id == "prompt-1" and steps == set()
+        assert store.claim("prompt-1", "b", 60) is None
+        with pytest.raises(RuntimeError):
+            store.record_step("prompt-1", "b", "uploaded")
+
+        store.release("prompt-1", "a")
+
+        assert store.claim("prompt-1", "b", 60)[1] == {"generated"}
+        assert store.claim("missing", "b", 60) is None
+
+    def test_fingerprints_have_one_holder(self, store):
+        assert store.claim_fingerprint("f", "a") == "a"
+        assert store.claim_fingerprint("f", "b") == "a"
+        assert store.claim_fingerprint("f", "a") == "a"
+
+        store.release_fingerprint("f", "b")
+        assert store.claim_fingerprint("f", "b") == "a"
+
+        store.release_fingerprint("f", "a")
+        assert store.claim_fingerprint("f", "b") == "b"
+
+    def test_expires_prompts_once(self, store):
+        store.save(make_prompt(1, used_at=NOW))
+
+        assert store.expire("prompt-1", NOW + 60)
+        assert not store.expire("prompt-1", NOW + 60)
+        assert not store.expire("missing", NOW + 60)
+
+
+@pytest.mark.usefixtures("memory_store")
+class TestPrompts:
+    def test_uses_the_configured_store(self):
+        assert isinstance(stores.get_store(), MemoryStore)
+
+    def test_rejects_unknown_stores(self, monkeypatch):
+        monkeypatch.setenv("PROMPT_STORE", "postgres")
+        stores.get_store.cache_clear()
+
+        with pytest.raises(ValueError):
+            stores.get_store()
+
+    def test_saving_refreshes_latest_prompts(self):
+        Prompts.save(make_prompt(1, used_at=NOW))
+        assert [p.id for p in Prompts.latest()[0]] == ["prompt-1"]
+
+        Prompts.save(make_prompt(2, used_at=NOW + 1))
+
+        assert [p.id for p in Prompts.latest()[0]] == ["prompt-2", "prompt-1"]
+
+    def test_searches_saved_prompts(self):
+        Prompts.save(
+            Prompt(prompt="jairtrejo in the rain", id="rain", used_at=NOW)
+        )
+        Prompts.save_many(
+            [
+                Prompt(prompt="jairtrejo in the sun", id="sun", used_at=NOW),
+                Prompt(
+                    prompt="jairtrejo, rain and sun", id="both", used_at=NOW
+                ),
+            ]
+        )
+
+        assert [p.id for p in Prompts.search("rain")[0]] == ["both", "rain"]
+        assert [p.id for p in Prompts.search("Sun RAIN")[0]] == ["both"]
+        assert Prompts.search("snow") == ([], None)
+
+    def test_updates_the_index_when_the_text_changes(self):
+        prompt = Prompt(prompt="jairtrejo in the rain", id="p", used_at=NOW)
+        Prompts.save(prompt)
+
+        prompt.prompt = "jairtrejo in the snow"
+        Prompts.save(prompt)
+
+        assert Prompts.search("rain") == ([], None)
+        assert [p.id for p in Prompts.search("snow")[0]] == ["p"]
+        assert stores.get_store().document_count() == 1
+
+    def test_pages_through_search_results(self):
+        Prompts.save_many(
+            [
+                Prompt(prompt="jairtrejo rain", id="p%d" % i, used_at=NOW)
+                for i in range(3)
+            ]
+        )
+
+        first, cursor = Prompts.search("rain", limit=2)
+        second, cursor = Prompts.search("rain", limit=2, cursor=cursor)
+
+        assert [p.id for p in first + second] == ["p0", "p1", "p2"]
+        assert cursor is None
+
+    def test_leaves_unused_prompts_out_of_search_results(self):
+        Prompts.save_many(
+            [
+                Prompt(
+                    prompt="jairtrejo rain",
+                    id="p%d" % i,
+                    used_at=NOW if i % 2 else None,
+                )
+                for i in range(5)
+            ]
+        )
+
+        first, cursor = Prompts.search("rain", limit=1)
+        second, cursor = Prompts.search(
+            "rain", limit=1, cursor=cursor, fields=("id",)
+        )
+
+        assert [p.id for p in first] == ["p1"]
+        assert second == [{"id": "p3"}]
+        assert Prompts.search("rain", cursor=cursor) == ([], None)
+
+    def test_rejects_duplicate_texts(self):
+        Prompts.add(Prompt(prompt="A portrait of jairtrejo", id="a"))
+
+        with pytest.raises(DuplicatePrompt) as e:
+            Prompts.add(Prompt(prompt="a  PORTRAIT of jairtrejo!", id="b"))
+
+        assert e.value.prompt_id == "a"
+        assert Prompts.from_id("b") is None
+
+    def test_doesnt_overwrite_prompts(self):
+        used = Prompt(prompt="jairtrejo in the rain", id="a", used_at=NOW)
+        Prompts.save(used)
+
+        with pytest.raises(PromptExists):
+            Prompts.add(Prompt(prompt="jairtrejo in the snow", id="a"))
+
+        assert Prompts.from_id("a") == used
+        assert Prompts.add(Prompt(prompt="jairtrejo in the snow", id="b"))
+
+    def test_skips_duplicates_in_bulk(self):
+        Prompts.add(Prompt(prompt="jairtrejo in the rain", id="a"))
+
+        failed, duplicates = Prompts.add_many(
+            [
+                Prompt(prompt="jairtrejo, in the Rain.", id="b"),
+                Prompt(prompt="jairtrejo in the sun", id="c"),
+                Prompt(prompt="jairtrejo in the SUN", id="d"),
+            ]
+        )
+
+        assert failed == []
+        assert duplicates == {"b": "a", "d": "c"}
+        assert Prompts.unused_count() == 2
+
+    def test_doesnt_overwrite_prompts_in_bulk(self):
+        used = Prompt(prompt="jairtrejo in the rain", id="a", used_at=NOW)
+        Prompts.save(used)
+
+        failed, duplicates = Prompts.add_many(
+            [Prompt(prompt="jairtrejo in the snow", id="a")]
+        )
+
+        assert (failed, duplicates) == ([], {"a": "a"})
+        assert Prompts.from_id("a") == used
+
+    def test_changing_the_text_frees_the_old_one(self):
+        prompt = Prompts.add(Prompt(prompt="jairtrejo in the rain", id="a"))
+
+        prompt.prompt = "jairtrejo in the snow"
+        Prompts.save(prompt)
+
+        assert Prompts.add(Prompt(prompt="jairtrejo in the rain", id="b"))
+
+    def test_changing_the_text_claims_the_new_one(self):
+        prompt = Prompts.add(Prompt(prompt="jairtrejo in the rain", id="a"))
+
+        prompt.prompt = "jairtrejo in the snow"
+        Prompts.save(prompt)
+
+        with pytest.raises(DuplicatePrompt) as e:
+            Prompts.add(Prompt(prompt="jairtrejo in the SNOW", id="b"))
+        assert e.value.prompt_id == "a"
+
+    def test_backfills_fingerprints_oldest_first(self):
+        Prompts.save_many(
+            [
+                Prompt(prompt="jairtrejo in the rain", id="new", created_at=2),
+                Prompt(prompt="jairtrejo in the RAIN", id="old", created_at=1),
+            ]
+        )
+
+        assert Prompts.backfill_fingerprints() == {"new": "old"}
+        with pytest.raises(DuplicatePrompt):
+            Prompts.add(Prompt(prompt="jairtrejo in the rain"))
+
+
+class TestDynamoDBStore:
+    def test_drops_empty_unused_blocks(self, dynamodb_store):
+        dynamodb_store.save(make_prompt(0))
+        dynamodb_store.save(make_prompt(0, used_at=NOW))
+
+        meta = dynamodb_store.table.get_item(Key={"id": "#meta"})["Item"]
+        assert not [field for field in meta if field.startswith("unused_")]
+        assert dynamodb_store.unused_count() == 0
+
+    @pytest.mark.parametrize(
+        "last_key",
+        [
+            {"id": "prompt-0", "used_at": NOW},
+            {"id": "prompt-0", "used_year": 1999, "used_at": NOW},
+            {"id": "#meta", "used_year": used_year(NOW), "used_at": NOW},
+            {"id": "prompt-0", "used_year": used_year(NOW), "used_at": 10**20},
+            {
+                "id": "prompt-0",
+                "used_year": used_year(NOW),
+                "used_at": NOW,
+                "unused_block": 0,
+            },
+        ],
+    )
+    def test_rejects_cursors_for_other_keys(self, dynamodb_store, last_key):
+        dynamodb_store.save(make_prompt(0, used_at=NOW))
+
+        with pytest.raises(ValueError):
+            dynamodb_store.latest(2, encode_cursor(last_key))
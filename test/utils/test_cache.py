@@ -0,0 +1,98 @@
+import pytest
+
+from quicksilver.utils.cache import VersionedCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    class Clock:
+        now = 0
+
+    monkeypatch.setattr(
+        "quicksilver.utils.cache.time.monotonic", lambda: Clock.now
+    )
+    return Clock
+
+
+@pytest.fixture
+def store():
+    class Store:
+        version = 1
+        reads = 0
+
+        def read(self, key):
+            self.reads += 1
+            return (key, self.version)
+
+    return Store()
+
+
+class TestVersionedCache:
+    def test_reuses_results_within_ttl(self, clock, store):
+        cache = VersionedCache(lambda: store.version, ttl=10)
+        read = cache(store.read)
+
+        read("a")
+        store.version = 2
+        clock.now = 5
+
+        assert read("a") == ("a", 1)
+        assert store.reads == 1
+
+    def test_keeps_results_after_ttl_if_version_is_unchanged(
+        self, clock, store
+    ):
+        cache = VersionedCache(lambda: store.version, ttl=10)
+        read = cache(store.read)
+
+        read("a")
+        clock.now = 15
+
+        assert read("a") == ("a", 1)
+        assert store.reads == 1
+
+    def test_recomputes_results_after_ttl_if_version_changed(
+        self, clock, store
+    ):
+        cache = VersionedCache(lambda: store.version, ttl=10)
+        read = cache(store.read)
+
+        read("a")
+        store.version = 2
+        clock.now = 15
+
+        assert read("a") == ("a", 2)
+        assert store.reads == 2
+
+    def test_caches_by_arguments(self, clock, store):
+        cache = VersionedCache(lambda: store.version, ttl=10)
+        read = cache(store.read)
+
+        read("a")
+        read(key="a")
+        read("b")
+
+        assert store.reads == 3
+
+    def test_invalidate_drops_results(self, clock, store):
+        cache = VersionedCache(lambda: store.version, ttl=10)
+        read = cache(store.read)
+
+        read("a")
+        cache.invalidate()
+        read("a")
+
+        assert store.reads == 2
+
+    def test_evicts_least_recently_used_results(self, clock, store):
+        cache = VersionedCache(lambda: store.version, ttl=10, maxsize=2)
+        read = cache(store.read)
+
+        read("a")
+        read("b")
+        read("a")
+        read("c")
+        read("a")
+        read("b")
+
+        assert store.reads == 4
@@ -0,0 +1,39 @@
+import gzip
+
+import pytest
+
+from quicksilver.utils import compression
+
+
+@pytest.fixture
+def without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "_brotli", lambda: None)
+
+
+class TestNegotiate:
+    def test_picks_gzip(self, without_brotli):
+        assert compression.negotiate("gzip, deflate") == "gzip"
+
+    def test_leaves_body_alone_without_header(self):
+        assert compression.negotiate(None) is None
+        assert compression.negotiate("") is None
+
+    def test_leaves_body_alone_for_unsupported_encodings(self):
+        assert compression.negotiate("deflate, identity") is None
+
+    def test_respects_q_values(self, without_brotli):
+        assert compression.negotiate("gzip;q=0, *;q=0.5") is None
+        assert compression.negotiate("deflate, *;q=0.5") == "gzip"
+
+    def test_prefers_brotli_when_installed(self):
+        pytest.importorskip("brotli")
+
+        assert compression.negotiate("gzip, br") == "br"
+        assert compression.negotiate("gzip, br;q=0.5") == "gzip"
+
+
+class TestCompress:
+    def test_gzips(self):
+        data = b"jairtrejo " * 100
+
+        assert gzip.decompress(compression.compress(data, "gzip")) == data
@@ -0,0 +1,47 @@
+import threading
+import time
+
+from quicksilver.utils.concurrency import run_concurrently
+
+
+def fail():
+    raise ValueError("failed")
+
+
+class TestRunConcurrently:
+    def test_returns_results_by_task_name(self):
+        results, errors = run_concurrently(
+            {"a": lambda: 1, "b": lambda: 2}, timeout=1
+        )
+
+        assert results == {"a": 1, "b": 2}
+        assert errors == {}
+
+    def test_runs_tasks_at_the_same_time(self):
+        barrier = threading.Barrier(2, timeout=1)
+
+        results, errors = run_concurrently(
+            {"a": barrier.wait, "b": barrier.wait}, timeout=1
+        )
+
+        assert set(results) == {"a", "b"}
+
+    def test_collects_errors_without_stopping_other_tasks(self):
+        results, errors = run_concurrently(
+            {"a": fail, "b": lambda: 2}, timeout=1
+        )
+
+        assert results == {"b": 2}
+        assert isinstance(errors["a"], ValueError)
+
+    def test_reports_tasks_over_their_timeout(self):
+        started_at = time.monotonic()
+
+        results, errors = run_concurrently(
+            {"slow": lambda: time.sleep(0.5), "fast": lambda: 1},
+            timeout={"slow": 0.05, "fast": 1},
+        )
+
+        assert time.monotonic() - started_at < 0.5
+        assert results == {"fast": 1}
+        assert isinstance(errors["slow"], TimeoutError)
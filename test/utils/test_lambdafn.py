@@ -1,8 +1,12 @@
+import base64
+import gzip
 import json
 
 import attr
 import pytest
 
+from quicksilver import logconfig
+from quicksilver.utils import compression, lambdafn
 from quicksilver.utils.lambdafn import Response, api_handler
 
 
@@ -82,6 +86,23 @@ class TestApiHandler:
         assert response["statusCode"] == 200
         assert response["body"] == '{"a": "dictionary"}'
 
+    def test_serializes_models_nested_in_dictionaries(
+        self, event, context, model_instance
+    ):
+        @api_handler
+        def handler():
+            return {
+                "items": [model_instance(camel_field="value")],
+                "next_cursor": None,
+            }
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+        assert response["body"] == (
+            '{"items": [{"camelField": "value"}], "nextCursor": null}'
+        )
+
     def test_passes_query_parameters_as_keyword_arguments(
         self, event, context, model_instance
     ):
@@ -95,6 +116,17 @@ class TestApiHandler:
 
         assert response["body"] == '{"param": "value"}'
 
+    def test_passes_path_parameters_as_keyword_arguments(self, event, context):
+        event["pathParameters"] = {"prompt_id": "some-id"}
+
+        @api_handler
+        def handler(prompt_id):
+            return {"id": prompt_id}
+
+        response = handler(event, context)
+
+        assert json.loads(response["body"]) == {"id": "some-id"}
+
     def test_returns_400_for_invalid_parameters(self, event, context):
         @api_handler
         def handler():
@@ -159,6 +191,26 @@ class TestApiHandler:
 
         assert response["body"] == "baz"
 
+    def test_ignores_server_only_fields(self, event, context):
+        MyModel = attr.make_class(
+            "MyModel",
+            {
+                "foo": attr.ib(),
+                "bar": attr.ib(default=None, metadata={"server_only": True}),
+            },
+        )
+
+        @api_handler(model=MyModel)
+        def handler(instance):
+            return Response(status_code=200, body=instance.bar)
+
+        event["body"] = json.dumps({"foo": "baz", "bar": "qux"})
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+        assert response.get("body") is None
+
     def test_returns_400_for_invalid_model(self, event, context):
         MyModel = attr.make_class("MyModel", ["foo"])
 
@@ -172,6 +224,93 @@ class TestApiHandler:
 
         assert response["statusCode"] == 400
 
+    def test_builds_list_of_models_if_requested(self, event, context):
+        MyModel = attr.make_class("MyModel", ["foo_bar"])
+
+        @api_handler(model=MyModel, many=True)
+        def handler(instances):
+            return Response(
+                status_code=200,
+                body=",".join(instance.foo_bar for instance in instances),
+            )
+
+        event["body"] = json.dumps([{"fooBar": "baz"}, {"fooBar": "qux"}])
+
+        response = handler(event, context)
+
+        assert response["body"] == "baz,qux"
+
+    def test_returns_400_for_invalid_model_in_list(self, event, context):
+        MyModel = attr.make_class("MyModel", ["foo"])
+
+        @api_handler(model=MyModel, many=True)
+        def handler(instances):
+            return Response(status_code=200)
+
+        event["body"] = json.dumps([{"foo": "bar"}, {"baz": "bar"}])
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 400
+        assert json.loads(response["body"])["message"].startswith("Item 1:")
+
+    def test_returns_400_for_non_list_body_if_many(self, event, context):
+        MyModel = attr.make_class("MyModel", ["foo"])
+
+        @api_handler(model=MyModel, many=True)
+        def handler(instances):
+            return Response(status_code=200)
+
+        event["body"] = json.dumps({"foo": "bar"})
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 400
+
+    def test_adds_etag_to_get_responses(self, event, context):
+        @api_handler
+        def handler():
+            return {"a": "dictionary"}
+
+        response = handler(event, context)
+
+        assert response["headers"]["ETag"].startswith('"')
+
+    def test_returns_304_if_etag_matches(self, event, context):
+        @api_handler
+        def handler():
+            return {"a": "dictionary"}
+
+        etag = handler(event, context)["headers"]["ETag"]
+        event["headers"] = {"if-none-match": etag}
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 304
+        assert "body" not in response
+        assert response["headers"]["ETag"] == etag
+
+    def test_returns_body_if_etag_doesnt_match(self, event, context):
+        @api_handler
+        def handler():
+            return {"a": "dictionary"}
+
+        event["headers"] = {"If-None-Match": '"stale"'}
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 200
+        assert response["body"] == '{"a": "dictionary"}'
+
+    def test_sets_cache_control_if_requested(self, event, context):
+        @api_handler(cache_control="public, max-age=60")
+        def handler():
+            return {"a": "dictionary"}
+
+        response = handler(event, context)
+
+        assert response["headers"]["Cache-Control"] == "public, max-age=60"
+
     def test_returns_404_when_response_is_none(self, event, context):
         @api_handler
         def handler():
@@ -180,3 +319,146 @@ class TestApiHandler:
         response = handler(event, context)
 
         assert response["statusCode"] == 404
+
+    def test_decodes_base64_encoded_bodies(self, event, context):
+        @api_handler(model=attr.make_class("M", ["prompt"]))
+        def handler(instance):
+            return {"prompt": instance.prompt}
+
+        event["httpMethod"] = "POST"
+        event["body"] = base64.b64encode(b'{"prompt": "hi"}').decode()
+        event["isBase64Encoded"] = True
+
+        response = handler(event, context)
+
+        assert json.loads(response["body"]) == {"prompt": "hi"}
+
+
+class TestCompression:
+    @pytest.fixture(autouse=True)
+    def without_brotli(self, monkeypatch):
+        monkeypatch.setattr(compression, "_brotli", lambda: None)
+
+    @pytest.fixture
+    def handler(self):
+        @api_handler
+        def handler(size="2000"):
+            return {"text": "x" * int(size)}
+
+        return handler
+
+    def test_compresses_large_bodies(self, handler, event, context):
+        event["headers"] = {
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        }
+
+        response = handler(event, context)
+
+        assert response["isBase64Encoded"]
+        assert response["headers"]["Content-Encoding"] == "gzip"
+        assert response["headers"]["Vary"] == "Accept, Accept-Encoding"
+        assert json.loads(
+            gzip.decompress(base64.b64decode(response["body"]))
+        ) == {"text": "x" * 2000}
+
+    def test_skips_small_bodies(self, handler, event, context):
+        event["headers"] = {"Accept-Encoding": "gzip"}
+        event["queryStringParameters"] = {"size": "10"}
+
+        response = handler(event, context)
+
+        assert "isBase64Encoded" not in response
+        assert "Content-Encoding" not in response["headers"]
+        assert json.loads(response["body"]) == {"text": "x" * 10}
+
+    def test_skips_bodies_if_not_accepted(self, handler, event, context):
+        response = handler(event, context)
+
+        assert "isBase64Encoded" not in response
+        assert response["headers"]["Vary"] == "Accept, Accept-Encoding"
+
+    def test_skips_bodies_api_gateway_wouldnt_decode(
+        self, handler, event, context
+    ):
+        event["headers"] = {"Accept": "*/*", "Accept-Encoding": "gzip"}
+
+        response = handler(event, context)
+
+        assert "isBase64Encoded" not in response
+        assert response["headers"]["Vary"] == "Accept, Accept-Encoding"
+
+    def test_varies_not_modified_responses(self, handler, event, context):
+        etag = handler(event, context)["headers"]["ETag"]
+        event["headers"] = {"If-None-Match": etag}
+
+        response = handler(event, context)
+
+        assert response["statusCode"] == 304
+        assert response["headers"]["Vary"] == "Accept, Accept-Encoding"
+
+    def test_weakens_etag_of_compressed_bodies(self, handler, event, context):
+        etag = handler(event, context)["headers"]["ETag"]
+        headers = {"Accept": "application/json", "Accept-Encoding": "gzip"}
+        event["headers"] = dict(headers, **{"If-None-Match": etag})
+
+        compressed = handler(dict(event, headers=headers), context)
+        revalidated = handler(event, context)
+
+        assert compressed["headers"]["ETag"] == "W/" + etag
+        assert revalidated["statusCode"] == 304
+
+
+class TestLogs:
+    class FakeLogger:
+        def __init__(self):
+            self.logs = []
+
+        def new(self, **kwargs):
+            return self
+
+        def bind(self, **kwargs):
+            return self
+
+        def __getattr__(self, level):
+            return lambda event, **kwargs: self.logs.append((level, event))
+
+    @pytest.fixture
+    def logger(self, monkeypatch):
+        logger = self.FakeLogger()
+        monkeypatch.setattr(lambdafn, "logger", logger)
+        return logger
+
+    @pytest.fixture
+    def digests(self, monkeypatch):
+        digests = []
+
+        def body_digest(response):
+            digests.append(response.body)
+            return None, None
+
+        monkeypatch.setattr(lambdafn, "_body_digest", body_digest)
+        return digests
+
+    def test_logs_failures_as_warnings(self, logger, event, context):
+        @api_handler
+        def handler():
+            return Response(status_code=409, body="{}")
+
+        handler(event, context)
+
+        assert logger.logs == [("warning", "Failure")]
+
+    def test_digests_only_sampled_bodies(
+        self, monkeypatch, logger, digests, event, context
+    ):
+        @api_handler
+        def handler():
+            return {"saved": True}
+
+        handler(event, context)
+        monkeypatch.setattr(logconfig, "SAMPLE_RATE", 0)
+        handler(event, context)
+
+        assert len(digests) == 1
+        assert logger.logs == [("info", "Success")]
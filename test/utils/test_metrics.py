@@ -0,0 +1,74 @@
+import json
+from io import StringIO
+
+import pytest
+import structlog
+
+from quicksilver.utils import metrics
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    output = StringIO()
+    monkeypatch.setattr(
+        metrics,
+        "_emitter",
+        structlog.wrap_logger(
+            structlog.PrintLogger(output),
+            wrapper_class=structlog.BoundLogger,
+            processors=[structlog.processors.JSONRenderer()],
+        ),
+    )
+
+    def _emitted():
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    return _emitted
+
+
+class TestSpan:
+    def test_emits_latency_in_embedded_metric_format(self, emitted):
+        metrics.bind(handler="some_handler", request_id="some-request")
+
+        with metrics.span("some.call"):
+            pass
+
+        (line,) = emitted()
+        (directive,) = line["_aws"]["CloudWatchMetrics"]
+        assert directive["Dimensions"] == [["handler", "span"]]
+        assert directive["Metrics"] == [
+            {"Name": "Latency", "Unit": "Milliseconds"}
+        ]
+        assert line["handler"] == "some_handler"
+        assert line["span"] == "some.call"
+        assert line["request_id"] == "some-request"
+        assert line["Latency"] >= 0
+
+    def test_emits_recorded_capacity_and_payload(self, emitted):
+        with metrics.span("some.call", payload_bytes=10) as span:
+            span.record(capacity=0.5)
+            span.record(capacity=1, payload_bytes=5)
+
+        (line,) = emitted()
+        assert line["ConsumedCapacity"] == 1.5
+        assert line["PayloadBytes"] == 15
+
+    def test_times_every_call_of_a_decorated_function(self, emitted):
+        @metrics.span("decorated")
+        def decorated(value):
+            return value
+
+        assert decorated(1) == 1
+        assert decorated(2) == 2
+
+        assert [line["span"] for line in emitted()] == [
+            "decorated",
+            "decorated",
+        ]
+
+    def test_emits_when_the_block_raises(self, emitted):
+        with pytest.raises(ValueError):
+            with metrics.span("failing"):
+                raise ValueError()
+
+        assert [line["span"] for line in emitted()] == ["failing"]
@@ -0,0 +1,217 @@
+import json
+
+import attr
+import pytest
+from botocore.exceptions import ClientError
+
+from quicksilver.utils import ratelimit
+from quicksilver.utils.lambdafn import api_handler
+from quicksilver.utils.ratelimit import RateLimiter, TokenBucket
+
+
+class FakeTable:
+    def __init__(self):
+        self.items = {}
+        self.calls = 0
+
+    def update_item(
+        self,
+        Key,
+        UpdateExpression,
+        ConditionExpression,
+        ExpressionAttributeValues,
+        **kwargs,
+    ):
+        self.calls += 1
+        values = ExpressionAttributeValues
+        item = self.items.get(Key["id"])
+        tat = item["tat"] if item else None
+
+        if ConditionExpression == ratelimit.START_CONDITION:
+            allowed = tat is None or tat <= values[":now"]
+            new_tat = values.get(":tat")
+        else:
+            allowed = (
+                tat is not None and values[":now"] < tat <= values[":limit"]
+            )
+            new_tat = tat + values[":interval"] if allowed else None
+
+        if not allowed:
+            raise ClientError(
+                {"Error": {"Code": "ConditionalCheckFailedException"}},
+                "UpdateItem",
+            )
+
+        self.items[Key["id"]] = {
+            "tat": new_tat,
+            "expires_at": values[":expires_at"],
+        }
+        return {}
+
+    def get_item(self, Key, ConsistentRead, **kwargs):
+        self.calls += 1
+        item = self.items.get(Key["id"])
+        return {"Item": item} if item else {}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeTable()
+    monkeypatch.setattr(ratelimit, "_table", lambda name: table)
+    return table
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "time", clock.time)
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock.monotonic)
+    return clock
+
+
+def limiter(**buckets):
+    return RateLimiter("test", table_name="RateLimitTable", **buckets)
+
+
+class TestRateLimiter:
+    def test_allows_a_burst_then_the_rate(self, table, clock):
+        limit = limiter(per_ip=TokenBucket(capacity=3, rate=1))
+
+        assert [limit.check("1.1.1.1") for _ in range(3)] == [None] * 3
+        assert limit.check("1.1.1.1") == pytest.approx(1)
+
+        clock.now += 1
+        assert limit.check("1.1.1.1") is None
+        assert limit.check("1.1.1.1") is not None
+
+    def test_keeps_a_bucket_per_ip(self, table, clock):
+        limit = limiter(per_ip=TokenBucket(capacity=1, rate=1))
+
+        assert limit.check("1.1.1.1") is None
+        assert limit.check("2.2.2.2") is None
+        assert limit.check("1.1.1.1") is not None
+
+    def test_limits_everyone_together(self, table, clock):
+        limit = limiter(
+            per_ip=TokenBucket(capacity=5, rate=1),
+            overall=TokenBucket(capacity=2, rate=1),
+        )
+
+        assert limit.check("1.1.1.1") is None
+        assert limit.check("2.2.2.2") is None
+        assert limit.check("3.3.3.3") is not None
+
+    def test_remembers_empty_buckets(self, table, clock):
+        limit = limiter(per_ip=TokenBucket(capacity=1, rate=0.5))
+        limit.check("1.1.1.1")
+        limit.check("1.1.1.1")
+        calls = table.calls
+
+        assert limit.check("1.1.1.1") == pytest.approx(2)
+        assert table.calls == calls
+
+    def test_takes_several_tokens(self, table, clock):
+        limit = limiter(per_ip=TokenBucket(capacity=5, rate=1))
+
+        assert limit.check("1.1.1.1", tokens=3) is None
+        assert limit.check("1.1.1.1", tokens=3) == pytest.approx(1)
+        assert limit.check("1.1.1.1", tokens=2) is None
+
+    def test_more_tokens_than_the_capacity_empty_a_full_bucket(
+        self, table, clock
+    ):
+        limit = limiter(per_ip=TokenBucket(capacity=2, rate=1))
+
+        assert limit.check("1.1.1.1", tokens=10) is None
+        assert limit.check("1.1.1.1") == pytest.approx(1)
+
+        clock.now += 1
+        assert limit.check("1.1.1.1", tokens=10) == pytest.approx(1)
+
+    def test_buckets_expire_once_full(self, table, clock):
+        limiter(per_ip=TokenBucket(capacity=10, rate=1)).check("1.1.1.1")
+
+        assert table.items["test#ip#1.1.1.1"]["expires_at"] == (
+            1000 + 10 + ratelimit.EXPIRY_MARGIN
+        )
+
+    def test_lets_requests_in_without_a_table(self, monkeypatch):
+        monkeypatch.delenv("RATE_LIMIT_TABLE_NAME", raising=False)
+        limit = RateLimiter("test", per_ip=TokenBucket(capacity=0, rate=1))
+
+        assert limit.check("1.1.1.1") is None
+
+    def test_lets_requests_in_when_dynamodb_fails(self, monkeypatch, clock):
+        class BrokenTable:
+            def update_item(self, **kwargs):
+                raise ClientError(
+                    {"Error": {"Code": "ProvisionedThroughputExceeded"}},
+                    "UpdateItem",
+                )
+
+        monkeypatch.setattr(ratelimit, "_table", lambda name: BrokenTable())
+
+        assert limiter(per_ip=TokenBucket(1, 1)).check("1.1.1.1") is None
+
+
+class TestApiHandler:
+    @attr.s
+    class FakeContext:
+        aws_request_id = attr.ib(default="Test")
+
+    def test_answers_429_with_retry_after(self, table, clock):
+        @api_handler(rate_limit=limiter(per_ip=TokenBucket(1, 0.1)))
+        def handler():
+            return {"saved": True}
+
+        event = {
+            "httpMethod": "POST",
+            "resource": "/prompt",
+            "requestContext": {"identity": {"sourceIp": "1.1.1.1"}},
+        }
+
+        assert handler(event, self.FakeContext())["statusCode"] == 200
+
+        response = handler(event, self.FakeContext())
+
+        assert response["statusCode"] == 429
+        assert response["headers"]["Retry-After"] == "10"
+        assert json.loads(response["body"]) == {"message": "Too many requests"}
+
+    def test_bulk_requests_take_a_token_per_item(self, table, clock):
+        @attr.s
+        class Item:
+            name = attr.ib()
+
+        @api_handler(
+            model=Item,
+            many=True,
+            rate_limit=limiter(per_ip=TokenBucket(3, 0.1)),
+        )
+        def handler(items):
+            return {"saved": len(items)}
+
+        def post(*names):
+            event = {
+                "httpMethod": "POST",
+                "resource": "/prompts",
+                "body": json.dumps([{"name": name} for name in names]),
+                "requestContext": {"identity": {"sourceIp": "1.1.1.1"}},
+            }
+            return handler(event, self.FakeContext())
+
+        assert post("a", "b")["statusCode"] == 200
+        assert post("c", "d")["statusCode"] == 429
+        assert post("c")["statusCode"] == 200
+        assert post("d")["statusCode"] == 429
@@ -0,0 +1,55 @@
+import json
+
+import attr
+
+from quicksilver.utils.serialization import dumps
+
+
+@attr.s
+class Inner:
+    some_value = attr.ib()
+
+
+@attr.s
+class Outer:
+    snake_case = attr.ib()
+    inner = attr.ib(default=None)
+    items = attr.ib(factory=list)
+
+
+class Plain:
+    def asdict(self):
+        return {"plain_field": 1}
+
+
+class TestDumps:
+    def test_matches_json_dumps_for_plain_values(self):
+        value = ["text", "ñandú", 1, 1.5, True, None, [], {}]
+
+        assert dumps(value) == json.dumps(value)
+
+    def test_camelizes_attrs_fields(self):
+        assert dumps(Outer(snake_case="a")) == (
+            '{"snakeCase": "a", "inner": null, "items": []}'
+        )
+
+    def test_writes_nested_models(self):
+        value = {
+            "next_cursor": None,
+            "prompts": [Outer(snake_case=1, inner=Inner(some_value=2))],
+        }
+
+        assert json.loads(dumps(value)) == {
+            "nextCursor": None,
+            "prompts": [
+                {"snakeCase": 1, "inner": {"someValue": 2}, "items": []}
+            ],
+        }
+
+    def test_uses_asdict_for_other_models(self):
+        assert dumps(Plain()) == '{"plainField": 1}'
+
+    def test_writes_empty_attrs_classes(self):
+        Empty = attr.make_class("Empty", [])
+
+        assert dumps(Empty()) == "{}"
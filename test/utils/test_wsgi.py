@@ -0,0 +1,97 @@
+import http.client
+import io
+import json
+import threading
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+
+from quicksilver.repository import Prompts
+from quicksilver.utils.wsgi import Application, Context, make_app_server
+
+
+@pytest.fixture
+def server(monkeypatch, memory_store):
+    monkeypatch.delenv("RATE_LIMIT_TABLE_NAME", raising=False)
+
+    server = make_app_server(port=0, workers=2, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, method, path, body=None):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+    try:
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+class TestApplication:
+    def test_builds_the_api_gateway_event(self):
+        environ = {
+            "REQUEST_METHOD": "POST",
+            "PATH_INFO": "/prompt/some-id",
+            "QUERY_STRING": "limit=5&fields=id&fields=prompt",
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": "2",
+            "HTTP_ACCEPT_ENCODING": "gzip",
+            "wsgi.input": io.BytesIO(b"{}"),
+        }
+        setup_testing_defaults(environ)
+        environ["REMOTE_ADDR"] = "1.1.1.1"
+
+        app = Application(routes=[("POST", "/prompt/{prompt_id}", "x")])
+        event, name = app.event(environ)
+
+        assert name == "x"
+        assert event["resource"] == "/prompt/{prompt_id}"
+        assert event["pathParameters"] == {"prompt_id": "some-id"}
+        assert event["queryStringParameters"] == {
+            "limit": "5",
+            "fields": "prompt",
+        }
+        assert event["multiValueQueryStringParameters"]["fields"] == [
+            "id",
+            "prompt",
+        ]
+        assert event["headers"]["Accept-Encoding"] == "gzip"
+        assert event["headers"]["Content-Type"] == "application/json"
+        assert event["body"] == "{}"
+        assert not event["isBase64Encoded"]
+        assert event["requestContext"]["identity"]["sourceIp"] == "1.1.1.1"
+
+    def test_context_counts_down(self):
+        assert 0 < Context().get_remaining_time_in_millis() <= 300000
+
+
+class TestServer:
+    def test_serves_the_handlers(self, server):
+        status, _, body = request(
+            server, "POST", "/prompt", json.dumps({"prompt": "jairtrejo"})
+        )
+        assert status == 200
+        prompt_id = json.loads(body)["id"]
+
+        # Only used prompts can be fetched
+        prompt = Prompts.from_id(prompt_id)
+        prompt.use()
+        Prompts.save(prompt)
+
+        status, headers, body = request(server, "GET", "/prompt/" + prompt_id)
+
+        assert status == 200
+        assert headers["Content-Type"] == "application/json"
+        assert json.loads(body)["prompt"] == "jairtrejo"
+
+    def test_answers_404_for_unknown_routes(self, server):
+        status, _, body = request(server, "DELETE", "/prompt")
+
+        assert status == 404
+        assert json.loads(body) == {"message": "Not Found"}